@@ -1,4 +1,8 @@
 __version__ = "0.2.3"
 
-from .fields import CachedModelChoiceField, CachedModelMultipleChoiceField  # noqa
+default_app_config = "cached_modelforms.apps.CachedModelformsConfig"
+
+from .fields import CachedDependentChoiceField, CachedModelChoiceField, CachedModelMultipleChoiceField  # noqa
 from .forms import ModelForm  # noqa
+from .snapshots import CompactSnapshot, MappedSnapshot, ObjectSnapshot  # noqa
+from .sources import CacheSource, ModelSource, ObjectSource  # noqa
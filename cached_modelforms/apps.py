@@ -0,0 +1,20 @@
+# -*- coding:utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.apps import AppConfig
+
+from .conf import get_setting
+
+
+class CachedModelformsConfig(AppConfig):
+    name = "cached_modelforms"
+    verbose_name = "Cached modelforms"
+
+    def ready(self):
+        warm = get_setting("WARM_ON_READY")
+        if warm:
+            from .registry import autodiscover, registry
+
+            autodiscover()
+            registry.warm_in_background(None if warm is True else warm)
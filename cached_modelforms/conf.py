@@ -0,0 +1,33 @@
+# -*- coding:utf-8 -*-
+"""
+Settings of the app, all of them are prefixed with ``CACHED_MODELFORMS_``
+in Django settings.
+"""
+
+from __future__ import unicode_literals
+
+from django.conf import settings
+
+DEFAULTS = {
+    # ``CACHES`` alias where sources keep their version counters, so an
+    # ``invalidate()`` in one process is seen by the others. ``None``
+    # keeps versions per process.
+    "VERSION_CACHE": None,
+    # How often (in seconds) a process checks the shared version of a
+    # source before trusting its local snapshot.
+    "VERSION_CHECK_INTERVAL": 1.0,
+    "KEY_PREFIX": "cached_modelforms",
+    # Size of the thread pool running loaders concurrently (see
+    # ``Meta.concurrent_loaders``).
+    "LOADER_THREADS": 4,
+    # The longest (in seconds) concurrent loaders are waited for, see
+    # ``get_snapshots()``. ``None`` waits as long as it takes.
+    "LOADER_MAX_WAIT": 30,
+    # Warm up registered sources in background when the app is ready:
+    # ``True`` for all of them or a list of names.
+    "WARM_ON_READY": False,
+}
+
+
+def get_setting(name):
+    return getattr(settings, "CACHED_MODELFORMS_%s" % name, DEFAULTS[name])
@@ -2,7 +2,10 @@
 
 from __future__ import unicode_literals
 
-import collections
+import copy
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 
 from django.core.exceptions import ValidationError
 from django.core.validators import EMPTY_VALUES
@@ -12,8 +15,33 @@ try:
 except ImportError:
     from django.utils.encoding import smart_text
 
+from django.utils.translation import gettext_lazy as _
+
 from django.forms import ChoiceField, Field, MultipleChoiceField
 
+from .references import ReferenceBatch
+from .snapshots import CopyOnWriteChoices, FetchedObjects, ObjectSnapshot, SubsetSnapshot
+from .sources import as_source
+from .widgets import SnapshotWidgetMixin
+
+
+_copying = threading.local()
+
+
+@contextmanager
+def keeping_snapshots(fields):
+    """
+    Copies of ``fields`` made inside the block keep the snapshot of the
+    field instead of getting the current one of its source, for forms that
+    are given the snapshots to use (e.g. already awaited by ``acreate()``).
+    """
+    kept = getattr(_copying, "kept", frozenset())
+    _copying.kept = kept | frozenset(id(field) for field in fields)
+    try:
+        yield
+    finally:
+        _copying.kept = kept
+
 
 class CachedModelChoiceField(ChoiceField):
     """
@@ -23,8 +51,14 @@ class CachedModelChoiceField(ChoiceField):
       * a list (or any iterable) or objects, e.g. ``[obj1, obj2, ...]``
       * a list (or any iterable) of tuples: ``[(obj1.pk, obj1), (obj2.pk, obj2), ...]``
       * a dict: ``{obj1.pk: obj1, obj2.pk: obj2, ...}``
+      * an ``ObjectSnapshot`` (or an ``ObjectSource`` returning it)
+      * a callable (or a coroutine function) returning any of the above,
+        it's wrapped into a source with ``as_source()``
 
     It doesn't accept ``to_field_name`` argument.
+
+    With ``lazy=True`` and a ``CompactSnapshot`` it returns
+    ``LazyReference`` instead of the object, see ``references.py``.
     """
 
     def __init__(
@@ -36,18 +70,17 @@ class CachedModelChoiceField(ChoiceField):
         label=None,
         initial=None,
         help_text=None,
+        lazy=False,
         *args,
         **kwargs
     ):
+        self.lazy = lazy
+        self.reference_batch = None
         if required and (initial is not None):
             self.empty_label = None
         else:
             self.empty_label = empty_label
-        if isinstance(objects, collections.Callable):
-            objects = objects()
-        self.objects = objects
         super(CachedModelChoiceField, self).__init__(
-            choices=self.choices,
             required=required,
             widget=widget,
             label=label,
@@ -56,38 +89,113 @@ class CachedModelChoiceField(ChoiceField):
             *args,
             **kwargs
         )
+        # Fields are copied for every form instance, the copies pick up
+        # the current snapshot of a source. Callables (coroutine functions
+        # too) are wrapped into sources.
+        self.source = as_source(objects) if callable(objects) else None
+        if self.source is not None:
+            objects = self.source.get_snapshot()
+        self.objects = objects
+
+    def __deepcopy__(self, memo):
+        # Fields are copied for every form instance. Only the widget and
+        # validators are copied here (``ChoiceField`` deep-copies choices
+        # too): the snapshot and its index are read-only and shared by all
+        # copies, and so are the choices until one of them changes them
+        # (see ``CopyOnWriteChoices``).
+        result = Field.__deepcopy__(self, memo)
+        result.reference_batch = None
+        if self.widget.choices is self._choices:
+            result._choices = result.widget.choices
+        else:
+            result._choices = copy.copy(self._choices)
+        if self.source is not None and id(self) not in getattr(_copying, "kept", ()):
+            snapshot = self.source.get_snapshot()
+            if isinstance(self.snapshot, SubsetSnapshot):
+                # Restricted fields keep their subset over a new snapshot.
+                if snapshot is not self.snapshot.root:
+                    result.objects = self.snapshot.over(snapshot)
+            elif snapshot is not self.snapshot:
+                result.objects = snapshot
+        return result
 
     @property
     def objects(self):
-        return self._objects.copy()
+        """
+        A copy of ``{smart_text(pk): obj}`` dict. Use ``objects_view`` when
+        you only need to read it. Compact snapshots don't keep the objects,
+        all of them are fetched here with one query.
+        """
+        return dict(self._objects.items())
+
+    @property
+    def objects_view(self):
+        """
+        Read-only ``{smart_text(pk): obj}`` mapping shared with the snapshot,
+        nothing is copied. With compact snapshots the objects are fetched
+        when they are read (see ``FetchedObjects``), ``snapshot.labels``
+        gives the labels.
+        """
+        return self._objects
 
     @objects.setter
     def objects(self, value):
-        if isinstance(value, dict):
-            self._objects = dict((smart_text(k), v) for k, v in list(value.items()))
-            self.choices = [(x, smart_text(self._objects[x])) for x in sorted(self._objects.keys())]
+        self.snapshot = ObjectSnapshot.build(value)
+        # ``objects`` of compact snapshots are their labels.
+        self._objects = self.snapshot.objects if self.snapshot.model is None else FetchedObjects(self.snapshot)
+        self._set_shared_choices(self.snapshot.get_choices(self.empty_label))
+        if isinstance(self.widget, SnapshotWidgetMixin):
+            self.widget.snapshot = self.snapshot
+
+    def restrict(self, keys=None, predicate=None):
+        """
+        Limits the field to the objects whose pks are in ``keys`` and/or
+        for whose ``smart_text(pk)`` ``predicate`` returns true, e.g. the
+        ones the current user may choose. Both validation and rendering
+        use a ``SubsetSnapshot`` view of the current snapshot then, the
+        snapshot is shared, not copied.
+        """
+        self.objects = self.snapshot.subset(keys, predicate)
+
+    def _set_shared_choices(self, choices):
+        # Shared choices are not copied (unlike by ``ChoiceField`` setter)
+        # unless the field changes them in place.
+        self._choices = self.widget.choices = CopyOnWriteChoices(choices)
+
+    def _set_choices(self, value):
+        # Choices assigned by hand are shared by copies of the field too.
+        if callable(value):
+            ChoiceField._set_choices(self, value)
         else:
-            objects = list(value)
-            if objects:
-                if isinstance(objects[0], (list, tuple)):
-                    self._objects = dict((smart_text(k), v) for k, v in objects)
-                    self.choices = [(smart_text(k), smart_text(v)) for k, v in objects]
-                else:
-                    self._objects = dict((smart_text(x.pk), x) for x in objects)
-                    self.choices = [(smart_text(x.pk), smart_text(x)) for x in objects]
-            else:
-                self._objects = {}
-                self.choices = ()
-        if self.empty_label is not None:
-            self.choices.insert(0, ("", self.empty_label))
+            self._set_shared_choices(list(value))
+
+    choices = property(ChoiceField._get_choices, _set_choices)
+
+    @property
+    def returns_references(self):
+        return self.lazy and self.snapshot.model is not None
+
+    def get_reference_batch(self):
+        """
+        Returns ``ReferenceBatch`` for the references of this field.
+        ``ModelForm`` shares one batch between all of its fields.
+        """
+        if self.reference_batch is None:
+            self.reference_batch = ReferenceBatch()
+        return self.reference_batch
 
     def to_python(self, value):
         if value in EMPTY_VALUES:
             return None
         value = smart_text(value)
-        if value not in self.objects:
+        try:
+            if self.returns_references:
+                if value not in self.snapshot:
+                    raise KeyError(value)
+                return self.get_reference_batch().reference(self.snapshot, value)
+            return self.snapshot.get_object(value)
+        except KeyError:
             raise ValidationError(self.error_messages["invalid_choice"] % {"value": value})
-        return self.objects[value]
 
     def validate(self, value):
         return Field.validate(self, value)
@@ -101,28 +209,127 @@ class CachedModelMultipleChoiceField(CachedModelChoiceField):
       * a list (or any iterable) or objects, e.g. ``[obj1, obj2, ...]``
       * a list (or any iterable) of tuples: ``[(obj1.pk, obj1), (obj2.pk, obj2), ...]``
       * a dict: ``{obj1.pk: obj1, obj2.pk: obj2, ...}``
+      * an ``ObjectSnapshot`` (or an ``ObjectSource`` returning it)
+      * a callable returning any of the above
 
     It doesn't accept ``to_field_name`` argument.
     """
 
     hidden_widget = MultipleChoiceField.hidden_widget
     widget = MultipleChoiceField.widget
-    default_error_messages = MultipleChoiceField.default_error_messages
+    default_error_messages = dict(
+        MultipleChoiceField.default_error_messages,
+        max_choices=_("Ensure at most %(limit_value)d items are selected (%(show_value)d selected)."),
+    )
 
     def __init__(
-        self, objects=(), required=True, widget=None, label=None, initial=None, help_text=None, *args, **kwargs
+        self,
+        objects=(),
+        required=True,
+        widget=None,
+        label=None,
+        initial=None,
+        help_text=None,
+        lazy=False,
+        max_choices=None,
+        *args,
+        **kwargs
     ):
+        self.max_choices = max_choices
         super(CachedModelMultipleChoiceField, self).__init__(
-            objects, None, required, widget, label, initial, help_text, *args, **kwargs
+            objects, None, required, widget, label, initial, help_text, lazy, *args, **kwargs
         )
 
+    def resolve_many(self, values):
+        """
+        Returns the objects for ``values`` in the order they were given,
+        skipping duplicates.
+
+        Selections over ``max_choices`` are rejected before any lookup, and
+        all invalid values are reported in one ``ValidationError``.
+        """
+        keys = list(OrderedDict.fromkeys(smart_text(x) for x in values))
+        if self.max_choices is not None and len(keys) > self.max_choices:
+            raise ValidationError(
+                self.error_messages["max_choices"],
+                code="max_choices",
+                params={"limit_value": self.max_choices, "show_value": len(keys)},
+            )
+        snapshot = self.snapshot
+        invalid = [key for key in keys if key not in snapshot]
+        if not invalid and self.returns_references:
+            batch = self.get_reference_batch()
+            return [batch.reference(snapshot, key) for key in keys]
+        if not invalid:
+            # Compact snapshots fetch the objects from DB here, in one query.
+            objects = snapshot.get_objects(keys)
+            invalid = [key for key in keys if key not in objects]
+        if invalid:
+            raise ValidationError(
+                [
+                    ValidationError(self.error_messages["invalid_choice"], code="invalid_choice", params={"value": key})
+                    for key in invalid
+                ]
+            )
+        return [objects[key] for key in keys]
+
     def to_python(self, value):
         if not value:
             return []
         elif not isinstance(value, (list, tuple)):
             raise ValidationError(self.error_messages["invalid_list"])
-        try:
-            result = [self.objects[x] for x in value]
-        except KeyError:
-            raise ValidationError(self.error_messages["invalid_choice"] % {"value": value})
-        return result
+        return self.resolve_many(value)
+
+
+class CachedDependentChoiceField(CachedModelChoiceField):
+    """
+    ``CachedModelChoiceField`` whose choices depend on the value of
+    another field of the form, ``parent`` (e.g. cities of the selected
+    country).
+
+    ``parent_attr`` is the attribute of the objects that refers to the
+    parent (``parent`` by default), the objects are indexed by it once per
+    snapshot, see ``ChildrenIndex``.
+
+    ``set_parent()`` narrows the field to the children of a parent value:
+    only they are rendered and valid. ``ModelForm`` and
+    ``DependentFieldsMixin`` call it with the value of ``parent`` field.
+    Until it is called, all objects are.
+    """
+
+    def __init__(self, objects=(), parent=None, parent_attr=None, **kwargs):
+        if parent is None:
+            raise TypeError("CachedDependentChoiceField requires ``parent`` argument.")
+        self.parent = parent
+        self.parent_attr = parent_attr or parent
+        self.parent_key = None
+        super(CachedDependentChoiceField, self).__init__(objects, **kwargs)
+
+    @property
+    def children_index(self):
+        return self.snapshot.get_children_index(self.parent_attr)
+
+    def _set_objects(self, value):
+        CachedModelChoiceField.objects.fset(self, value)
+        if self.parent_key is not None:
+            self.set_parent(self.parent_key)
+
+    objects = CachedModelChoiceField.objects.setter(_set_objects)
+
+    def set_parent(self, value):
+        """
+        Narrows the field to the children of ``value`` (a parent object or
+        its pk), an empty value leaves no choices.
+        """
+        if value in EMPTY_VALUES:
+            self.parent_key = ""
+        else:
+            self.parent_key = smart_text(getattr(value, "pk", value))
+        self._set_shared_choices(self.children_index.get_choices(self.parent_key, self.empty_label))
+
+    def to_python(self, value):
+        if value not in EMPTY_VALUES and self.parent_key is not None:
+            value = smart_text(value)
+            if self.children_index.get_parent(value) != self.parent_key:
+                raise ValidationError(self.error_messages["invalid_choice"] % {"value": value})
+        return super(CachedDependentChoiceField, self).to_python(value)
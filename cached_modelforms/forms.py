@@ -8,25 +8,43 @@ fields.py
 
 from __future__ import unicode_literals
 
-from collections import OrderedDict
+import asyncio
+from collections import OrderedDict, namedtuple
+from functools import reduce
+from operator import attrgetter, or_
+from asgiref.sync import sync_to_async
 from six import iteritems, with_metaclass
 
+import django
 from django.utils.text import capfirst
 
+try:
+    from django.utils.encoding import smart_unicode as smart_text
+except ImportError:
+    from django.utils.encoding import smart_text
+
 try:
     from django.forms.utils import ErrorList
 except ImportError:
     from django.forms.util import ErrorList
 
-from django.core.exceptions import FieldError
-from django.db.models import ForeignKey, ManyToManyField
+from django.core.exceptions import NON_FIELD_ERRORS, FieldError, ValidationError
+from django.core.validators import EMPTY_VALUES
+from django.db import connection, router, transaction
+from django.db.models import Field as DBField
+from django.db.models import ForeignKey, ManyToManyField, Q
+from django.db.models.signals import m2m_changed
 from django.forms.fields import Field
 from django.forms.forms import BaseForm
-from django.forms.models import (BaseModelForm, ModelFormOptions,
-                                 fields_for_model)
+from django.forms.models import (ALL_FIELDS, BaseModelForm,
+                                 ModelFormOptions, fields_for_model)
 from django.forms.widgets import media_property
 
-from .fields import CachedModelChoiceField, CachedModelMultipleChoiceField
+from .fields import (CachedDependentChoiceField, CachedModelChoiceField,
+                     CachedModelMultipleChoiceField, keeping_snapshots)
+from .references import LazyReference, ReferenceBatch
+from .snapshots import ObjectSnapshot
+from .sources import as_source, get_snapshots
 
 
 def get_declared_fields(bases, attrs, with_base_fields=True):
@@ -42,7 +60,8 @@ def get_declared_fields(bases, attrs, with_base_fields=True):
     fields = [
         (field_name, attrs.pop(field_name)) for field_name, obj in list(iteritems(attrs)) if isinstance(obj, Field)
     ]
-    fields.sort(key=lambda x: x[1].creation_counter)
+    # Newer Django has no ``creation_counter``, ``attrs`` keep the order.
+    fields.sort(key=lambda x: getattr(x[1], "creation_counter", 0))
 
     # If this class is subclassing another Form, add that Form's fields.
     # Note that we loop over the bases in *reverse*. This is necessary in
@@ -59,7 +78,7 @@ def get_declared_fields(bases, attrs, with_base_fields=True):
     return OrderedDict(fields)
 
 
-def make_formfield_callback(another_func, objects):
+def make_formfield_callback(another_func, objects, lazy=False):
     """
     Decorator that creates ``formfield_callback`` function (that makes
     ``ModelForm`` to use desired form field for certain model fields).
@@ -70,12 +89,19 @@ def make_formfield_callback(another_func, objects):
     """
 
     def formfield_callback(f, **kwargs):
-        if f.name in objects:
-            kwargs["objects"] = ()
-            kwargs.update({"required": not f.blank, "label": capfirst(f.verbose_name), "help_text": f.help_text})
+        if f.name in objects and isinstance(f, (ForeignKey, ManyToManyField)):
+            kwargs.update(
+                {
+                    "objects": (),
+                    "lazy": lazy,
+                    "required": not f.blank,
+                    "label": capfirst(f.verbose_name),
+                    "help_text": f.help_text,
+                }
+            )
             if isinstance(f, ForeignKey):
                 return CachedModelChoiceField(**kwargs)
-            elif isinstance(f, ManyToManyField):
+            else:
                 return CachedModelMultipleChoiceField(**kwargs)
         if another_func is not None:
             return another_func(f, **kwargs)
@@ -88,12 +114,20 @@ def make_formfield_callback(another_func, objects):
 class CachedModelFormOptions(ModelFormOptions):
     """
     ``ModelFormOptions`` version that also extracts ``objects`` param.
+
+    Every ``objects`` entry is wrapped into an ``ObjectSource`` once, in
+    ``sources``, so its snapshot is shared by all instances of the form.
     """
 
     def __init__(self, options=None):
         super(CachedModelFormOptions, self).__init__(options)
         self.objects = getattr(options, "objects", None)
+        self.concurrent_loaders = getattr(options, "concurrent_loaders", False)
+        self.loader_timeout = getattr(options, "loader_timeout", None)
+        self.lazy_objects = getattr(options, "lazy_objects", False)
+        self.sources = dict((name, as_source(objects)) for name, objects in list((self.objects or {}).items()))
         self.m2m_initials = getattr(options, "m2m_initials", None)
+        self.initial_data_plan = None
 
 
 class CachedModelFormMetaclass(type):
@@ -122,7 +156,7 @@ class CachedModelFormMetaclass(type):
             new_class.media = media_property(new_class)
         opts = new_class._meta = CachedModelFormOptions(getattr(new_class, "Meta", None))
         if opts.objects:
-            formfield_callback = make_formfield_callback(formfield_callback, opts.objects)
+            formfield_callback = make_formfield_callback(formfield_callback, opts.objects, opts.lazy_objects)
         if opts.model:
             # If a model is defined, extract form fields from it.
             fields = fields_for_model(opts.model, opts.fields, opts.exclude, opts.widgets, formfield_callback)
@@ -136,6 +170,7 @@ class CachedModelFormMetaclass(type):
             # Override default model fields with any custom declared ones
             # (plus, include all the other declared fields).
             fields.update(declared_fields)
+            opts.initial_data_plan = InitialDataPlan(opts.model, opts.fields, opts.exclude, opts.m2m_initials)
         else:
             fields = declared_fields
         new_class.declared_fields = declared_fields
@@ -143,6 +178,132 @@ class CachedModelFormMetaclass(type):
         return new_class
 
 
+# Attribute of model instances where ``load_m2m_initials`` keeps the
+# initials (``{field_name: [pk, ...]}``).
+M2M_INITIALS_ATTR = "_cached_modelforms_m2m_initials"
+
+
+def load_m2m_initials(instances, fields=None, exclude=None):
+    """
+    Loads m2m initials of ``instances`` (a list or a queryset of objects of
+    one model) with one query per ``ManyToManyField`` to its through table
+    and keeps them on the instances, ``model_to_dict`` uses them then
+    instead of querying DB for every instance.
+
+    ``fields`` and ``exclude`` limit the m2m fields to load, like in
+    ``model_to_dict``. Returns the instances as a list.
+    """
+    instances = list(instances)
+    if not instances:
+        return instances
+    if fields == ALL_FIELDS:
+        fields = None
+    opts = instances[0]._meta
+    for f in opts.many_to_many:
+        if not f.editable or (fields is not None and f.name not in fields) or (exclude and f.name in exclude):
+            continue
+        through = f.remote_field.through
+        source = through._meta.get_field(f.m2m_field_name())
+        target = through._meta.get_field(f.m2m_reverse_field_name())
+        # The through table keeps the values of FK target fields, these are
+        # usually pks.
+        source_name = source.target_field.attname
+        if target.target_field.primary_key:
+            target_name = target.attname
+        else:
+            target_name = "%s__pk" % target.name
+        keys = set(getattr(instance, source_name) for instance in instances if instance.pk is not None)
+        related = dict((key, []) for key in keys)
+        rows = through._default_manager.filter(**{"%s__in" % source.attname: keys}).values_list(
+            source.attname, target_name
+        )
+        for key, pk in rows:
+            related[key].append(pk)
+        for instance in instances:
+            if instance.pk is None:
+                continue
+            initials = instance.__dict__.setdefault(M2M_INITIALS_ATTR, {})
+            initials[f.name] = related[getattr(instance, source_name)]
+    return instances
+
+
+class InitialDataPlan(object):
+    """
+    Precompiled ``model_to_dict`` for ``model``: ``fields``, ``exclude``
+    and ``editable`` are checked once, calling the plan with an instance
+    only runs the getters of the fields left. ``ModelForm`` compiles one
+    per form class, in ``_meta.initial_data_plan``.
+    """
+
+    def __init__(self, model, fields=None, exclude=None, m2m_initials=None):
+        if fields == ALL_FIELDS:
+            fields = None
+        m2m_initials = m2m_initials or {}
+        self.model = model
+        opts = model._meta
+        names = [
+            f.name
+            for f in opts.fields + opts.many_to_many
+            if f.editable and (not fields or f.name in fields) and not (exclude and f.name in exclude)
+        ]
+        self.names = frozenset(names)
+        self.getters = tuple(
+            # Most fields just return the attribute, skip the method call.
+            (
+                f.name,
+                (
+                    attrgetter(f.attname)
+                    if type(f).value_from_object is DBField.value_from_object
+                    else f.value_from_object
+                ),
+            )
+            for f in opts.fields
+            if f.name in self.names
+        )
+        self.m2m_fields = tuple(
+            (f.name, f, m2m_initials.get(f.name)) for f in opts.many_to_many if f.name in self.names
+        )
+        # m2m fields that ``load_m2m_initials`` loads in bulk.
+        self.m2m_to_load = tuple(name for name, f, get_initials in self.m2m_fields if get_initials is None)
+
+    def __call__(self, instance):
+        data = {}
+        for name, getter in self.getters:
+            data[name] = getter(instance)
+        if self.m2m_fields:
+            loaded_initials = instance.__dict__.get(M2M_INITIALS_ATTR, {})
+            for name, f, get_initials in self.m2m_fields:
+                # If the object doesn't have a primry key yet, just use an
+                # empty list for its m2m fields. Calling f.value_from_object
+                # will raise an exception.
+                if instance.pk is None:
+                    data[name] = []
+                elif get_initials is not None:
+                    data[name] = get_initials(instance)
+                elif name in loaded_initials:
+                    data[name] = list(loaded_initials[name])
+                else:
+                    # MultipleChoiceWidget needs a list of pks, not object instances.
+                    data[name] = [obj.pk for obj in f.value_from_object(instance)]
+        return data
+
+    def load_m2m_initials(self, instances):
+        """
+        ``load_m2m_initials()`` for the m2m fields of the plan that have no
+        ``m2m_initials`` function.
+        """
+        if not self.m2m_to_load:
+            return list(instances)
+        return load_m2m_initials(instances, self.m2m_to_load)
+
+    def bulk(self, instances):
+        """
+        Returns the data of ``instances`` (a list or a queryset), loading
+        their m2m initials in bulk.
+        """
+        return [self(instance) for instance in self.load_m2m_initials(instances)]
+
+
 def model_to_dict(instance, fields=None, exclude=None, m2m_initials=None):
     """
     Returns a dict containing the data in ``instance`` suitable for passing as
@@ -155,37 +316,278 @@ def model_to_dict(instance, fields=None, exclude=None, m2m_initials=None):
     fields will be excluded from the returned dict, even if they are listed in
     the ``fields`` argument.
     """
-    # avoid a circular import
-    from django.db.models.fields.related import ManyToManyField
+    return InitialDataPlan(instance.__class__, fields, exclude, m2m_initials)(instance)
 
-    if m2m_initials is None:
-        m2m_initials = {}
-    opts = instance._meta
-    data = {}
-    for f in opts.fields + opts.many_to_many:
-        if not f.editable:
-            continue
-        if fields and f.name not in fields:
-            continue
-        if exclude and f.name not in exclude:
-            continue
-        if isinstance(f, ManyToManyField):
-            # If the object doesn't have a primry key yet, just use an empty
-            # list for its m2m fields. Calling f.value_from_object will raise
-            # an exception.
-            if instance.pk is None:
-                data[f.name] = []
-            elif f.name in m2m_initials:
-                data[f.name] = m2m_initials[f.name](instance)
+
+def models_to_dicts(instances, fields=None, exclude=None, m2m_initials=None):
+    """
+    ``model_to_dict`` for many instances of one model (a list or a
+    queryset), with m2m initials loaded in bulk.
+    """
+    instances = list(instances)
+    if not instances:
+        return []
+    return InitialDataPlan(instances[0].__class__, fields, exclude, m2m_initials).bulk(instances)
+
+
+def can_save_m2m_changes(f):
+    """
+    Whether ``save_m2m_changes`` can save m2m field ``f``: it needs an
+    auto-created through table with foreign keys to pks, and no
+    symmetrical relation (which keeps two rows per pair).
+    """
+    through = f.remote_field.through
+    return (
+        through._meta.auto_created
+        and not f.remote_field.symmetrical
+        and through._meta.get_field(f.m2m_reverse_field_name()).target_field.primary_key
+    )
+
+
+# ``bulk_create(ignore_conflicts=True)`` is there since Django 2.2.
+CAN_IGNORE_CONFLICTS = django.VERSION >= (2, 2)
+
+
+def save_m2m_changes(instance, f, initial, pks):
+    """
+    Saves m2m field ``f`` of ``instance`` that had ``initial`` pks in DB
+    and gets ``pks`` now: the added pks are inserted with one query, the
+    removed ones are deleted with another, nothing is done when nothing has
+    changed. Unlike ``set()`` it doesn't read the current relations first,
+    so ``initial`` has to be right; an added pk that is already in DB is
+    ignored though. ``m2m_changed`` is sent like with ``add()`` and
+    ``remove()``.
+    """
+    related_model = f.remote_field.model
+    to_python = related_model._meta.pk.to_python
+    initial = set(to_python(x) for x in initial)
+    pks = set(to_python(x) for x in pks)
+    added = pks - initial
+    removed = initial - pks
+    if not added and not removed:
+        return
+    through = f.remote_field.through
+    source = through._meta.get_field(f.m2m_field_name())
+    target = through._meta.get_field(f.m2m_reverse_field_name())
+    source_value = getattr(instance, source.target_field.attname)
+    db = router.db_for_write(through, instance=instance)
+    manager = through._default_manager.using(db)
+    signal_kwargs = dict(sender=through, instance=instance, reverse=False, model=related_model, using=db)
+    with transaction.atomic(using=db, savepoint=False):
+        if removed:
+            m2m_changed.send(action="pre_remove", pk_set=removed, **signal_kwargs)
+            manager.filter(**{source.attname: source_value, "%s__in" % target.attname: removed}).delete()
+            m2m_changed.send(action="post_remove", pk_set=removed, **signal_kwargs)
+        if added:
+            m2m_changed.send(action="pre_add", pk_set=added, **signal_kwargs)
+            rows = [through(**{source.attname: source_value, target.attname: pk}) for pk in added]
+            if CAN_IGNORE_CONFLICTS:
+                manager.bulk_create(rows, ignore_conflicts=True)
             else:
-                # MultipleChoiceWidget needs a list of pks, not object instances.
-                data[f.name] = [obj.pk for obj in f.value_from_object(instance)]
+                # Pks that are already in DB are skipped by hand.
+                existing = set(
+                    manager.filter(**{source.attname: source_value, "%s__in" % target.attname: added}).values_list(
+                        target.attname, flat=True
+                    )
+                )
+                manager.bulk_create([row for row in rows if getattr(row, target.attname) not in existing])
+            m2m_changed.send(action="post_add", pk_set=added, **signal_kwargs)
+
+
+# Number of rows checked by one query in ``validate_unique_many``.
+UNIQUE_CHECK_BATCH_SIZE = 500
+
+
+class RowResult(namedtuple("RowResult", ["instance", "cleaned_data", "errors"])):
+    """
+    Result of ``validate_many()`` for one row: the instance with the row
+    applied (not saved), ``cleaned_data`` and ``errors`` of the form.
+    """
+
+    __slots__ = ()
+
+    def is_valid(self):
+        return not self.errors
+
+
+def _get_unique_values(instance, unique_check):
+    # Values of ``unique_check`` fields as ``Model._perform_unique_checks``
+    # looks them up, or ``None`` if it skips the check.
+    values = []
+    for field_name in unique_check:
+        f = instance._meta.get_field(field_name)
+        value = getattr(instance, f.attname)
+        if value is None or (value == "" and connection.features.interprets_empty_strings_as_nulls):
+            return None
+        if f.primary_key and not instance._state.adding:
+            return None
+        values.append(value)
+    return tuple(values)
+
+
+def _find_existing(model_class, unique_check, values):
+    # Returns ``{values: set of pks}`` of the objects that have ``values``
+    # of ``unique_check`` fields.
+    names = list(unique_check)
+    values = list(set(values))
+    manager = model_class._default_manager
+    existing = {}
+    for start in range(0, len(values), UNIQUE_CHECK_BATCH_SIZE):
+        batch = values[start : start + UNIQUE_CHECK_BATCH_SIZE]
+        if len(names) == 1:
+            query = Q(**{"%s__in" % names[0]: [x[0] for x in batch]})
         else:
-            data[f.name] = f.value_from_object(instance)
-    return data
+            query = reduce(or_, [Q(**dict(zip(names, x))) for x in batch])
+        for row in manager.filter(query).values_list(*(names + ["pk"])):
+            existing.setdefault(tuple(row[:-1]), set()).add(row[-1])
+    return existing
+
+
+def validate_foreign_keys_many(forms):
+    """
+    Checks that the objects of cached foreign keys of many model forms
+    (deferred by ``validate_many()``) exist, with one query per foreign
+    key for ``UNIQUE_CHECK_BATCH_SIZE`` values, as ``ForeignKey.validate``
+    does with one query per form. The rest of the validation of the model
+    fields is done too.
+    """
+    checks = OrderedDict()
+    for form in forms:
+        for f in getattr(form, "_deferred_foreign_keys", ()):
+            value = getattr(form.instance, f.attname)
+            if f.blank and value in f.empty_values:
+                continue
+            try:
+                # ``Field.validate`` checks null, blank and choices, without
+                # the query of ``ForeignKey.validate``.
+                DBField.validate(f, value, form.instance)
+                f.run_validators(value)
+            except ValidationError as e:
+                form._update_errors(ValidationError({f.name: e.error_list}))
+                continue
+            checks.setdefault(f, []).append((form, value))
+    for f, items in list(checks.items()):
+        related_model = f.remote_field.model
+        field_name = f.remote_field.field_name
+        values = list(set(value for form, value in items))
+        existing = set()
+        for start in range(0, len(values), UNIQUE_CHECK_BATCH_SIZE):
+            queryset = related_model._base_manager.using(router.db_for_read(related_model)).filter(
+                **{"%s__in" % field_name: values[start : start + UNIQUE_CHECK_BATCH_SIZE]}
+            )
+            queryset = queryset.complex_filter(f.get_limit_choices_to())
+            existing.update(queryset.values_list(field_name, flat=True))
+        for form, value in items:
+            if value not in existing:
+                error = ValidationError(
+                    f.error_messages["invalid"],
+                    code="invalid",
+                    params={
+                        "model": related_model._meta.verbose_name,
+                        "pk": value,
+                        "field": field_name,
+                        "value": value,
+                    },
+                )
+                form._update_errors(ValidationError({f.name: [error]}))
+
+
+def validate_unique_many(forms):
+    """
+    Runs the deferred ``validate_unique()`` of many model forms together:
+    one query per unique check for ``UNIQUE_CHECK_BATCH_SIZE`` forms
+    instead of one per check and form. Forms that repeat the unique values
+    of a previous form get the error too, as saving them all would fail.
+    """
+    checks = OrderedDict()
+    for form in forms:
+        exclude = getattr(form, "_unique_exclude", None)
+        if exclude is None:
+            # ``validate_unique()`` wasn't called, e.g. ``clean()`` didn't
+            # call super.
+            continue
+        instance = form.instance
+        unique_checks, date_checks = instance._get_unique_checks(exclude=exclude)
+        if date_checks:
+            errors = instance._perform_date_checks(date_checks)
+            if errors:
+                form._update_errors(ValidationError(errors))
+        for model_class, unique_check in unique_checks:
+            values = _get_unique_values(instance, unique_check)
+            if values is not None:
+                checks.setdefault((model_class, unique_check), []).append((form, values))
+    for (model_class, unique_check), items in list(checks.items()):
+        existing = _find_existing(model_class, unique_check, [values for form, values in items])
+        seen = set()
+        key = unique_check[0] if len(unique_check) == 1 else NON_FIELD_ERRORS
+        for form, values in items:
+            instance = form.instance
+            pks = existing.get(values, set())
+            if not instance._state.adding:
+                pks = pks - set([instance._get_pk_val(model_class._meta)])
+            if pks or values in seen:
+                error = instance.unique_error_message(model_class, unique_check)
+                form._update_errors(ValidationError({key: [error]}))
+            seen.add(values)
+
+
+def bind_dependent_fields(form):
+    """
+    Narrows every ``CachedDependentChoiceField`` of ``form`` to the
+    children of the value of its parent field: the data of a bound form,
+    the initial value otherwise.
+    """
+    for field in list(form.fields.values()):
+        if isinstance(field, CachedDependentChoiceField):
+            field.set_parent(form[field.parent].value())
+
+
+class DependentFieldsMixin(object):
+    """
+    ``Form`` mixin that binds ``CachedDependentChoiceField`` fields to
+    their parent fields (``ModelForm`` does it by itself)::
+
+        class AddressForm(DependentFieldsMixin, forms.Form):
+            country = CachedModelChoiceField(objects=countries)
+            city = CachedDependentChoiceField(objects=cities, parent='country')
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(DependentFieldsMixin, self).__init__(*args, **kwargs)
+        bind_dependent_fields(self)
 
 
 class CachedBaseModelForm(BaseModelForm):
+    """
+    ``BaseModelForm`` that fills cached fields from ``Meta.objects``.
+
+    ``objects`` argument (``{field_name: snapshot_or_objects}``) overrides
+    ``Meta.objects`` for this instance, e.g. with snapshots that are
+    already loaded.
+
+    With ``Meta.lazy_objects = True`` cached fields with compact snapshots
+    return ``LazyReference`` instead of objects, and saving the form
+    doesn't fetch them.
+
+    With ``Meta.concurrent_loaders = True`` the sources of ``Meta.objects``
+    are loaded concurrently in a thread pool. ``Meta.loader_timeout``
+    (seconds) limits the wait, sources that don't make it in time use
+    their last snapshot.
+
+    Cached m2m fields are saved with ``save_m2m_changes``: the initial
+    pks of the instance are compared to the cleaned ones and only the
+    difference is written.
+
+    ``CachedDependentChoiceField`` fields are narrowed to the children of
+    the value of their parent fields, see ``bind_dependent_fields``.
+
+    ``validate_many()`` validates many rows of data at once.
+    """
+
+    # Set by ``validate_many()``: ``validate_unique()`` only keeps the
+    # exclusions, ``validate_unique_many`` checks all forms together.
+    _defer_validate_unique = False
+
     def __init__(
         self,
         data=None,
@@ -197,6 +599,9 @@ class CachedBaseModelForm(BaseModelForm):
         label_suffix=":",
         empty_permitted=False,
         instance=None,
+        use_required_attribute=None,
+        renderer=None,
+        objects=None,
     ):
         opts = self._meta
         if instance is None:
@@ -205,9 +610,16 @@ class CachedBaseModelForm(BaseModelForm):
             # if we didn't get an instance, instantiate a new one
             self.instance = opts.model()
             object_data = {}
+            # A new instance has no m2m relations yet.
+            self.m2m_initial_pks = dict((name, []) for name, f, get_initials in opts.initial_data_plan.m2m_fields)
         else:
             self.instance = instance
-            object_data = model_to_dict(instance, opts.fields, opts.exclude, opts.m2m_initials)
+            plan = opts.initial_data_plan
+            if instance.__class__ is not plan.model:
+                # Instances of other models (e.g. subclasses) have other fields.
+                plan = InitialDataPlan(instance.__class__, opts.fields, opts.exclude, opts.m2m_initials)
+            object_data = plan(instance)
+            self.m2m_initial_pks = dict((name, object_data[name]) for name, f, get_initials in plan.m2m_fields)
         # if initial was provided, it should override the values from instance
         if initial is not None:
             object_data.update(initial)
@@ -215,12 +627,268 @@ class CachedBaseModelForm(BaseModelForm):
         # It is False by default so overriding self.clean() and failing to call
         # super will stop validate_unique from being called.
         self._validate_unique = False
-        BaseForm.__init__(self, data, files, auto_id, prefix, object_data, error_class, label_suffix, empty_permitted)
-        if opts.objects:
-            for field_name, get_objects in list(opts.objects.items()):
-                field = self.fields.get(field_name)
-                if isinstance(field, (CachedModelChoiceField, CachedModelMultipleChoiceField)):
-                    field.objects = get_objects()
+        objects = dict(objects or {})
+        # Fields get the given snapshots below, their sources are not asked
+        # again while the fields are copied.
+        with keeping_snapshots(field for name, field in list(self.base_fields.items()) if name in objects):
+            BaseForm.__init__(
+                self,
+                data,
+                files,
+                auto_id,
+                prefix,
+                object_data,
+                error_class,
+                label_suffix,
+                empty_permitted,
+                use_required_attribute=use_required_attribute,
+                renderer=renderer,
+            )
+        sources = dict(
+            (field_name, source)
+            for field_name, source in list(opts.sources.items())
+            if field_name not in objects
+            and isinstance(self.fields.get(field_name), (CachedModelChoiceField, CachedModelMultipleChoiceField))
+        )
+        objects.update(self._get_snapshots(sources))
+        for field_name, value in list(objects.items()):
+            field = self.fields.get(field_name)
+            if isinstance(field, (CachedModelChoiceField, CachedModelMultipleChoiceField)):
+                field.objects = value
+        # All lazy references of the form are resolved together.
+        self.reference_batch = ReferenceBatch()
+        for field in list(self.fields.values()):
+            if isinstance(field, CachedModelChoiceField):
+                field.reference_batch = self.reference_batch
+        bind_dependent_fields(self)
+
+    def _get_validation_exclusions(self):
+        exclude = list(super(CachedBaseModelForm, self)._get_validation_exclusions())
+        if self._defer_validate_unique:
+            # Foreign keys of cached fields are checked for existence by
+            # ``validate_foreign_keys_many``, for all forms together.
+            self._deferred_foreign_keys = []
+            for f in self.instance._meta.fields:
+                if (
+                    isinstance(f, ForeignKey)
+                    and f.name not in exclude
+                    and isinstance(self.fields.get(f.name), CachedModelChoiceField)
+                ):
+                    self._deferred_foreign_keys.append(f)
+                    exclude.append(f.name)
+        return exclude
+
+    def validate_unique(self):
+        if self._defer_validate_unique:
+            exclude = self._get_validation_exclusions()
+            # Deferred foreign keys are validated, so they are not excluded
+            # from unique checks.
+            deferred = set(f.name for f in self._deferred_foreign_keys)
+            self._unique_exclude = [name for name in exclude if name not in deferred]
+            return
+        super(CachedBaseModelForm, self).validate_unique()
+
+    def _pop_references(self):
+        """
+        Removes ``LazyReference`` values from ``cleaned_data`` and returns
+        them.
+        """
+        references = {}
+        for name, value in list(self.cleaned_data.items()):
+            if isinstance(value, LazyReference) or (
+                isinstance(value, list) and value and isinstance(value[0], LazyReference)
+            ):
+                references[name] = self.cleaned_data.pop(name)
+        return references
+
+    def _post_clean(self):
+        # Foreign keys given as lazy references are set by their ``attname``
+        # so the related objects are not fetched just to be saved.
+        opts = self._meta
+        references = self._pop_references()
+        for name, value in list(references.items()):
+            if isinstance(value, LazyReference):
+                if (opts.fields is not None and name not in opts.fields) or (opts.exclude and name in opts.exclude):
+                    continue
+                setattr(self.instance, self.instance._meta.get_field(name).attname, value.pk)
+        try:
+            super(CachedBaseModelForm, self)._post_clean()
+        finally:
+            self.cleaned_data.update(references)
+
+    def _save_m2m(self):
+        # Many-to-many relations accept plain pks.
+        references = self._pop_references()
+        for name, value in list(references.items()):
+            self.cleaned_data[name] = [x.pk for x in value] if isinstance(value, list) else value
+        # Cached fields with known initial pks save only the changes, the
+        # rest is left to ``BaseModelForm``.
+        saved = {}
+        # Initials kept on the instance by ``load_m2m_initials`` must follow
+        # the saved relations, the next form of the instance trusts them.
+        loaded_initials = self.instance.__dict__.get(M2M_INITIALS_ATTR, {})
+        for f in self.instance._meta.many_to_many:
+            name = f.name
+            if (
+                name in self.cleaned_data
+                and name in self.m2m_initial_pks
+                and isinstance(self.fields.get(name), CachedModelMultipleChoiceField)
+                and can_save_m2m_changes(f)
+            ):
+                saved[name] = self.cleaned_data.pop(name)
+                pks = [getattr(x, "pk", x) for x in saved[name]]
+                save_m2m_changes(self.instance, f, self.m2m_initial_pks[name], pks)
+                self.m2m_initial_pks[name] = pks
+                if name in loaded_initials:
+                    loaded_initials[name] = pks
+            elif name in self.cleaned_data:
+                # Saved by ``BaseModelForm`` below, read from DB next time.
+                loaded_initials.pop(name, None)
+        try:
+            super(CachedBaseModelForm, self)._save_m2m()
+        finally:
+            self.cleaned_data.update(saved)
+            self.cleaned_data.update(references)
+
+    @classmethod
+    def load_m2m_initials(cls, instances):
+        """
+        ``load_m2m_initials()`` for the m2m fields of the form that have no
+        ``Meta.m2m_initials``. Call it before building forms for many
+        instances::
+
+            instances = ProductForm.load_m2m_initials(Product.objects.all())
+            forms = [ProductForm(instance=instance) for instance in instances]
+        """
+        return cls._meta.initial_data_plan.load_m2m_initials(instances)
+
+    @classmethod
+    def get_sources(cls):
+        """
+        Returns ``{field_name: source}`` for the cached fields of the form:
+        ``Meta.objects`` sources and the sources of declared fields.
+        """
+        sources = dict(
+            (field_name, source)
+            for field_name, source in list(cls._meta.sources.items())
+            if isinstance(cls.base_fields.get(field_name), (CachedModelChoiceField, CachedModelMultipleChoiceField))
+        )
+        for field_name, field in list(cls.base_fields.items()):
+            if getattr(field, "source", None) is not None:
+                sources.setdefault(field_name, field.source)
+        return sources
+
+    @classmethod
+    def _get_snapshots(cls, sources):
+        opts = cls._meta
+        if opts.concurrent_loaders and len(sources) > 1:
+            return get_snapshots(sources, opts.loader_timeout)
+        return dict((field_name, source.get_snapshot()) for field_name, source in list(sources.items()))
+
+    @classmethod
+    def get_snapshots(cls):
+        """
+        Returns ``{field_name: snapshot}`` for all cached fields of the
+        form. Pass it as ``objects`` to build several forms with the same
+        snapshots, loaders are not called for each of them then.
+        """
+        return cls._get_snapshots(cls.get_sources())
+
+    @classmethod
+    def preload_objects(cls, objects, rows, prefix=None):
+        """
+        Returns ``objects`` (``{field_name: snapshot_or_objects}``) built
+        into snapshots, with the objects selected in ``rows`` (data dicts)
+        fetched ahead, see ``ObjectSnapshot.preload()``.
+        """
+        snapshots = {}
+        # Fields with the same snapshot share one preload.
+        keys = {}
+        for field_name, value in list(objects.items()):
+            snapshot = snapshots[field_name] = ObjectSnapshot.build(value)
+            field = cls.base_fields.get(field_name)
+            if isinstance(field, CachedModelChoiceField) and not field.lazy and snapshot.model is not None:
+                html_name = field_name if prefix is None else "%s-%s" % (prefix, field_name)
+                snapshot_keys = keys.setdefault(id(snapshot), set())
+                for row in rows:
+                    value = field.widget.value_from_datadict(row, {}, html_name)
+                    if isinstance(value, (list, tuple)):
+                        snapshot_keys.update(smart_text(x) for x in value if x not in EMPTY_VALUES)
+                    elif value not in EMPTY_VALUES:
+                        snapshot_keys.add(smart_text(value))
+        preloaded = {}
+        for field_name, snapshot in list(snapshots.items()):
+            if id(snapshot) in keys:
+                if id(snapshot) not in preloaded:
+                    preloaded[id(snapshot)] = snapshot.preload(keys[id(snapshot)])
+                snapshots[field_name] = preloaded[id(snapshot)]
+        return snapshots
+
+    @classmethod
+    def validate_many(cls, rows, instances=None, **kwargs):
+        """
+        Validates many rows of data (e.g. of a CSV import) with the form
+        and returns ``RowResult`` for every row::
+
+            results = ProductForm.validate_many(csv.DictReader(f))
+            Product.objects.bulk_create([x.instance for x in results if x.is_valid()])
+
+        The snapshots of the cached fields are loaded once and shared by
+        all rows, the objects selected in all rows are fetched together
+        (one query per compact snapshot), and unique checks of all rows are
+        done together, see ``validate_unique_many``, as well as the checks
+        that the objects of cached foreign keys still exist, see
+        ``validate_foreign_keys_many``.
+
+        ``instances`` are the instances to apply the rows to, one per row
+        (``None`` for new ones), their m2m initials are loaded together;
+        ``ValueError`` is raised if there are not as many as rows.
+        ``kwargs`` are passed to every form.
+        """
+        rows = list(rows)
+        if instances is None:
+            instances = [None] * len(rows)
+        else:
+            instances = list(instances)
+            if len(instances) != len(rows):
+                raise ValueError("validate_many() got %d instances for %d rows." % (len(instances), len(rows)))
+            existing = [x for x in instances if x is not None]
+            if existing:
+                cls.load_m2m_initials(existing)
+        objects = cls.get_snapshots()
+        objects.update(kwargs.pop("objects", None) or {})
+        objects = cls.preload_objects(objects, rows, kwargs.get("prefix"))
+        forms = []
+        for row, instance in zip(rows, instances):
+            form = cls(data=row, instance=instance, objects=objects, **kwargs)
+            form._defer_validate_unique = True
+            form.full_clean()
+            forms.append(form)
+        validate_foreign_keys_many(forms)
+        validate_unique_many(forms)
+        return [RowResult(form.instance, form.cleaned_data, form.errors) for form in forms]
+
+    @classmethod
+    async def acreate(cls, *args, **kwargs):
+        """
+        Creates the form in async code: loaders of ``Meta.objects`` and of
+        declared cached fields are awaited together first, so the form
+        itself is built without blocking on them::
+
+            form = await ProductForm.acreate(request.POST)
+
+        M2m initials of ``instance`` (those that ``Meta.m2m_initials``
+        doesn't provide) are loaded in a thread, see ``load_m2m_initials()``.
+        """
+        instance = kwargs.get("instance")
+        if instance is not None:
+            await sync_to_async(cls.load_m2m_initials)([instance])
+        sources = cls.get_sources()
+        names = list(sources)
+        snapshots = await asyncio.gather(*[sources[name].aget_snapshot() for name in names])
+        objects = dict(zip(names, snapshots))
+        objects.update(kwargs.pop("objects", None) or {})
+        return cls(*args, objects=objects, **kwargs)
 
 
 class ModelForm(with_metaclass(CachedModelFormMetaclass, CachedBaseModelForm)):
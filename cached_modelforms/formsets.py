@@ -0,0 +1,69 @@
+# -*- coding:utf-8 -*-
+"""
+Model formsets of ``cached_modelforms.ModelForm`` that load the snapshots
+of the cached fields and m2m initials once per formset, not once per form.
+"""
+
+from __future__ import unicode_literals
+
+from django.forms import models
+from django.forms.models import BaseInlineFormSet, BaseModelFormSet
+from django.utils.functional import cached_property
+
+from .forms import ModelForm
+
+
+class CachedFormSetMixin(object):
+    """
+    Gets the snapshots of the form's cached fields on first use and passes
+    them as ``objects`` to every form of the formset, ``empty_form``
+    included. ``objects`` given in ``form_kwargs`` take precedence.
+
+    M2m initials of the queryset are loaded with one query per m2m field
+    (see ``load_m2m_initials``) when the queryset is evaluated.
+    """
+
+    @cached_property
+    def snapshots(self):
+        return self.form.get_snapshots()
+
+    def get_queryset(self):
+        if not hasattr(self, "_queryset"):
+            queryset = super(CachedFormSetMixin, self).get_queryset()
+            # The instances are kept in the result cache of the queryset,
+            # forms get them from there.
+            self.form.load_m2m_initials(queryset)
+        return self._queryset
+
+    def get_form_kwargs(self, index):
+        kwargs = super(CachedFormSetMixin, self).get_form_kwargs(index)
+        objects = dict(self.snapshots)
+        objects.update(kwargs.get("objects") or {})
+        kwargs["objects"] = objects
+        return kwargs
+
+
+class CachedBaseModelFormSet(CachedFormSetMixin, BaseModelFormSet):
+    pass
+
+
+class CachedBaseInlineFormSet(CachedFormSetMixin, BaseInlineFormSet):
+    pass
+
+
+def modelformset_factory(model, form=ModelForm, formset=CachedBaseModelFormSet, **kwargs):
+    """
+    ``django.forms.models.modelformset_factory`` with
+    ``cached_modelforms.ModelForm`` and ``CachedBaseModelFormSet`` by
+    default.
+    """
+    return models.modelformset_factory(model, form=form, formset=formset, **kwargs)
+
+
+def inlineformset_factory(parent_model, model, form=ModelForm, formset=CachedBaseInlineFormSet, **kwargs):
+    """
+    ``django.forms.models.inlineformset_factory`` with
+    ``cached_modelforms.ModelForm`` and ``CachedBaseInlineFormSet`` by
+    default.
+    """
+    return models.inlineformset_factory(parent_model, model, form=form, formset=formset, **kwargs)
@@ -0,0 +1,43 @@
+# -*- coding:utf-8 -*-
+
+from __future__ import unicode_literals
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cached_modelforms.registry import autodiscover, registry
+
+
+class Command(BaseCommand):
+    help = (
+        "Loads the snapshots of registered sources concurrently. Useful for the "
+        "sources that keep them outside of the process (CacheSource, ModelSource "
+        "with path)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("names", nargs="*", help="Names of the sources to warm up, all by default.")
+        parser.add_argument("--list", action="store_true", help="List registered sources and exit.")
+
+    def handle(self, *args, **options):
+        autodiscover()
+        if options["list"]:
+            for name in registry:
+                self.stdout.write(name)
+            return
+        names = options["names"] or None
+        unknown = [name for name in names or [] if name not in registry]
+        if unknown:
+            raise CommandError("Unknown source(s): %s" % ", ".join(unknown))
+        started = time.time()
+        failed = []
+        for name, snapshot, error in registry.warm(names):
+            if error is not None:
+                failed.append(name)
+                self.stderr.write("%s: %s" % (name, error))
+            else:
+                self.stdout.write("%s: %d objects" % (name, len(snapshot)))
+        self.stdout.write("Done in %.2fs." % (time.time() - started))
+        if failed:
+            raise CommandError("Failed to warm up: %s" % ", ".join(failed))
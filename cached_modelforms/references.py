@@ -0,0 +1,89 @@
+# -*- coding:utf-8 -*-
+"""
+Lazy references to objects of a ``CompactSnapshot``, returned by cached
+fields with ``lazy=True`` instead of the objects themselves.
+"""
+
+from __future__ import unicode_literals
+
+_MISSING = object()
+
+
+class LazyReference(object):
+    """
+    Stands for the object with ``pk`` until any other attribute of it is
+    used. Then all pending references of its ``ReferenceBatch`` are
+    resolved together, with one query per snapshot.
+
+    Compares equal to the model instance with the same pk. If the object
+    has been deleted, using it raises ``DoesNotExist``.
+    """
+
+    __slots__ = ("pk", "model", "_key", "_snapshot", "_batch", "_obj")
+
+    def __init__(self, snapshot, key, batch):
+        self.model = snapshot.model
+        self.pk = self.model._meta.pk.to_python(key)
+        self._key = key
+        self._snapshot = snapshot
+        self._batch = batch
+        self._obj = None
+
+    def _resolve(self):
+        if self._obj is None:
+            self._batch.resolve()
+        if self._obj is _MISSING:
+            raise self.model.DoesNotExist("%s matching pk=%s does not exist." % (self.model._meta.object_name, self.pk))
+        return self._obj
+
+    @property
+    def is_resolved(self):
+        return self._obj is not None
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __eq__(self, other):
+        if isinstance(other, LazyReference):
+            return self.model is other.model and self.pk == other.pk
+        if isinstance(other, self.model._meta.concrete_model):
+            return self.pk == other.pk
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __hash__(self):
+        return hash(self.pk)
+
+    def __str__(self):
+        return "%s" % self._resolve()
+
+    def __repr__(self):
+        return "<LazyReference: %s pk=%s>" % (self.model._meta.object_name, self.pk)
+
+
+class ReferenceBatch(object):
+    """
+    Collects the references created by one form, so they are resolved
+    together.
+    """
+
+    def __init__(self):
+        self._pending = []
+
+    def reference(self, snapshot, key):
+        ref = LazyReference(snapshot, key, self)
+        self._pending.append(ref)
+        return ref
+
+    def resolve(self):
+        pending, self._pending = self._pending, []
+        groups = {}
+        for ref in pending:
+            groups.setdefault(id(ref._snapshot), []).append(ref)
+        for refs in list(groups.values()):
+            objects = refs[0]._snapshot.get_objects(set(ref._key for ref in refs))
+            for ref in refs:
+                ref._obj = objects.get(ref._key, _MISSING)
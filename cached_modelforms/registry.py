@@ -0,0 +1,139 @@
+# -*- coding:utf-8 -*-
+"""
+Registry of named object sources, so they can be loaded ahead of time:
+by ``warm_cached_modelforms`` management command or when the app is
+ready (``CACHED_MODELFORMS_WARM_ON_READY``).
+"""
+
+from __future__ import unicode_literals
+
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import as_completed
+
+from django.utils.module_loading import autodiscover_modules
+
+from .sources import ObjectSource, _get_snapshot_in_thread, get_executor
+
+logger = logging.getLogger(__name__)
+
+
+class AlreadyRegistered(Exception):
+    pass
+
+
+class SourceRegistry(object):
+    """
+    ``{name: source}`` of the sources to warm up.
+    """
+
+    def __init__(self):
+        self._sources = OrderedDict()
+
+    def register(self, source=None, name=None):
+        """
+        Registers ``source`` under ``name`` (its own ``name`` by default)
+        and returns it. A callable is wrapped into an ``ObjectSource``
+        first, so it works as a decorator too::
+
+            categories = registry.register(ModelSource(Category))
+
+            @registry.register(name='tags')
+            def tags():
+                return list(Tag.objects.all())
+
+        Raises ``AlreadyRegistered`` if another source is registered under
+        ``name`` already (e.g. two ``ModelSource`` of one model, both named
+        after it), registering the same source again does nothing.
+        """
+        if source is None:
+            return lambda source: self.register(source, name)
+        if not isinstance(source, ObjectSource):
+            source = ObjectSource(source, name=name)
+        name = name or source.name
+        if name is None:
+            raise ValueError("%r has no name, give it one to register it." % source)
+        registered = self._sources.get(name)
+        if registered is not None and registered is not source:
+            raise AlreadyRegistered(
+                "%r is already registered as %s, give %r another name." % (registered, name, source)
+            )
+        self._sources[name] = source
+        return source
+
+    def register_form(self, form_class):
+        """
+        Registers the sources of the cached fields of ``form_class`` as
+        ``<module>.<form class>.<field name>``. Returns the form class, so
+        it can decorate it.
+        """
+        prefix = "%s.%s" % (form_class.__module__, form_class.__name__)
+        for field_name, source in list(form_class.get_sources().items()):
+            self.register(source, "%s.%s" % (prefix, field_name))
+        return form_class
+
+    def unregister(self, name):
+        del self._sources[name]
+
+    def get_sources(self, names=None):
+        """
+        Returns ``{name: source}`` for ``names`` (all registered sources by
+        default). Raises ``KeyError`` for an unknown name.
+        """
+        if names is None:
+            return OrderedDict(self._sources)
+        return OrderedDict((name, self._sources[name]) for name in names)
+
+    def __contains__(self, name):
+        return name in self._sources
+
+    def __iter__(self):
+        return iter(self._sources)
+
+    def __len__(self):
+        return len(self._sources)
+
+    def warm(self, names=None):
+        """
+        Loads the snapshots of the sources concurrently in the loader
+        thread pool. Yields ``(name, snapshot, error)`` as they finish, one
+        failed source doesn't stop the others.
+        """
+        executor = get_executor()
+        futures = dict(
+            (executor.submit(_get_snapshot_in_thread, source), name)
+            for name, source in list(self.get_sources(names).items())
+        )
+        for future in as_completed(futures):
+            error = future.exception()
+            yield futures[future], None if error is not None else future.result(), error
+
+    def warm_in_background(self, names=None):
+        """
+        Runs ``warm()`` in a daemon thread and returns the thread. Failures
+        are logged.
+        """
+
+        def warm():
+            for name, snapshot, error in self.warm(names):
+                if error is not None:
+                    logger.error("Failed to warm up %s: %s", name, error, exc_info=error)
+
+        thread = threading.Thread(target=warm, name="cached_modelforms-warm")
+        thread.daemon = True
+        thread.start()
+        return thread
+
+
+def autodiscover():
+    """
+    Imports ``sources`` and ``forms`` modules of all installed apps, where
+    sources are usually registered.
+    """
+    autodiscover_modules("sources", "forms")
+
+
+registry = SourceRegistry()
+register = registry.register
+register_form = registry.register_form
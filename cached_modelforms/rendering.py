@@ -0,0 +1,97 @@
+# -*- coding:utf-8 -*-
+"""
+``<option>`` tags of choices rendered without templates: pre-rendered
+once per snapshot for ``PrerenderedSelect`` and
+``PrerenderedSelectMultiple`` widgets, or in chunks for
+``StreamingSelect`` and ``StreamingSelectMultiple``.
+"""
+
+from __future__ import unicode_literals
+
+from array import array
+
+from django.utils.html import conditional_escape
+
+OPTION = '<option value="%s">%s</option>'
+SELECTED_OPTION = '<option value="%s" selected>%s</option>'
+
+# Number of options per chunk of ``iter_options()``.
+CHUNK_SIZE = 1000
+
+
+class OptionsHTML(object):
+    """
+    The escaped ``<option>`` tags of ``choices`` joined into one string,
+    with the offset of every tag in it. ``render()`` returns it as is or,
+    when some values are selected, with only their tags replaced.
+    """
+
+    def __init__(self, choices):
+        self.choices = choices
+        fragments = []
+        offsets = array("q", [0])
+        positions = {}
+        for index, (value, label) in enumerate(choices):
+            fragment = OPTION % (conditional_escape(value), conditional_escape(label))
+            fragments.append(fragment)
+            offsets.append(offsets[-1] + len(fragment))
+            # Like ``Select``, only the first option with the value is
+            # selected.
+            positions.setdefault("%s" % value, index)
+        self.html = "".join(fragments)
+        self._offsets = offsets
+        self._positions = positions
+
+    def render(self, selected=()):
+        """
+        Returns the options with ``selected`` values (strings) selected.
+        """
+        positions = self._positions
+        indexes = sorted(set(positions[value] for value in selected if value in positions))
+        if not indexes:
+            return self.html
+        html = self.html
+        offsets = self._offsets
+        parts = []
+        start = 0
+        for index in indexes:
+            parts.append(html[start : offsets[index]])
+            value, label = self.choices[index]
+            parts.append(SELECTED_OPTION % (conditional_escape(value), conditional_escape(label)))
+            start = offsets[index + 1]
+        parts.append(html[start:])
+        return "".join(parts)
+
+
+def iter_options(choices, selected=(), multiple=False, chunk_size=CHUNK_SIZE):
+    """
+    Yields the escaped ``<option>`` tags of ``choices`` (groups included)
+    joined in chunks of about ``chunk_size`` options, in ``choices`` order.
+    Options with ``selected`` values (strings) are selected; like
+    ``Select``, only the first one unless ``multiple`` is true.
+    """
+    selected = set(selected)
+    chunk = []
+    for value, label in choices:
+        group = isinstance(label, (list, tuple))
+        if group:
+            chunk.append('<optgroup label="%s">' % conditional_escape(value))
+            options = label
+        else:
+            options = ((value, label),)
+        for option_value, option_label in options:
+            if option_value is None:
+                option_value = ""
+            if selected and "%s" % option_value in selected:
+                chunk.append(SELECTED_OPTION % (conditional_escape(option_value), conditional_escape(option_label)))
+                if not multiple:
+                    selected = ()
+            else:
+                chunk.append(OPTION % (conditional_escape(option_value), conditional_escape(option_label)))
+        if group:
+            chunk.append("</optgroup>")
+        if len(chunk) >= chunk_size:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
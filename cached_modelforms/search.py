@@ -0,0 +1,63 @@
+# -*- coding:utf-8 -*-
+"""
+In-memory search over the choices of a snapshot, used by the autocomplete
+view instead of querying DB on every keystroke.
+"""
+
+from __future__ import unicode_literals
+
+import re
+from bisect import bisect_left
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Sorts after any token that starts with the same prefix.
+MAX_CHAR = "\U0010ffff"
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.casefold())
+
+
+class SearchIndex(object):
+    """
+    Prefix index over the labels of ``choices`` (``[(pk, label), ...]``).
+
+    Every word of every label is kept in one sorted list, so a prefix
+    lookup is two ``bisect`` calls. A query matches the labels that have a
+    word starting with each of its words; results keep ``choices`` order.
+    """
+
+    def __init__(self, choices):
+        self.choices = tuple(choices)
+        entries = sorted(
+            (token, position)
+            for position, (pk, label) in enumerate(self.choices)
+            for token in set(tokenize("%s" % label))
+        )
+        self._tokens = [token for token, position in entries]
+        self._positions = [position for token, position in entries]
+
+    def _find_prefix(self, prefix):
+        start = bisect_left(self._tokens, prefix)
+        end = bisect_left(self._tokens, prefix + MAX_CHAR, start)
+        return set(self._positions[start:end])
+
+    def search(self, query, offset=0, limit=None):
+        """
+        Returns ``(total, [(pk, label), ...])``: the number of matches for
+        ``query`` and the ``offset:offset + limit`` page of them.
+        """
+        words = set(tokenize(query))
+        if not words:
+            positions = range(len(self.choices))
+        else:
+            matches = None
+            # Start with the rarest word, intersections only get smaller.
+            for found in sorted((self._find_prefix(word) for word in words), key=len):
+                matches = found if matches is None else matches & found
+                if not matches:
+                    break
+            positions = sorted(matches)
+        end = None if limit is None else offset + limit
+        return len(positions), [self.choices[position] for position in positions[offset:end]]
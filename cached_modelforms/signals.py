@@ -0,0 +1,20 @@
+# -*- coding:utf-8 -*-
+"""
+Signals sent by object sources, for metrics. The sender is the source
+class, every signal also gets ``source`` and its ``name`` (``None`` for
+unnamed sources built from lambdas).
+"""
+
+from __future__ import unicode_literals
+
+from django.dispatch import Signal
+
+# Sent when a source builds a new snapshot, with ``snapshot``,
+# ``load_duration`` (seconds spent in the loader), ``build_duration``
+# (seconds spent building the snapshot from its result), ``size`` (number
+# of objects) and ``memory`` (``snapshot.approximate_size()`` in bytes).
+snapshot_built = Signal()
+
+# Sent on every snapshot request, with ``hit``: ``True`` if a snapshot was
+# already there (even a stale one), ``False`` if it had to be built.
+snapshot_requested = Signal()
@@ -0,0 +1,957 @@
+# -*- coding:utf-8 -*-
+"""
+Immutable snapshots of the objects behind ``CachedModelChoiceField`` and
+``CachedModelMultipleChoiceField``.
+
+A snapshot holds the ``{smart_text(pk): obj}`` index and the choices built
+from it. It is built once and then shared by every field (and every form
+instance) that uses the same version of the objects, so nothing has to be
+recomputed per form.
+"""
+
+from __future__ import unicode_literals
+
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from types import MappingProxyType
+
+try:
+    from collections.abc import Mapping, MutableSequence, Sequence
+except ImportError:
+    from collections import Mapping, MutableSequence, Sequence
+
+from django.apps import apps
+from django.core.exceptions import FieldDoesNotExist
+
+try:
+    from django.utils.encoding import smart_unicode as smart_text
+except ImportError:
+    from django.utils.encoding import smart_text
+
+from .rendering import OptionsHTML
+from .search import SearchIndex
+
+
+class SnapshotChoices(list):
+    """
+    Read-only ``list`` of choices that is shared between fields.
+
+    It is a ``list`` so it compares equal to the choices a regular field
+    would have, but any in-place modification raises ``TypeError``: assign
+    a new list to ``field.choices`` instead. Copying returns the very same
+    object, as there is nothing that could diverge.
+    """
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Snapshot choices are read-only, assign a new list to ``choices`` instead.")
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+    append = extend = insert = pop = remove = reverse = sort = clear = _readonly
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (self.__class__, (list(self),))
+
+
+class CopyOnWriteChoices(MutableSequence):
+    """
+    Choices of one field, over ``choices`` shared with other fields (e.g.
+    ``SnapshotChoices`` of a snapshot).
+
+    Reading goes to the shared choices. The first in-place change (e.g.
+    ``append()``, ``sort()``) copies them into a list of this object only,
+    so the other fields don't see it. Copying is free: the copy shares the
+    choices too, until one of them changes them.
+    """
+
+    def __init__(self, choices):
+        self._items = choices
+        self._copied = False
+
+    @property
+    def shared(self):
+        """
+        The shared choices, or ``None`` once these have been changed.
+        """
+        return None if self._copied else self._items
+
+    def _own(self):
+        if not self._copied:
+            self._items = list(self._items)
+            self._copied = True
+        return self._items
+
+    def __getitem__(self, index):
+        return self._items[index]
+
+    def __setitem__(self, index, value):
+        self._own()[index] = value
+
+    def __delitem__(self, index):
+        del self._own()[index]
+
+    def insert(self, index, value):
+        self._own().insert(index, value)
+
+    def sort(self, *args, **kwargs):
+        self._own().sort(*args, **kwargs)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __eq__(self, other):
+        if not isinstance(other, (list, tuple, Sequence)):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def __copy__(self):
+        # Both share the choices now, the next change of either copies them.
+        self._copied = False
+        return self.__class__(self._items)
+
+    def __deepcopy__(self, memo):
+        return self.__copy__()
+
+    def __reduce__(self):
+        return (self.__class__, (list(self),))
+
+
+class ObjectSnapshot(object):
+    """
+    Immutable ``pk -> object`` index plus the choices built from it.
+
+    Use ``ObjectSnapshot.build`` to make one from anything ``objects``
+    argument accepts.
+    """
+
+    # Model to fetch the objects from, for snapshots that don't keep them.
+    model = None
+
+    def __init__(self, objects, choices, version=0):
+        self._objects = dict(objects)
+        self._objects_view = MappingProxyType(self._objects)
+        self._choices = tuple(choices)
+        self._version = version
+        self._choices_cache = {}
+        self._options_html_cache = {}
+        self._children_indexes = {}
+        self._labels = None
+        self._search_index = None
+
+    @classmethod
+    def build(cls, value, version=0):
+        """
+        Builds a snapshot from ``value`` that can be:
+          * a list (or any iterable) or objects, e.g. ``[obj1, obj2, ...]``
+          * a list (or any iterable) of tuples: ``[(obj1.pk, obj1), (obj2.pk, obj2), ...]``
+          * a dict: ``{obj1.pk: obj1, obj2.pk: obj2, ...}``
+          * another snapshot, which is returned as is.
+        """
+        if isinstance(value, ObjectSnapshot):
+            return value
+        if isinstance(value, dict):
+            objects = dict((smart_text(k), v) for k, v in list(value.items()))
+            choices = [(x, smart_text(objects[x])) for x in sorted(objects.keys())]
+        else:
+            items = list(value)
+            if items and isinstance(items[0], (list, tuple)):
+                objects = dict((smart_text(k), v) for k, v in items)
+                choices = [(smart_text(k), smart_text(v)) for k, v in items]
+            else:
+                objects = dict((smart_text(x.pk), x) for x in items)
+                choices = [(smart_text(x.pk), smart_text(x)) for x in items]
+        return cls(objects, choices, version)
+
+    @property
+    def version(self):
+        return self._version
+
+    @property
+    def objects(self):
+        """
+        Read-only ``{smart_text(pk): obj}`` mapping.
+        """
+        return self._objects_view
+
+    @property
+    def choices(self):
+        return self._choices
+
+    def get_choices(self, empty_label=None):
+        """
+        Returns shared ``SnapshotChoices`` for a field, with
+        ``empty_label`` prepended unless it is ``None``.
+        """
+        try:
+            return self._choices_cache[empty_label]
+        except KeyError:
+            choices = list(self.choices)
+            if empty_label is not None:
+                choices.insert(0, ("", empty_label))
+            return self._choices_cache.setdefault(empty_label, SnapshotChoices(choices))
+
+    def get_options_html(self, empty_label=None):
+        """
+        Returns ``OptionsHTML`` of ``get_choices(empty_label)``, built on
+        first use.
+        """
+        try:
+            return self._options_html_cache[empty_label]
+        except KeyError:
+            return self._options_html_cache.setdefault(empty_label, OptionsHTML(self.get_choices(empty_label)))
+
+    def get_options_html_for(self, choices):
+        """
+        Returns ``OptionsHTML`` for ``choices`` if they are the choices of
+        this snapshot (as returned by ``get_choices()``, also when shared
+        by ``CopyOnWriteChoices``), ``None`` otherwise.
+        """
+        choices = getattr(choices, "shared", choices)
+        for empty_label, snapshot_choices in list(self._choices_cache.items()):
+            if snapshot_choices is choices:
+                return self.get_options_html(empty_label)
+        return None
+
+    def get_children_index(self, parent_attr):
+        """
+        Returns ``ChildrenIndex`` of the objects by their ``parent_attr``
+        (e.g. ``'country'``), built on first use.
+        """
+        try:
+            return self._children_indexes[parent_attr]
+        except KeyError:
+            index = ChildrenIndex(self.choices, self.get_parent_keys(parent_attr))
+            return self._children_indexes.setdefault(parent_attr, index)
+
+    def get_parent_keys(self, parent_attr):
+        """
+        Returns ``{smart_text(pk): smart_text(parent pk)}`` of the objects
+        by their ``parent_attr``, objects without a parent are left out.
+        """
+        parents = {}
+        for key, obj in list(self._objects.items()):
+            parent = _get_parent_key(obj, parent_attr)
+            if parent is not None:
+                parents[key] = parent
+        return parents
+
+    @property
+    def labels(self):
+        """
+        Read-only ``{smart_text(pk): label}`` mapping, built on first use.
+        """
+        if self._labels is None:
+            self._labels = MappingProxyType(dict(self.choices))
+        return self._labels
+
+    @property
+    def search_index(self):
+        """
+        ``SearchIndex`` over the choices, built on first use.
+        """
+        if self._search_index is None:
+            self._search_index = SearchIndex(self.choices)
+        return self._search_index
+
+    def search(self, query, offset=0, limit=None):
+        """
+        Shortcut for ``search_index.search()``.
+        """
+        return self.search_index.search(query, offset, limit)
+
+    def subset(self, keys=None, predicate=None):
+        """
+        Returns ``SubsetSnapshot`` of the objects whose pks are in
+        ``keys`` and/or for whose ``smart_text(pk)`` ``predicate`` returns
+        true. The snapshot itself is not copied.
+        """
+        return SubsetSnapshot(self, keys, predicate)
+
+    def preload(self, keys):
+        """
+        Returns ``PreloadedSnapshot`` with the objects of ``keys`` fetched
+        in one go, for snapshots that don't keep the objects (with
+        ``model``); the snapshot itself otherwise.
+        """
+        if self.model is None:
+            return self
+        return PreloadedSnapshot(self, self.get_objects(keys))
+
+    def get_object(self, key):
+        """
+        Returns the object for ``smart_text(pk)``, raises ``KeyError`` if
+        there is none.
+        """
+        return self._objects[key]
+
+    def get_objects(self, keys):
+        """
+        Returns ``{key: obj}`` for the given ``smart_text(pk)`` keys that
+        are in the snapshot.
+        """
+        objects = self._objects
+        return dict((key, objects[key]) for key in keys if key in objects)
+
+    def __contains__(self, key):
+        return key in self._objects
+
+    def __len__(self):
+        return len(self._objects)
+
+    def approximate_size(self):
+        """
+        Approximate memory taken by the snapshot, in bytes: its containers,
+        keys and labels, plus the objects themselves (without the objects
+        they refer to).
+        """
+        size = sys.getsizeof(self._objects) + sys.getsizeof(self._choices)
+        for key, obj in list(self._objects.items()):
+            size += sys.getsizeof(key) + sys.getsizeof(obj)
+            if hasattr(obj, "__dict__"):
+                size += sys.getsizeof(obj.__dict__)
+        for choice in self._choices:
+            size += sys.getsizeof(choice) + sys.getsizeof(choice[1])
+        return size
+
+    def __reduce__(self):
+        return (self.__class__, (self._objects, self._choices, self._version))
+
+
+class CompactSnapshot(ObjectSnapshot):
+    """
+    Snapshot that keeps only pks and labels of ``model`` objects, in two
+    parallel tuples plus a ``{pk: label}`` index, not the objects
+    themselves.
+
+    Objects are fetched only for the values actually selected, with one
+    ``in_bulk`` query per ``get_objects()`` call. ``objects`` is the
+    ``{smart_text(pk): label}`` mapping here.
+    """
+
+    def __init__(self, model, pks, labels, version=0):
+        self.model = model
+        self._pks = tuple(pks)
+        self._label_list = tuple(labels)
+        self._label_index = dict(zip(self._pks, self._label_list))
+        self._labels = MappingProxyType(self._label_index)
+        self._version = version
+        self._choices = None
+        self._choices_cache = {}
+        self._options_html_cache = {}
+        self._children_indexes = {}
+        self._search_index = None
+
+    @classmethod
+    def build(cls, value, version=0, model=None):
+        """
+        Builds a snapshot from a list (or any iterable, e.g.
+        ``queryset.iterator()``) of objects; only their pks and labels are
+        kept. ``model`` defaults to the class of the first object.
+        """
+        if isinstance(value, ObjectSnapshot):
+            return value
+        pks = []
+        labels = []
+        for obj in value:
+            if model is None:
+                model = obj._meta.concrete_model
+            pks.append(smart_text(obj.pk))
+            labels.append(smart_text(obj))
+        return cls(model, pks, labels, version)
+
+    @property
+    def objects(self):
+        return self._labels
+
+    @property
+    def choices(self):
+        # Pairs are only needed to render the choices, build them lazily.
+        if self._choices is None:
+            self._choices = tuple(zip(self._pks, self._label_list))
+        return self._choices
+
+    def get_parent_keys(self, parent_attr):
+        # Parents are not kept, they are fetched with one query.
+        labels = self._labels
+        return dict(
+            (smart_text(pk), smart_text(parent))
+            for pk, parent in self.model._default_manager.values_list("pk", parent_attr).iterator()
+            if parent is not None and smart_text(pk) in labels
+        )
+
+    def get_object(self, key):
+        if key not in self._labels:
+            raise KeyError(key)
+        return self.get_objects([key])[key]
+
+    def get_objects(self, keys):
+        keys = [key for key in keys if key in self._labels]
+        if not keys:
+            return {}
+        objects = self.model._default_manager.in_bulk(keys)
+        return dict((smart_text(pk), obj) for pk, obj in list(objects.items()))
+
+    def __contains__(self, key):
+        return key in self._labels
+
+    def __len__(self):
+        return len(self._pks)
+
+    def approximate_size(self):
+        size = sys.getsizeof(self._pks) + sys.getsizeof(self._label_list) + sys.getsizeof(self._label_index)
+        for pk, label in zip(self._pks, self._label_list):
+            size += sys.getsizeof(pk) + sys.getsizeof(label)
+        return size
+
+    def __reduce__(self):
+        return (self.__class__, (self.model, self._pks, self._label_list, self._version))
+
+
+class MappedSnapshot(CompactSnapshot):
+    """
+    ``CompactSnapshot`` kept in a file that is memory-mapped read-only,
+    so processes on one host that map the same file share its memory.
+
+    The file holds pks and labels as UTF-8 with their offsets, and the pks
+    sorted for binary search; nothing is decoded until it is used, there
+    is no per-process index. Write one with ``MappedSnapshot.write()``::
+
+        MappedSnapshot.write('/dev/shm/tags.snapshot', CompactSnapshot.build(Tag.objects.all()))
+        snapshot = MappedSnapshot('/dev/shm/tags.snapshot')
+
+    ``choices`` (and ``get_choices()``) are lazy read-only sequences that
+    decode labels while they are iterated.
+    """
+
+    # magic, version, number of objects, length of model label
+    header = struct.Struct("=8sqQQ")
+    magic = b"CMFSNAP1"
+
+    def __init__(self, path, model=None):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._version, count, label_length = self.header.unpack_from(self._map, 0)
+        if magic != self.magic:
+            raise ValueError("%s is not a snapshot file." % path)
+        view = memoryview(self._map)
+        offset = self.header.size
+        model_label = bytes(view[offset : offset + label_length]).decode("utf-8")
+        offset += _align(label_length)
+        self._count = count
+        self._pk_offsets, offset = _cast(view, offset, count + 1)
+        self._label_offsets, offset = _cast(view, offset, count + 1)
+        self._order, offset = _cast(view, offset, count)
+        self._data = view[offset:]
+        self.model = model or apps.get_model(model_label)
+        self._labels = MappedLabels(self)
+        self._choices = None
+        self._choices_cache = {}
+        self._options_html_cache = {}
+        self._children_indexes = {}
+        self._search_index = None
+
+    @classmethod
+    def write(cls, path, snapshot):
+        """
+        Writes pks and labels of ``snapshot`` (a snapshot with ``model``)
+        to ``path``. The file is replaced atomically, processes that have
+        mapped the old one keep using it.
+        """
+        pks = [pk.encode("utf-8") for pk, label in snapshot.choices]
+        labels = ["%s" % label for pk, label in snapshot.choices]
+        labels = [label.encode("utf-8") for label in labels]
+        model_label = snapshot.model._meta.label.encode("utf-8")
+        offsets = [0]
+        for value in pks + labels:
+            offsets.append(offsets[-1] + len(value))
+        count = len(pks)
+        pk_offsets = offsets[: count + 1]
+        label_offsets = offsets[count:]
+        order = sorted(range(count), key=pks.__getitem__)
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".snapshot")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(cls.header.pack(cls.magic, snapshot.version, count, len(model_label)))
+                f.write(model_label.ljust(_align(len(model_label)), b"\0"))
+                for values in (pk_offsets, label_offsets, order):
+                    f.write(struct.pack("=%dQ" % len(values), *values))
+                for value in pks + labels:
+                    f.write(value)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    def _get_pk(self, index):
+        return bytes(self._data[self._pk_offsets[index] : self._pk_offsets[index + 1]])
+
+    def _get_label(self, index):
+        return bytes(self._data[self._label_offsets[index] : self._label_offsets[index + 1]]).decode("utf-8")
+
+    def find(self, key):
+        """
+        Returns the position of ``smart_text(pk)`` key in choices, or
+        ``-1``.
+        """
+        key = key.encode("utf-8")
+        order = self._order
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._get_pk(order[middle]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._count and self._get_pk(order[low]) == key:
+            return order[low]
+        return -1
+
+    def get_choice(self, index):
+        return self._get_pk(index).decode("utf-8"), self._get_label(index)
+
+    @property
+    def choices(self):
+        if self._choices is None:
+            self._choices = MappedChoices(self)
+        return self._choices
+
+    def get_choices(self, empty_label=None):
+        try:
+            return self._choices_cache[empty_label]
+        except KeyError:
+            return self._choices_cache.setdefault(empty_label, MappedChoices(self, empty_label))
+
+    def __contains__(self, key):
+        return self.find(key) >= 0
+
+    def __len__(self):
+        return self._count
+
+    def approximate_size(self):
+        """
+        Size of the mapped file; it's shared by the processes that map it.
+        """
+        return len(self._map)
+
+    def __reduce__(self):
+        return (self.__class__, (self.path, self.model))
+
+
+class ChildrenIndex(object):
+    """
+    ``parent key -> children`` index of a snapshot. It answers whether an
+    object belongs to a parent with one dict lookup and keeps the choices
+    of every parent, in the order of the snapshot choices.
+    """
+
+    def __init__(self, choices, parents):
+        self.parents = MappingProxyType(parents)
+        children = {}
+        for choice in choices:
+            parent = parents.get(choice[0])
+            if parent is not None:
+                children.setdefault(parent, []).append(choice)
+        self._children = dict((parent, tuple(items)) for parent, items in list(children.items()))
+        self._choices_cache = {}
+
+    def get_parent(self, key):
+        """
+        Returns the parent key of ``smart_text(pk)`` key, or ``None``.
+        """
+        return self.parents.get(key)
+
+    def get_children(self, parent):
+        """
+        Returns ``(key, label)`` pairs of the children of ``parent`` key.
+        """
+        return self._children.get(parent, ())
+
+    def get_choices(self, parent, empty_label=None):
+        """
+        Returns shared ``SnapshotChoices`` of the children of ``parent``
+        key, with ``empty_label`` prepended unless it is ``None``.
+        """
+        if parent not in self._children:
+            # Unknown parents share the empty choices, they are not cached
+            # one by one.
+            parent = None
+        try:
+            return self._choices_cache[parent, empty_label]
+        except KeyError:
+            choices = list(self.get_children(parent))
+            if empty_label is not None:
+                choices.insert(0, ("", empty_label))
+            return self._choices_cache.setdefault((parent, empty_label), SnapshotChoices(choices))
+
+    def __len__(self):
+        return len(self._children)
+
+
+def _get_parent_key(obj, parent_attr):
+    # Foreign keys are read by their ``attname``, so related objects are
+    # not fetched.
+    opts = getattr(obj, "_meta", None)
+    if opts is not None:
+        try:
+            parent_attr = opts.get_field(parent_attr).attname
+        except FieldDoesNotExist:
+            pass
+    parent = getattr(obj, parent_attr, None)
+    if parent is None:
+        return None
+    return smart_text(getattr(parent, "pk", parent))
+
+
+def _align(size):
+    return (size + 7) // 8 * 8
+
+
+def _cast(view, offset, count):
+    end = offset + count * 8
+    return view[offset:end].cast("Q"), end
+
+
+class SubsetSnapshot(ObjectSnapshot):
+    """
+    Read-only view of a part of ``snapshot``, e.g. the objects a user may
+    choose. Use ``snapshot.subset()`` to make one.
+
+    Nothing of ``snapshot`` is copied: lookups check the key against the
+    subset and then go to ``snapshot``, ``objects``, ``labels`` and
+    ``choices`` filter it while they are iterated. So making one per
+    request costs only the ``keys`` set.
+    """
+
+    def __init__(self, snapshot, keys=None, predicate=None):
+        self.snapshot = snapshot
+        self.model = snapshot.model
+        self._keys = None if keys is None else frozenset(smart_text(key) for key in keys)
+        self._predicate = predicate
+        self._version = snapshot.version
+        self._objects_view = SubsetMapping(snapshot.objects, self)
+        self._labels = None
+        self._choices = None
+        self._choices_cache = {}
+        self._options_html_cache = {}
+        self._children_indexes = {}
+        self._search_index = None
+
+    @property
+    def root(self):
+        """
+        The snapshot this subset (maybe of another subset) is a view of.
+        """
+        snapshot = self.snapshot
+        while isinstance(snapshot, SubsetSnapshot):
+            snapshot = snapshot.snapshot
+        return snapshot
+
+    def over(self, snapshot):
+        """
+        Returns the same subset of another snapshot, e.g. of a newer
+        version of ``root``.
+        """
+        if isinstance(self.snapshot, SubsetSnapshot):
+            snapshot = self.snapshot.over(snapshot)
+        return SubsetSnapshot(snapshot, self._keys, self._predicate)
+
+    def allows(self, key):
+        """
+        Whether ``smart_text(pk)`` key is in the subset, provided it is in
+        the snapshot.
+        """
+        return (self._keys is None or key in self._keys) and (self._predicate is None or self._predicate(key))
+
+    @property
+    def choices(self):
+        if self._choices is None:
+            self._choices = SubsetChoices(self)
+        return self._choices
+
+    def get_choices(self, empty_label=None):
+        try:
+            return self._choices_cache[empty_label]
+        except KeyError:
+            return self._choices_cache.setdefault(empty_label, SubsetChoices(self, empty_label))
+
+    @property
+    def labels(self):
+        if self._labels is None:
+            self._labels = SubsetMapping(self.snapshot.labels, self)
+        return self._labels
+
+    def get_children_index(self, parent_attr):
+        # Parents come from the index of the snapshot, only the choices of
+        # the subset are grouped.
+        try:
+            return self._children_indexes[parent_attr]
+        except KeyError:
+            parents = self.snapshot.get_children_index(parent_attr).parents
+            return self._children_indexes.setdefault(parent_attr, ChildrenIndex(self.choices, parents))
+
+    def search(self, query, offset=0, limit=None):
+        # The search index of the snapshot is used, the matches are
+        # filtered.
+        total, results = self.snapshot.search(query)
+        results = [choice for choice in results if self.allows(choice[0])]
+        end = None if limit is None else offset + limit
+        return len(results), results[offset:end]
+
+    def get_object(self, key):
+        if not self.allows(key):
+            raise KeyError(key)
+        return self.snapshot.get_object(key)
+
+    def get_objects(self, keys):
+        return self.snapshot.get_objects([key for key in keys if self.allows(key)])
+
+    def __contains__(self, key):
+        return (self._keys is None or key in self._keys) and key in self.snapshot and self.allows(key)
+
+    def __len__(self):
+        return len(self.choices)
+
+    def approximate_size(self):
+        """
+        Memory taken by the subset itself, ``snapshot`` is not counted.
+        """
+        return 0 if self._keys is None else sys.getsizeof(self._keys)
+
+    def __reduce__(self):
+        return (self.__class__, (self.snapshot, self._keys, self._predicate))
+
+
+class PreloadedSnapshot(SubsetSnapshot):
+    """
+    View of all of ``snapshot`` with some of its objects fetched ahead,
+    e.g. the ones selected in all rows of ``validate_many()``, so they are
+    not fetched for every row. Use ``snapshot.preload()`` to make one.
+    """
+
+    def __init__(self, snapshot, objects):
+        super(PreloadedSnapshot, self).__init__(snapshot)
+        self._preloaded = objects
+
+    def get_object(self, key):
+        try:
+            return self._preloaded[key]
+        except KeyError:
+            return self.snapshot.get_object(key)
+
+    def get_objects(self, keys):
+        preloaded = self._preloaded
+        missing = [key for key in keys if key not in preloaded]
+        objects = self.snapshot.get_objects(missing) if missing else {}
+        objects.update((key, preloaded[key]) for key in keys if key in preloaded)
+        return objects
+
+    def over(self, snapshot):
+        # Preloaded objects may be outdated in another snapshot, only the
+        # subset (if any) is kept.
+        if isinstance(self.snapshot, SubsetSnapshot):
+            return self.snapshot.over(snapshot)
+        return snapshot
+
+    def __reduce__(self):
+        return (self.__class__, (self.snapshot, self._preloaded))
+
+
+class SubsetMapping(Mapping):
+    """
+    Read-only view of the items of ``mapping`` that are in ``subset``.
+    """
+
+    def __init__(self, mapping, subset):
+        self._mapping = mapping
+        self._subset = subset
+
+    def __getitem__(self, key):
+        if not self._subset.allows(key):
+            raise KeyError(key)
+        return self._mapping[key]
+
+    def __contains__(self, key):
+        return key in self._subset
+
+    def __iter__(self):
+        allows = self._subset.allows
+        return (key for key in self._mapping if allows(key))
+
+    def __len__(self):
+        return sum(1 for key in self)
+
+
+class MappedLabels(Mapping):
+    """
+    Read-only ``{smart_text(pk): label}`` mapping over a ``MappedSnapshot``.
+    """
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+
+    def __getitem__(self, key):
+        index = self._snapshot.find(key)
+        if index < 0:
+            raise KeyError(key)
+        return self._snapshot._get_label(index)
+
+    def __contains__(self, key):
+        return self._snapshot.find(key) >= 0
+
+    def __iter__(self):
+        snapshot = self._snapshot
+        return (snapshot._get_pk(index).decode("utf-8") for index in range(len(snapshot)))
+
+    def __len__(self):
+        return len(self._snapshot)
+
+
+class FetchedObjects(Mapping):
+    """
+    Read-only ``{smart_text(pk): obj}`` mapping over a snapshot that
+    doesn't keep the objects (one with ``model``, e.g. ``CompactSnapshot``):
+    the keys are the snapshot's, the objects are fetched when they are
+    read, ``items()`` and ``values()`` fetch all of them with one query.
+    """
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+
+    def __getitem__(self, key):
+        return self._snapshot.get_object(key)
+
+    def __contains__(self, key):
+        return key in self._snapshot
+
+    def __iter__(self):
+        return iter(self._snapshot.labels)
+
+    def __len__(self):
+        return len(self._snapshot)
+
+    def items(self):
+        keys = list(self)
+        objects = self._snapshot.get_objects(keys)
+        return [(key, objects[key]) for key in keys if key in objects]
+
+    def values(self):
+        return [obj for key, obj in self.items()]
+
+
+class LazyChoices(Sequence):
+    """
+    Base of read-only choices that are computed while they are used. Like
+    ``SnapshotChoices``, they compare equal to lists and copying returns
+    the same object.
+    """
+
+    def __eq__(self, other):
+        if not isinstance(other, (list, tuple, Sequence)):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+class MappedChoices(LazyChoices):
+    """
+    Read-only choices of a ``MappedSnapshot`` (with ``empty_label``
+    first unless it is ``None``), decoded while they are used.
+    """
+
+    def __init__(self, snapshot, empty_label=None):
+        self._snapshot = snapshot
+        self._prefix = () if empty_label is None else (("", empty_label),)
+
+    def __len__(self):
+        return len(self._prefix) + len(self._snapshot)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        if index < len(self._prefix):
+            return self._prefix[index]
+        return self._snapshot.get_choice(index - len(self._prefix))
+
+    def __iter__(self):
+        for choice in self._prefix:
+            yield choice
+        get_choice = self._snapshot.get_choice
+        for index in range(len(self._snapshot)):
+            yield get_choice(index)
+
+
+class SubsetChoices(LazyChoices):
+    """
+    Read-only choices of a ``SubsetSnapshot`` (with ``empty_label`` first
+    unless it is ``None``), the choices of its snapshot filtered while
+    they are iterated. Indexing and ``len()`` collect them once.
+    """
+
+    def __init__(self, subset, empty_label=None):
+        self._subset = subset
+        self._prefix = () if empty_label is None else (("", empty_label),)
+        self._items = None
+
+    def _get_items(self):
+        if self._items is None:
+            self._items = tuple(iter(self))
+        return self._items
+
+    def __len__(self):
+        return len(self._get_items())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self._get_items()[index])
+        return self._get_items()[index]
+
+    def __iter__(self):
+        for choice in self._prefix:
+            yield choice
+        allows = self._subset.allows
+        for choice in self._subset.snapshot.choices:
+            if allows(choice[0]):
+                yield choice
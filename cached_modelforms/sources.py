@@ -0,0 +1,705 @@
+# -*- coding:utf-8 -*-
+"""
+Object sources: versioned providers of ``ObjectSnapshot`` for cached
+fields and ``Meta.objects``.
+"""
+
+from __future__ import unicode_literals
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.cache import caches
+from django.db import connections, transaction
+from django.db.models import Model
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from .conf import get_setting
+from .signals import snapshot_built, snapshot_requested
+from .snapshots import CompactSnapshot, MappedSnapshot, ObjectSnapshot
+
+logger = logging.getLogger(__name__)
+
+
+def _get_loader_name(loader):
+    name = getattr(loader, "__qualname__", None) or getattr(loader, "__name__", None)
+    if name is None or "<lambda>" in name:
+        return None
+    return "%s.%s" % (loader.__module__, name)
+
+
+class ObjectSource(object):
+    """
+    Calls ``loader`` and builds a snapshot from its result once per
+    version. The snapshot is shared by every field and form instance until
+    ``invalidate()`` is called.
+
+    ``loader`` may return anything ``objects`` argument accepts (or an
+    ``ObjectSnapshot``). Sources are callable and return the current
+    snapshot, so they can be used wherever ``objects`` callable is expected::
+
+        categories = ObjectSource(lambda: list(Category.objects.all()))
+
+        class ProductForm(cached_modelforms.ModelForm):
+            class Meta:
+                model = Product
+                objects = {'category': categories}
+
+    If ``version_cache`` (``CACHED_MODELFORMS_VERSION_CACHE`` by default)
+    names a cache, the version counter is kept there, so ``invalidate()`` is
+    seen by every process. Each process checks it at most once per
+    ``CACHED_MODELFORMS_VERSION_CHECK_INTERVAL`` seconds and keeps using its
+    own snapshot meanwhile. This needs a ``name`` unique among the sources;
+    it defaults to the loader's dotted path (lambdas have none, so their
+    versions stay per process).
+
+    ``loader`` can be a coroutine function, ``aget_snapshot()`` awaits it
+    (sync loaders are run with ``sync_to_async`` there).
+
+    Sources send ``snapshot_built`` and ``snapshot_requested`` signals (see
+    ``signals.py``) with loader timings and hits.
+
+    With ``background_refresh=True`` an outdated snapshot keeps being
+    served while it is rebuilt in the loader thread pool (one refresh per
+    source at a time), and the new one replaces it when it's ready. Once
+    the snapshot has been outdated for ``max_staleness`` seconds, requests
+    wait for the new one again.
+    """
+
+    snapshot_class = ObjectSnapshot
+
+    def __init__(self, loader, name=None, version_cache=None, background_refresh=False, max_staleness=None):
+        self.loader = loader
+        self.name = name or _get_loader_name(loader)
+        self.background_refresh = background_refresh
+        self.max_staleness = max_staleness
+        self._version_cache = version_cache
+        self._version = 0
+        self._version_checked = None
+        self._snapshot = None
+        self._lock = threading.RLock()
+        self._refresh = None
+        self._refresh_lock = threading.Lock()
+        self._stale_since = None
+        self._async_build = None
+
+    def __repr__(self):
+        return "<%s: %s>" % (self.__class__.__name__, self.name)
+
+    @property
+    def version_cache(self):
+        if self.name is None:
+            return None
+        return self._version_cache or get_setting("VERSION_CACHE")
+
+    @property
+    def version_key(self):
+        return "%s:version:%s" % (get_setting("KEY_PREFIX"), self.name)
+
+    @property
+    def version(self):
+        alias = self.version_cache
+        if alias is None:
+            return self._version
+        now = time.time()
+        checked = self._version_checked
+        if checked is None or now - checked >= get_setting("VERSION_CHECK_INTERVAL"):
+            version = caches[alias].get(self.version_key)
+            self._version = 0 if version is None else version
+            self._version_checked = now
+        return self._version
+
+    def invalidate(self):
+        """
+        Signals that the objects have changed: the next ``get_snapshot()``
+        call reloads them.
+        """
+        with self._lock:
+            alias = self.version_cache
+            if alias is None:
+                self._version += 1
+                return
+            cache = caches[alias]
+            try:
+                self._version = cache.incr(self.version_key)
+            except ValueError:
+                # The counter has never been set (or was evicted). Another
+                # process may already hold ``self._version + 1`` as its
+                # local version, the counter starts from the time instead
+                # so it never goes back to a version that was in use.
+                version = int(time.time() * 1000000)
+                if not cache.add(self.version_key, version, None):
+                    self._version = cache.incr(self.version_key)
+                else:
+                    self._version = version
+            self._version_checked = time.time()
+
+    @property
+    def is_async(self):
+        return asyncio.iscoroutinefunction(self.loader)
+
+    @property
+    def last_snapshot(self):
+        """
+        The last snapshot built by this source (even if it is outdated), or
+        ``None``.
+        """
+        current = self._snapshot
+        return None if current is None else current[1]
+
+    def load(self):
+        if self.is_async:
+            return async_to_sync(self.loader)()
+        return self.loader()
+
+    def make_snapshot(self, value, version):
+        """
+        Builds a snapshot from the result of ``loader``.
+        """
+        return self.snapshot_class.build(value, version)
+
+    def build_snapshot(self, version):
+        started = time.perf_counter()
+        value = self.load()
+        loaded = time.perf_counter()
+        snapshot = self.make_snapshot(value, version)
+        self.report_built(snapshot, loaded - started, time.perf_counter() - loaded)
+        return snapshot
+
+    def report_built(self, snapshot, load_duration, build_duration):
+        sender = self.__class__
+        if snapshot_built.has_listeners(sender):
+            snapshot_built.send(
+                sender=sender,
+                source=self,
+                name=self.name,
+                snapshot=snapshot,
+                load_duration=load_duration,
+                build_duration=build_duration,
+                size=len(snapshot),
+                memory=snapshot.approximate_size(),
+            )
+
+    def report_requested(self, hit):
+        snapshot_requested.send(sender=self.__class__, source=self, name=self.name, hit=hit)
+
+    def _update_snapshot(self, version):
+        with self._lock:
+            current = self._snapshot
+            if current is None or current[0] != version:
+                current = self._snapshot = (version, self.build_snapshot(version))
+                self._stale_since = None
+                return current, False
+        return current, True
+
+    def _refresh_in_background(self, version):
+        try:
+            self._update_snapshot(version)
+        except Exception:
+            logger.exception("Background refresh of %r failed.", self)
+        finally:
+            # Pool threads are reused, don't leave DB connections opened.
+            connections.close_all()
+
+    def get_stale_snapshot(self, version):
+        """
+        With ``background_refresh``, starts rebuilding the snapshot for
+        ``version`` in background (unless it's already being rebuilt) and
+        returns the outdated one. Returns ``None`` if there is nothing to
+        serve or it is too stale.
+        """
+        current = self._snapshot
+        if not self.background_refresh or current is None:
+            return None
+        now = time.time()
+        with self._refresh_lock:
+            if self._stale_since is None:
+                self._stale_since = now
+            if self.max_staleness is not None and now - self._stale_since >= self.max_staleness:
+                return None
+            if self._refresh is None or self._refresh.done():
+                self._refresh = get_executor().submit(self._refresh_in_background, version)
+        return current[1]
+
+    def get_snapshot(self):
+        version = self.version
+        current = self._snapshot
+        hit = True
+        if current is None or current[0] != version:
+            snapshot = self.get_stale_snapshot(version)
+            if snapshot is not None:
+                self.report_requested(True)
+                return snapshot
+            current, hit = self._update_snapshot(version)
+        self.report_requested(hit)
+        return current[1]
+
+    __call__ = get_snapshot
+
+    async def aget_snapshot(self):
+        """
+        ``get_snapshot()`` for async code.
+        """
+        version = self.version
+        current = self._snapshot
+        if current is not None and current[0] == version:
+            self.report_requested(True)
+            return current[1]
+        snapshot = self.get_stale_snapshot(version)
+        if snapshot is not None:
+            self.report_requested(True)
+            return snapshot
+        if not self.is_async:
+            return await sync_to_async(self.get_snapshot)()
+        # Like ``_lock`` in ``get_snapshot()``: coroutines of a loop that
+        # need the same version wait for one build instead of each running
+        # the loader.
+        loop = asyncio.get_event_loop()
+        with self._lock:
+            build = self._async_build
+            hit = build is not None and build[0] is loop and build[1] == version and not build[2].done()
+            if not hit:
+                build = self._async_build = (loop, version, asyncio.ensure_future(self._abuild_snapshot(version)))
+        # A cancelled waiter doesn't cancel the build for the others.
+        snapshot = await asyncio.shield(build[2])
+        self.report_requested(hit)
+        return snapshot
+
+    async def _abuild_snapshot(self, version):
+        started = time.perf_counter()
+        value = await self.loader()
+        loaded = time.perf_counter()
+        snapshot = self.make_snapshot(value, version)
+        self.report_built(snapshot, loaded - started, time.perf_counter() - loaded)
+        with self._lock:
+            self._snapshot = (version, snapshot)
+            self._stale_since = None
+        return snapshot
+
+
+class CallableSource(ObjectSource):
+    """
+    Source for a bare ``objects`` callable.
+
+    The callable is called every time (it is usually a cache lookup), but
+    the snapshot is rebuilt only when it returns a different object than
+    the last time. So a callable returning the same list keeps reusing the
+    same snapshot; don't modify that list in place.
+    """
+
+    def _get_snapshot_for(self, value, load_duration):
+        if isinstance(value, ObjectSnapshot):
+            self.report_requested(True)
+            return value
+        current = self._snapshot
+        hit = current is not None and current[0] is value
+        if not hit:
+            started = time.perf_counter()
+            snapshot = ObjectSnapshot.build(value)
+            self.report_built(snapshot, load_duration, time.perf_counter() - started)
+            # ``value`` is kept along with the snapshot, so its ``id`` can't
+            # be reused by another object.
+            current = self._snapshot = (value, snapshot)
+        self.report_requested(hit)
+        return current[1]
+
+    def get_snapshot(self):
+        started = time.perf_counter()
+        value = self.load()
+        return self._get_snapshot_for(value, time.perf_counter() - started)
+
+    __call__ = get_snapshot
+
+    async def aget_snapshot(self):
+        if not self.is_async:
+            return await sync_to_async(self.get_snapshot)()
+        started = time.perf_counter()
+        value = await self.loader()
+        return self._get_snapshot_for(value, time.perf_counter() - started)
+
+
+class CacheSource(ObjectSource):
+    """
+    Keeps the snapshot in Django cache ``alias`` under ``key``.
+
+    The snapshot is fresh for ``timeout`` seconds and then kept for
+    ``stale_timeout`` more. When it gets stale, only one worker (the one
+    that manages to ``cache.add`` the lock key) runs ``loader``, the others
+    keep getting the stale snapshot meanwhile. If there is nothing in the
+    cache at all, workers wait up to ``lock_timeout`` seconds for the one
+    holding the lock before loading the objects themselves::
+
+        categories = CacheSource('categories', lambda: list(Category.objects.all()), timeout=600)
+
+    The version counter is kept in the same cache, and every process keeps
+    the last snapshot it got, so it's unpickled only when it changes.
+
+    With ``background_refresh=True`` the worker holding the lock doesn't
+    wait for ``loader`` either: it runs in the loader thread pool while the
+    stale snapshot is served. ``max_staleness`` counts from the moment the
+    snapshot expired (or was found outdated by this process), after that
+    the worker holding the lock waits for the new one.
+    """
+
+    poll_interval = 0.05
+
+    def __init__(
+        self, key, loader, timeout=300, alias="default", stale_timeout=None, lock_timeout=30, name=None, **kwargs
+    ):
+        super(CacheSource, self).__init__(loader, name=name or key, version_cache=alias, **kwargs)
+        self.key = key
+        self.lock_key = "%s:lock" % key
+        self.timeout = timeout
+        self.alias = alias
+        self.stale_timeout = timeout if stale_timeout is None else stale_timeout
+        self.lock_timeout = lock_timeout
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @property
+    def last_snapshot(self):
+        local = self._snapshot
+        return None if local is None else local[2]
+
+    @property
+    def version_cache(self):
+        return self.alias
+
+    def refresh(self, version):
+        """
+        Runs ``loader`` and stores the new snapshot in the cache.
+        """
+        expires = time.time() + self.timeout
+        snapshot = self.build_snapshot(version)
+        self.cache.set(self.key, (expires, version, snapshot), self.timeout + self.stale_timeout)
+        self._snapshot = (version, expires, snapshot)
+        self._stale_since = None
+        return snapshot
+
+    def _get_fresh(self, entry, version):
+        if entry is not None and entry[0] > time.time() and entry[1] == version:
+            self._snapshot = entry[1], entry[0], entry[2]
+            self._stale_since = None
+            return entry[2]
+        return None
+
+    def _get_stale(self, entry):
+        # The local snapshot of the same version is the same snapshot, and
+        # it's not unpickled again.
+        local = self._snapshot
+        if local is not None and local[0] == entry[1]:
+            return local[2]
+        return entry[2]
+
+    def _can_serve_stale(self, entry):
+        """
+        Whether the stale ``entry`` may be served while it's refreshed in
+        background.
+        """
+        if not self.background_refresh or entry is None:
+            return False
+        if self.max_staleness is None:
+            return True
+        now = time.time()
+        with self._refresh_lock:
+            if self._stale_since is None:
+                self._stale_since = now
+            stale_since = min(entry[0], self._stale_since)
+        return now - stale_since < self.max_staleness
+
+    def _refresh_in_background(self, version):
+        # Runs in the pool while this worker holds the lock.
+        try:
+            if self._get_fresh(self.cache.get(self.key), version) is None:
+                self.refresh(version)
+        except Exception:
+            logger.exception("Background refresh of %r failed.", self)
+        finally:
+            self.cache.delete(self.lock_key)
+            connections.close_all()
+
+    def get_snapshot(self):
+        version = self.version
+        local = self._snapshot
+        if local is not None and local[0] == version and local[1] > time.time():
+            self.report_requested(True)
+            return local[2]
+        snapshot, hit = self._get_from_cache(version)
+        self.report_requested(hit)
+        return snapshot
+
+    def _get_from_cache(self, version):
+        """
+        Returns ``(snapshot, hit)``.
+        """
+        cache = self.cache
+        entry = cache.get(self.key)
+        snapshot = self._get_fresh(entry, version)
+        if snapshot is not None:
+            return snapshot, True
+        deadline = time.time() + self.lock_timeout
+        while not cache.add(self.lock_key, 1, self.lock_timeout):
+            if entry is not None:
+                # Somebody else is reloading, the stale snapshot will do.
+                return self._get_stale(entry), True
+            if time.time() >= deadline:
+                return self.build_snapshot(version), False
+            time.sleep(self.poll_interval)
+            entry = cache.get(self.key)
+        if self._can_serve_stale(entry):
+            with self._refresh_lock:
+                self._refresh = get_executor().submit(self._refresh_in_background, version)
+            return self._get_stale(entry), True
+        try:
+            # The previous lock holder may have just stored a fresh one.
+            snapshot = self._get_fresh(cache.get(self.key), version)
+            if snapshot is not None:
+                return snapshot, True
+            return self.refresh(version), False
+        finally:
+            cache.delete(self.lock_key)
+
+    __call__ = get_snapshot
+
+    async def aget_snapshot(self):
+        local = self._snapshot
+        if local is not None and local[0] == self.version and local[1] > time.time():
+            self.report_requested(True)
+            return local[2]
+        # Cache calls are sync, the whole lookup goes to a thread.
+        return await sync_to_async(self.get_snapshot)()
+
+
+class ModelSource(ObjectSource):
+    """
+    Loads ``queryset`` (or all objects of a model) and invalidates itself
+    whenever an object of that model is saved or deleted, or the m2m
+    relations defined on it change (from either side), when the
+    transaction is committed. Changes of the objects and m2m relations of
+    any of ``dependencies`` models invalidate it too (useful when
+    ``__str__`` or ``queryset`` use related objects); m2m relations of
+    other models pointing to the model don't::
+
+        active_categories = ModelSource(Category.objects.filter(active=True))
+
+    With ``compact=True`` it builds a ``CompactSnapshot`` that keeps only
+    pks and labels; the objects are fetched when they are selected.
+
+    With ``path`` the compact snapshot is written to that file and mapped
+    read-only (see ``MappedSnapshot``), so processes on the host share its
+    memory. If the version counter is shared (see ``version_cache``),
+    processes map the file written by another one for the current version
+    instead of loading the objects themselves.
+
+    Other keyword arguments (e.g. ``background_refresh``) are passed to
+    ``ObjectSource``.
+    """
+
+    def __init__(self, queryset, name=None, dependencies=(), compact=False, path=None, **kwargs):
+        if isinstance(queryset, type) and issubclass(queryset, Model):
+            queryset = queryset._default_manager.all()
+        self.queryset = queryset
+        self.model = queryset.model
+        self.compact = compact or path is not None
+        self.path = path
+        self.dependencies = tuple(dependencies)
+        super(ModelSource, self).__init__(self.load_queryset, name=name or self.model._meta.label_lower, **kwargs)
+        for model in (self.model,) + self.dependencies:
+            post_save.connect(self._model_changed, sender=model)
+            post_delete.connect(self._model_changed, sender=model)
+        m2m_changed.connect(self._m2m_changed)
+
+    def load_queryset(self):
+        if self.compact:
+            # Objects are dropped right after their labels are taken.
+            return self.queryset.all().iterator()
+        return list(self.queryset.all())
+
+    def get_mapped_snapshot(self, version):
+        """
+        Maps the snapshot file if it has been written for ``version``,
+        returns ``None`` otherwise. Without a shared version counter every
+        process has its own versions, so a file left by another process
+        can't be trusted.
+        """
+        if self.version_cache is None:
+            return None
+        try:
+            snapshot = MappedSnapshot(self.path, model=self.model)
+        except (IOError, OSError, ValueError):
+            return None
+        return snapshot if snapshot.version == version else None
+
+    def build_snapshot(self, version):
+        if self.path is not None:
+            snapshot = self.get_mapped_snapshot(version)
+            if snapshot is not None:
+                return snapshot
+        return super(ModelSource, self).build_snapshot(version)
+
+    def make_snapshot(self, value, version):
+        # Compact snapshots iterate over the queryset here, so the query
+        # counts as build time.
+        if self.path is not None:
+            MappedSnapshot.write(self.path, CompactSnapshot.build(value, version, model=self.model))
+            return MappedSnapshot(self.path, model=self.model)
+        if self.compact:
+            return CompactSnapshot.build(value, version, model=self.model)
+        return super(ModelSource, self).make_snapshot(value, version)
+
+    def _invalidate_on_commit(self, using):
+        # Invalidated before the commit, another thread or process could
+        # build the new version from the old rows and keep it.
+        transaction.on_commit(self.invalidate, using=using)
+
+    def _model_changed(self, sender, using=None, **kwargs):
+        self._invalidate_on_commit(using)
+
+    def _m2m_changed(self, sender, action, using=None, **kwargs):
+        # ``sender`` is the through model, the same for both sides.
+        if action.startswith("post_") and any(
+            sender is f.remote_field.through
+            for model in (self.model,) + self.dependencies
+            for f in model._meta.many_to_many
+        ):
+            self._invalidate_on_commit(using)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Returns the thread pool shared by all concurrent loaders.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=get_setting("LOADER_THREADS"))
+    return _executor
+
+
+def _get_snapshot_in_thread(source):
+    try:
+        return source.get_snapshot()
+    finally:
+        # Pool threads are reused, don't leave DB connections opened.
+        connections.close_all()
+
+
+class _PoolLoads(object):
+    """
+    Snapshots of ``sources`` being got in the shared thread pool. Keeps the
+    time every loader started running at and the ones that have finished,
+    ``condition`` is notified of both.
+    """
+
+    def __init__(self, sources):
+        self.condition = threading.Condition()
+        self.started = {}
+        self.finished = set()
+        self.futures = {}
+        executor = get_executor()
+        for source in sources:
+            if id(source) not in self.futures:
+                self.futures[id(source)] = executor.submit(self._load, source)
+
+    def _load(self, source):
+        with self.condition:
+            self.started[id(source)] = time.time()
+            self.condition.notify_all()
+        try:
+            return _get_snapshot_in_thread(source)
+        finally:
+            with self.condition:
+                self.finished.add(id(source))
+                self.condition.notify_all()
+
+    def get_wait(self, sources, timeout, now):
+        """
+        Returns ``(waiting, until)``: whether any of ``sources`` is still
+        worth waiting for, and the time its timeout expires at (``None``
+        if there is none to expect).
+        """
+        waiting, until = False, None
+        for source in sources:
+            key = id(source)
+            if key in self.finished:
+                continue
+            if timeout is None or source.last_snapshot is None or key not in self.started:
+                # Queued loaders are timed from their start.
+                waiting = True
+                continue
+            expires = self.started[key] + timeout
+            if expires > now:
+                waiting = True
+                until = expires if until is None else min(until, expires)
+        return waiting, until
+
+
+def get_snapshots(sources, timeout=None, max_wait=None):
+    """
+    Gets snapshots of ``sources`` (``{name: source}``) concurrently in the
+    shared thread pool and returns ``{name: snapshot}``.
+
+    A source whose loader doesn't return within ``timeout`` seconds from
+    the moment it started running (the pool is shared with background
+    refreshes, so it may be queued first) or fails falls back to its last
+    snapshot; only if it has none we keep waiting for it (or raise its
+    error). A timed out loader keeps running, so the next call gets the
+    fresh snapshot.
+
+    The whole call waits for ``max_wait`` seconds at most
+    (``CACHED_MODELFORMS_LOADER_MAX_WAIT`` by default, ``None`` in the
+    setting for no limit). Sources that haven't returned by then fall back
+    to their last snapshot, ``concurrent.futures.TimeoutError`` is raised
+    if one has none.
+    """
+    if max_wait is None:
+        max_wait = get_setting("LOADER_MAX_WAIT")
+    deadline = None if max_wait is None else time.time() + max_wait
+    unique = list(dict((id(source), source) for source in list(sources.values())).values())
+    loads = _PoolLoads(unique)
+    with loads.condition:
+        while True:
+            now = time.time()
+            waiting, until = loads.get_wait(unique, timeout, now)
+            if not waiting or (deadline is not None and now >= deadline):
+                break
+            if deadline is not None:
+                until = deadline if until is None else min(until, deadline)
+            loads.condition.wait(None if until is None else until - now)
+        finished = set(loads.finished)
+    snapshots = {}
+    for name, source in list(sources.items()):
+        future = loads.futures[id(source)]
+        last_snapshot = source.last_snapshot
+        if id(source) in finished:
+            if last_snapshot is not None and future.exception() is not None:
+                snapshots[name] = last_snapshot
+            else:
+                snapshots[name] = future.result()
+        elif last_snapshot is not None:
+            snapshots[name] = last_snapshot
+        else:
+            raise TimeoutError("%r didn't return a snapshot within %s seconds." % (source, max_wait))
+    return snapshots
+
+
+def as_source(objects):
+    """
+    Wraps ``objects`` (a source, a callable, or the objects themselves)
+    into an ``ObjectSource``.
+    """
+    if isinstance(objects, ObjectSource):
+        return objects
+    if callable(objects):
+        return CallableSource(objects)
+    return ObjectSource(lambda: objects)
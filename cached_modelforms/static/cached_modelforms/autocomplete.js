@@ -0,0 +1,64 @@
+/*
+ * Adds a search box to every ``select.cached-autocomplete`` and fills the
+ * select with results from its ``data-autocomplete-url``.
+ */
+(function () {
+    "use strict";
+
+    function init(select) {
+        var input = document.createElement("input"),
+            timer = null;
+        input.type = "search";
+        input.className = "cached-autocomplete-search";
+        select.parentNode.insertBefore(input, select);
+
+        function hasOption(value) {
+            for (var i = 0; i < select.options.length; i++) {
+                if (select.options[i].value === value) {
+                    return true;
+                }
+            }
+            return false;
+        }
+
+        function search() {
+            var url = select.getAttribute("data-autocomplete-url"),
+                request = new XMLHttpRequest();
+            url += (url.indexOf("?") === -1 ? "?" : "&") + "q=" + encodeURIComponent(input.value);
+            request.open("GET", url);
+            request.onload = function () {
+                if (request.status !== 200) {
+                    return;
+                }
+                var data = JSON.parse(request.responseText), i, option;
+                // keep the selected options (and the empty one), replace the rest
+                for (i = select.options.length - 1; i >= 0; i--) {
+                    if (!select.options[i].selected && select.options[i].value !== "") {
+                        select.remove(i);
+                    }
+                }
+                for (i = 0; i < data.results.length; i++) {
+                    if (!hasOption(data.results[i].id)) {
+                        option = document.createElement("option");
+                        option.value = data.results[i].id;
+                        option.textContent = data.results[i].text;
+                        select.appendChild(option);
+                    }
+                }
+            };
+            request.send();
+        }
+
+        input.addEventListener("input", function () {
+            clearTimeout(timer);
+            timer = setTimeout(search, 250);
+        });
+    }
+
+    document.addEventListener("DOMContentLoaded", function () {
+        var selects = document.querySelectorAll("select.cached-autocomplete"), i;
+        for (i = 0; i < selects.length; i++) {
+            init(selects[i]);
+        }
+    });
+})();
@@ -0,0 +1,76 @@
+# -*- coding:utf-8 -*-
+"""
+Streaming of pages with huge select widgets: the template is rendered
+with a marker in place of every ``{% stream_field %}`` and the widgets are
+streamed in chunks between the parts of the page, see ``render_to_stream``.
+"""
+
+from __future__ import unicode_literals
+
+import re
+import uuid
+
+from django.template import loader
+
+# Context variable with the fields ``{% stream_field %}`` left to stream.
+STREAMED_FIELDS = "_cached_modelforms_streamed_fields"
+
+
+class StreamedFields(list):
+    """
+    Bound fields to stream, in the order of their markers in the page.
+    """
+
+    def __init__(self):
+        super(StreamedFields, self).__init__()
+        self.token = uuid.uuid4().hex
+        self.marker_re = re.compile(r"<!--stream:%s:(\d+)-->" % self.token)
+
+    def add(self, bound_field):
+        """
+        Adds ``bound_field`` and returns the marker to put in its place.
+        """
+        self.append(bound_field)
+        return "<!--stream:%s:%d-->" % (self.token, len(self) - 1)
+
+
+def stream_bound_field(bound_field):
+    """
+    Yields the markup of ``bound_field`` in chunks, if its widget has
+    ``stream()`` (``StreamingSelect``, ``StreamingSelectMultiple``), in one
+    piece otherwise.
+    """
+    widget = bound_field.field.widget
+    if not hasattr(widget, "stream"):
+        yield "%s" % bound_field
+        return
+    # The attributes ``BoundField.as_widget()`` would render.
+    attrs = bound_field.build_widget_attrs({}, widget)
+    if bound_field.auto_id and "id" not in widget.attrs:
+        attrs.setdefault("id", bound_field.auto_id)
+    for chunk in widget.stream(bound_field.html_name, bound_field.value(), attrs):
+        yield chunk
+
+
+def render_to_stream(template, context=None, request=None, using=None):
+    """
+    Renders ``template`` (a name or a template of a backend) and yields the
+    page with the fields of ``{% stream_field %}`` tags streamed in chunks::
+
+        return StreamingHttpResponse(render_to_stream('products/edit.html', {'form': form}, request))
+
+    The rest of the template is rendered before the first chunk.
+    """
+    if not hasattr(template, "render"):
+        template = loader.get_template(template, using=using)
+    fields = StreamedFields()
+    context = dict(context or {})
+    context[STREAMED_FIELDS] = fields
+    page = template.render(context, request)
+    start = 0
+    for match in fields.marker_re.finditer(page):
+        yield page[start : match.start()]
+        for chunk in stream_bound_field(fields[int(match.group(1))]):
+            yield chunk
+        start = match.end()
+    yield page[start:]
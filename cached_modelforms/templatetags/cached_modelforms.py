@@ -0,0 +1,26 @@
+# -*- coding:utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django import template
+from django.utils.safestring import mark_safe
+
+from ..streaming import STREAMED_FIELDS
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def stream_field(context, bound_field):
+    """
+    Renders ``bound_field``. When the template is rendered by
+    ``render_to_stream`` it leaves a marker instead, and the field is
+    streamed in its place::
+
+        {% load cached_modelforms %}
+        {% stream_field form.category %}
+    """
+    fields = context.get(STREAMED_FIELDS)
+    if fields is None:
+        return "%s" % bound_field
+    return mark_safe(fields.add(bound_field))
@@ -1,2 +1,13 @@
 from .test_fields import *  # noqa
 from .test_forms import *  # noqa
+from .test_sources import *  # noqa
+from .test_search import *  # noqa
+from .test_references import *  # noqa
+from .test_benchmarks import *  # noqa
+from .test_formsets import *  # noqa
+from .test_registry import *  # noqa
+from .test_rendering import *  # noqa
+from .test_dependent import *  # noqa
+from .test_subsets import *  # noqa
+from .test_streaming import *  # noqa
+from .test_bulk import *  # noqa
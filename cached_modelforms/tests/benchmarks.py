@@ -0,0 +1,146 @@
+# -*- coding:utf-8 -*-
+"""
+Benchmarks of cached fields against stock ``ModelChoiceField`` and
+``ModelMultipleChoiceField``.
+
+Run with ``python runtests.py --benchmark [N ...]``; for every number of
+objects ``N`` it measures form class creation, instantiation, validation,
+rendering and ``save()`` and prints wall time (best of several runs), peak
+memory allocated during one run and the number of queries.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import sys
+import time
+import tracemalloc
+
+from django import forms
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+try:
+    from django.utils.encoding import smart_unicode as smart_text
+except ImportError:
+    from django.utils.encoding import smart_text
+
+import cached_modelforms
+from cached_modelforms import ModelSource, ObjectSource
+from cached_modelforms.tests.models import (ModelWithForeignKeyAndM2m,
+                                            SimpleModel)
+
+SIZES = (10, 100, 1000, 10000, 100000)
+# Number of selected m2m values.
+SELECTED = 10
+
+
+def make_django_form(objects):
+    class Form(forms.ModelForm):
+        class Meta:
+            model = ModelWithForeignKeyAndM2m
+            fields = ["name", "fk_field", "m2m_field"]
+
+    return Form
+
+
+def make_cached_form(objects):
+    source = ObjectSource(lambda: objects)
+
+    class Form(cached_modelforms.ModelForm):
+        class Meta:
+            model = ModelWithForeignKeyAndM2m
+            fields = ["name", "fk_field", "m2m_field"]
+            objects = {"fk_field": source, "m2m_field": source}
+
+    return Form
+
+
+def make_compact_form(objects):
+    source = ModelSource(SimpleModel, compact=True)
+
+    class Form(cached_modelforms.ModelForm):
+        class Meta:
+            model = ModelWithForeignKeyAndM2m
+            fields = ["name", "fk_field", "m2m_field"]
+            objects = {"fk_field": source, "m2m_field": source}
+            lazy_objects = True
+
+    return Form
+
+
+IMPLEMENTATIONS = (
+    ("django", make_django_form),
+    ("cached", make_cached_form),
+    ("cached-compact-lazy", make_compact_form),
+)
+
+
+def measure(func, repeat):
+    """
+    Returns ``(best wall time, peak memory, number of queries)`` of
+    ``func``. Memory and queries are taken from a separate run, tracing
+    slows things down.
+    """
+    best = None
+    for i in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak, len(queries)
+
+
+def save(form):
+    with transaction.atomic():
+        form.save()
+        transaction.set_rollback(True)
+
+
+def run(size, repeat, out):
+    SimpleModel.objects.all().delete()
+    SimpleModel.objects.bulk_create(SimpleModel(name="obj%d" % i) for i in range(size))
+    objects = list(SimpleModel.objects.all())
+    data = {
+        "name": "name",
+        "fk_field": smart_text(objects[-1].pk),
+        "m2m_field": [smart_text(x.pk) for x in objects[:SELECTED]],
+    }
+    for name, make_form in IMPLEMENTATIONS:
+        form_class = make_form(objects)
+        # warm up snapshots
+        form_class(data).is_valid()
+
+        def validate():
+            form = form_class(data)
+            form.is_valid()
+            return form
+
+        phases = (
+            ("class", lambda: make_form(objects)),
+            ("init", lambda: form_class(data)),
+            ("validate", validate),
+            ("render", lambda: form_class(data).as_p()),
+            ("save", lambda: save(validate())),
+        )
+        for phase, func in phases:
+            elapsed, peak, queries = measure(func, repeat if size < 10000 else 1)
+            print(
+                "%-10s %-20s %7d %12.3f %12.1f %8d" % (phase, name, size, elapsed * 1000, peak / 1024.0, queries),
+                file=out,
+            )
+        out.flush()
+
+
+def main(args=(), out=sys.stdout):
+    sizes = [int(x) for x in args] or SIZES
+    print("%-10s %-20s %7s %12s %12s %8s" % ("phase", "form", "N", "time, ms", "peak, KiB", "queries"), file=out)
+    for size in sizes:
+        run(size, 5, out)
+    return 0
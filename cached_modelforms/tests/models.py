@@ -6,6 +6,9 @@ from django.db import models
 class SimpleModel(models.Model):
     name = models.CharField(max_length=8)
 
+    def __str__(self):
+        return self.name
+
 
 class ModelWithForeignKey(models.Model):
     name = models.CharField(max_length=8)
@@ -15,3 +18,19 @@ class ModelWithForeignKey(models.Model):
 class ModelWithM2m(models.Model):
     name = models.CharField(max_length=8)
     m2m_field = models.ManyToManyField(SimpleModel)
+
+
+class ModelWithForeignKeyAndM2m(models.Model):
+    name = models.CharField(max_length=8)
+    fk_field = models.ForeignKey(SimpleModel, on_delete=models.CASCADE, related_name="+")
+    m2m_field = models.ManyToManyField(SimpleModel, related_name="+")
+
+
+class ModelWithUniqueFields(models.Model):
+    name = models.CharField(max_length=8, unique=True)
+    fk_field = models.ForeignKey(SimpleModel, on_delete=models.CASCADE, related_name="+")
+    number = models.IntegerField()
+    m2m_field = models.ManyToManyField(SimpleModel, related_name="+", blank=True)
+
+    class Meta:
+        unique_together = [("fk_field", "number")]
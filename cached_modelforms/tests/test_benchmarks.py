@@ -0,0 +1,20 @@
+# -*- coding:utf-8 -*-
+
+from six import StringIO
+
+from cached_modelforms.tests.benchmarks import IMPLEMENTATIONS, main
+from cached_modelforms.tests.utils import SettingsTestCase
+
+
+class TestBenchmarks(SettingsTestCase):
+    def setUp(self):
+        self.settings_manager.set(INSTALLED_APPS=("cached_modelforms.tests",))
+
+    def test_benchmarks_run(self):
+        """
+        Benchmarks don't rot: every phase of every form runs.
+        """
+        out = StringIO()
+        self.assertEqual(main(["10"], out=out), 0)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 1 + len(IMPLEMENTATIONS) * 5)
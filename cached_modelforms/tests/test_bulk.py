@@ -0,0 +1,107 @@
+# -*- coding:utf-8 -*-
+
+try:
+    from django.utils.encoding import smart_unicode as smart_text
+except ImportError:
+    from django.utils.encoding import smart_text
+
+from cached_modelforms import ModelForm, ModelSource
+from cached_modelforms.tests.models import ModelWithUniqueFields, SimpleModel
+from cached_modelforms.tests.utils import SettingsTestCase
+
+
+class TestBulk(SettingsTestCase):
+    def setUp(self):
+        self.settings_manager.set(INSTALLED_APPS=("cached_modelforms.tests",))
+
+        self.objects = [SimpleModel.objects.create(name="name%d" % i) for i in range(3)]
+        self.keys = [smart_text(x.pk) for x in self.objects]
+        self.existing = ModelWithUniqueFields.objects.create(name="taken", fk_field=self.objects[0], number=1)
+        self.source = ModelSource(SimpleModel.objects.all(), compact=True)
+
+        class Form(ModelForm):
+            class Meta:
+                model = ModelWithUniqueFields
+                fields = ["name", "fk_field", "number", "m2m_field"]
+                objects = {"fk_field": self.source, "m2m_field": self.source}
+
+        self.Form = Form
+
+    def row(self, name, fk, number, m2m=()):
+        return {"name": name, "fk_field": self.keys[fk], "number": number, "m2m_field": [self.keys[x] for x in m2m]}
+
+    def test_validate_many(self):
+        rows = [
+            self.row("new1", 0, 2, [1, 2]),
+            self.row("taken", 1, 1),  # name exists
+            self.row("new2", 0, 1),  # (fk_field, number) exists
+            self.row("new1", 2, 5),  # name repeats the first row
+            {"name": "new3", "fk_field": "-1", "number": 3},  # unknown object
+            self.row("new4", 2, 7, [0]),
+        ]
+        self.source.get_snapshot()
+        # snapshots are loaded already: one query for the objects of each
+        # cached field and one per unique check
+        with self.assertNumQueries(4):
+            results = self.Form.validate_many(rows)
+        self.assertEqual([x.is_valid() for x in results], [True, False, False, False, False, True])
+        self.assertEqual(list(results[1].errors), ["name"])
+        self.assertEqual(list(results[2].errors), ["__all__"])
+        self.assertEqual(list(results[3].errors), ["name"])
+        self.assertEqual(list(results[4].errors), ["fk_field"])
+        self.assertEqual(results[0].cleaned_data["fk_field"], self.objects[0])
+        self.assertEqual(results[0].cleaned_data["m2m_field"], self.objects[1:])
+        self.assertEqual(results[5].instance.fk_field, self.objects[2])
+        self.assertTrue(results[0].instance.pk is None)
+
+        # the same as validating them one by one, except for the repeated name
+        for row, result in list(zip(rows, results))[:3]:
+            form = self.Form(row)
+            self.assertEqual(form.is_valid(), result.is_valid())
+            self.assertEqual(form.errors, result.errors)
+
+    def test_validate_many_instances(self):
+        other = ModelWithUniqueFields.objects.create(name="other", fk_field=self.objects[1], number=1)
+        other.m2m_field.set([self.objects[2]])
+        results = self.Form.validate_many(
+            [self.row("taken", 0, 1), self.row("taken", 1, 1), self.row("new", 2, 2)],
+            instances=[self.existing, other, None],
+        )
+        # an instance doesn't conflict with itself
+        self.assertEqual([x.is_valid() for x in results], [True, False, True])
+        self.assertEqual(results[1].instance.pk, other.pk)
+
+        # every row must have its instance
+        rows = [self.row("new", 2, 2)]
+        for instances in [[], [self.existing, None]]:
+            with self.assertRaises(ValueError):
+                self.Form.validate_many(rows, instances=instances)
+
+    def test_validate_many_deleted_objects(self):
+        # objects kept in the snapshot but deleted from DB since
+        class Form(ModelForm):
+            class Meta:
+                model = ModelWithUniqueFields
+                fields = ["name", "fk_field", "number"]
+                objects = {"fk_field": lambda: self.objects}
+
+        Form.get_snapshots()
+        SimpleModel.objects.filter(pk=self.objects[2].pk).delete()
+        with self.assertNumQueries(3):
+            results = Form.validate_many([self.row("new1", 1, 1), self.row("new2", 2, 1)])
+        self.assertTrue(results[0].is_valid())
+        self.assertEqual(results[1].errors["fk_field"], Form(self.row("new2", 2, 1)).errors["fk_field"])
+
+    def test_validate_many_null_foreign_key(self):
+        class Form(ModelForm):
+            class Meta:
+                model = ModelWithUniqueFields
+                fields = ["name", "fk_field", "number"]
+                objects = {"fk_field": lambda: self.objects}
+
+        Form.get_snapshots()
+        # the object of the snapshot has no pk anymore
+        self.objects[2].delete()
+        row = self.row("new", 2, 1)
+        result = Form.validate_many([row])[0]
+        self.assertEqual(result.errors["fk_field"], Form(row).errors["fk_field"])
@@ -0,0 +1,106 @@
+# -*- coding:utf-8 -*-
+
+import json
+
+from django import forms
+from django.test import RequestFactory
+
+try:
+    from django.utils.encoding import smart_unicode as smart_text
+except ImportError:
+    from django.utils.encoding import smart_text
+
+from cached_modelforms import (CachedDependentChoiceField,
+                               CachedModelChoiceField, CompactSnapshot,
+                               ModelForm, ObjectSnapshot, ObjectSource)
+from cached_modelforms.forms import DependentFieldsMixin
+from cached_modelforms.tests.models import ModelWithForeignKey, SimpleModel
+from cached_modelforms.tests.utils import SettingsTestCase
+from cached_modelforms.views import ChildrenView
+
+
+class TestDependent(SettingsTestCase):
+    def setUp(self):
+        self.settings_manager.set(INSTALLED_APPS=("cached_modelforms.tests",))
+
+        self.parents = [SimpleModel.objects.create(name=name) for name in ["p1", "p2", "p3"]]
+        p1, p2, p3 = self.parents
+        self.children = [
+            ModelWithForeignKey.objects.create(name=name, fk_field=parent)
+            for name, parent in [("c1", p1), ("c2", p2), ("c3", p1)]
+        ]
+        self.parent_source = ObjectSource(lambda: self.parents)
+        self.children_source = ObjectSource(lambda: [(x.pk, x) for x in self.children])
+
+        class Form(DependentFieldsMixin, forms.Form):
+            parent = CachedModelChoiceField(objects=self.parent_source)
+            child = CachedDependentChoiceField(objects=self.children_source, parent="parent", parent_attr="fk_field")
+
+        self.Form = Form
+
+    def key(self, obj):
+        return smart_text(obj.pk)
+
+    def test_children_index(self):
+        p1, p2, p3 = [self.key(x) for x in self.parents]
+        c1, c2, c3 = [self.key(x) for x in self.children]
+        snapshot = ObjectSnapshot.build([(x.pk, x) for x in self.children])
+        index = snapshot.get_children_index("fk_field")
+        self.assertTrue(snapshot.get_children_index("fk_field") is index)
+        self.assertEqual(index.get_parent(c3), p1)
+        self.assertEqual([pk for pk, label in index.get_children(p1)], [c1, c3])
+        self.assertEqual(index.get_children(p3), ())
+        self.assertTrue(index.get_choices(p2, "---") is index.get_choices(p2, "---"))
+        self.assertEqual(index.get_choices(p2, "---")[0], ("", "---"))
+        # unknown parents are not cached one by one
+        self.assertTrue(index.get_choices("-1") is index.get_choices("-2"))
+
+        compact = CompactSnapshot.build(self.children)
+        self.assertEqual(dict(compact.get_children_index("fk_field").parents), dict(index.parents))
+
+    def test_form(self):
+        p1, p2, p3 = [self.key(x) for x in self.parents]
+        c1, c2, c3 = [self.key(x) for x in self.children]
+
+        form = self.Form({"parent": p1, "child": c3})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data["child"], self.children[2])
+        self.assertEqual([pk for pk, label in form.fields["child"].choices], ["", c1, c3])
+
+        # a child of another parent
+        form = self.Form({"parent": p2, "child": c3})
+        self.assertFalse(form.is_valid())
+        self.assertTrue(form.errors["child"])
+
+        # choices come from the shared index, the base field is untouched
+        form1, form2 = self.Form({"parent": p1}), self.Form(initial={"parent": self.parents[0]})
+        self.assertTrue(form1.fields["child"].choices.shared is form2.fields["child"].choices.shared)
+        self.assertEqual(len(self.Form.base_fields["child"].choices), 4)
+
+        # no parent, no children
+        form = self.Form({"child": c1})
+        self.assertFalse(form.is_valid())
+        self.assertEqual(list(form.fields["child"].choices), [("", "---------")])
+
+    def test_model_form(self):
+        # SimpleModel objects grouped by their name, the parent here
+        class Form(ModelForm):
+            fk_field = CachedDependentChoiceField(objects=self.parent_source, parent="name")
+
+            class Meta:
+                model = ModelWithForeignKey
+                fields = ["name", "fk_field"]
+
+        p1, p2, p3 = [self.key(x) for x in self.parents]
+        form = Form(instance=self.children[1])
+        self.assertEqual([pk for pk, label in form.fields["fk_field"].choices], [""])
+        form = Form(instance=ModelWithForeignKey(name="p2", fk_field=self.parents[1]))
+        self.assertEqual([pk for pk, label in form.fields["fk_field"].choices], ["", p2])
+        self.assertTrue(Form({"name": "p3", "fk_field": p3}).is_valid())
+        self.assertFalse(Form({"name": "p3", "fk_field": p2}).is_valid())
+
+    def test_children_view(self):
+        view = ChildrenView.as_view(source=self.children_source, parent_attr="fk_field")
+        response = view(RequestFactory().get("/", {"parent": self.key(self.parents[0])}))
+        data = json.loads(response.content.decode("utf-8"))
+        self.assertEqual([x["id"] for x in data["results"]], [self.key(self.children[0]), self.key(self.children[2])])
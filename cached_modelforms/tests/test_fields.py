@@ -1,5 +1,7 @@
 # -*- coding:utf-8 -*-
 
+import copy
+
 from django import forms
 
 try:
@@ -140,3 +142,58 @@ class TestFields(SettingsTestCase):
 
         self.assertEqual(field.objects, field2.objects)
         self.assertEqual(field.choices, field2.choices)
+
+    def test_modelchoicefield_objects_view(self):
+        field = CachedModelChoiceField(objects=self.cached_list)
+        self.assertTrue(field.objects_view is field.snapshot.objects)
+        self.assertEqual(dict(field.objects_view), field.objects)
+        with self.assertRaises(TypeError):
+            field.objects_view["-1"] = self.obj1
+
+    def test_deepcopy_shares_snapshot(self):
+        form1 = self.FormMultiple()
+        form2 = self.FormMultiple()
+        field1, field2 = form1.fields["obj"], form2.fields["obj"]
+        self.assertFalse(field1 is field2)
+        self.assertTrue(field1.objects_view is field2.objects_view)
+        self.assertTrue(field1.choices.shared is field2.choices.shared)
+        self.assertTrue(field1.widget.choices is field1.choices)
+        self.assertFalse(field1.widget is field2.widget)
+
+        # changing the choices in place copies them for that field only
+        field1.choices.append(("x", "extra"))
+        self.assertEqual(len(field1.choices), 4)
+        self.assertEqual(field1.widget.choices[-1], ("x", "extra"))
+        self.assertTrue(field1.choices.shared is None)
+        self.assertEqual(len(field2.choices), 3)
+        self.assertEqual(len(self.FormMultiple.base_fields["obj"].choices), 3)
+
+        # assigned choices are shared by the copies as well, until changed
+        field1.choices = [("1", "one")]
+        field3 = copy.deepcopy(field1)
+        self.assertTrue(field3.choices.shared is field1.choices.shared)
+        field3.choices.append(("2", "two"))
+        self.assertEqual(field3.choices, [("1", "one"), ("2", "two")])
+        self.assertEqual(field1.choices, [("1", "one")])
+        field3.choices = [("2", "two")]
+        self.assertEqual(field1.choices, [("1", "one")])
+        self.assertEqual(field1.widget.choices, [("1", "one")])
+        self.assertEqual(len(field2.choices), 3)
+
+    def test_modelmultiplechoicefield_resolve_many(self):
+        field = CachedModelMultipleChoiceField(objects=self.cached_list, max_choices=2)
+        pk1, pk2, pk3 = [smart_text(x.pk) for x in self.cached_list]
+
+        # duplicates are skipped, order is kept
+        self.assertEqual(field.clean([pk2, pk1, pk2]), [self.obj2, self.obj1])
+
+        # every invalid value is reported
+        with self.assertRaises(forms.ValidationError) as cm:
+            field.clean(["-1", "-2"])
+        self.assertEqual([e.code for e in cm.exception.error_list], ["invalid_choice", "invalid_choice"])
+        self.assertEqual([e.params["value"] for e in cm.exception.error_list], ["-1", "-2"])
+
+        # too many values
+        with self.assertRaises(forms.ValidationError) as cm:
+            field.clean([pk1, pk2, pk3])
+        self.assertEqual(cm.exception.error_list[0].code, "max_choices")
@@ -1,6 +1,9 @@
 # -*- coding:utf-8 -*-
 
+from unittest import mock
+
 from django.db.models import CharField
+from django.db.models.signals import m2m_changed
 from django.forms import Textarea
 
 try:
@@ -12,6 +15,8 @@ from django.forms.models import ModelChoiceField, ModelMultipleChoiceField
 
 from cached_modelforms import (CachedModelChoiceField,
                                CachedModelMultipleChoiceField, ModelForm)
+from cached_modelforms import forms
+from cached_modelforms.forms import model_to_dict, models_to_dicts
 from cached_modelforms.tests.models import (ModelWithForeignKey, ModelWithM2m,
                                             SimpleModel)
 from cached_modelforms.tests.utils import SettingsTestCase
@@ -163,3 +168,136 @@ class TestForms(SettingsTestCase):
         new_obj = form.save()
         form = self.ModelFormMultipleWithInitials(instance=new_obj)
         self.assertEqual(set(form.initial["m2m_field"]), set([self.obj1.pk, self.obj2.pk]))
+
+    def test_load_m2m_initials(self):
+        """
+        M2m initials of many instances are loaded with one query per m2m
+        field, forms don't query DB for them then.
+        """
+        instances = []
+        for related in [[self.obj1, self.obj2], [self.obj3], []]:
+            instance = ModelWithM2m.objects.create(name="name")
+            instance.m2m_field.set(related)
+            instances.append(instance)
+
+        with self.assertNumQueries(2):
+            instances = self.ModelFormMultiple.load_m2m_initials(ModelWithM2m.objects.all())
+        with self.assertNumQueries(0):
+            forms = [self.ModelFormMultiple(instance=instance) for instance in instances]
+        self.assertEqual(
+            [sorted(form.initial["m2m_field"]) for form in forms],
+            [sorted([self.obj1.pk, self.obj2.pk]), [self.obj3.pk], []],
+        )
+
+        # fields with ``Meta.m2m_initials`` are skipped
+        instances = list(ModelWithM2m.objects.all())
+        with self.assertNumQueries(0):
+            self.ModelFormMultipleWithInitials.load_m2m_initials(instances)
+
+    def test_model_to_dict(self):
+        instance = ModelWithForeignKey.objects.create(name="name", fk_field=self.obj1)
+        self.assertEqual(model_to_dict(instance), {"id": instance.pk, "name": "name", "fk_field": self.obj1.pk})
+        self.assertEqual(model_to_dict(instance, fields=["name"]), {"name": "name"})
+        # excluded fields are left out
+        self.assertEqual(model_to_dict(instance, exclude=["name"]), {"id": instance.pk, "fk_field": self.obj1.pk})
+
+        class Form(ModelForm):
+            class Meta:
+                model = ModelWithForeignKey
+                exclude = ["name"]
+                objects = {"fk_field": self.get_objects}
+
+        # the plan is compiled with the form class
+        self.assertEqual(Form._meta.initial_data_plan.names, frozenset(["id", "fk_field"]))
+        self.assertEqual(Form(instance=instance).initial, {"id": instance.pk, "fk_field": self.obj1.pk})
+
+    def test_models_to_dicts(self):
+        for related in [[self.obj1, self.obj2], [self.obj3]]:
+            instance = ModelWithM2m.objects.create(name="name")
+            instance.m2m_field.set(related)
+
+        # the queryset and the through table
+        with self.assertNumQueries(2):
+            data = models_to_dicts(ModelWithM2m.objects.order_by("pk"), exclude=["id"])
+        self.assertEqual(
+            [dict(x, m2m_field=sorted(x["m2m_field"])) for x in data],
+            [
+                {"name": "name", "m2m_field": sorted([self.obj1.pk, self.obj2.pk])},
+                {"name": "name", "m2m_field": [self.obj3.pk]},
+            ],
+        )
+
+    def test_m2m_saves_changes_only(self):
+        """
+        Cached m2m fields insert the added pks and delete the removed ones,
+        without reading the relations first.
+        """
+        pk1, pk2, pk3 = [smart_text(x.pk) for x in [self.obj1, self.obj2, self.obj3]]
+        # without ``ignore_conflicts`` the pks in DB are read before inserting
+        insert_queries = 1 if forms.CAN_IGNORE_CONFLICTS else 2
+        form = self.ModelFormMultiple({"m2m_field": [pk1, pk2], "name": "Name1"})
+        self.assertTrue(form.is_valid())
+        # the instance and the relations
+        with self.assertNumQueries(1 + insert_queries):
+            instance = form.save()
+        self.assertEqual(set(instance.m2m_field.all()), set([self.obj1, self.obj2]))
+
+        changes = []
+
+        def on_m2m_changed(sender, action, pk_set, **kwargs):
+            changes.append((action, pk_set))
+
+        m2m_changed.connect(on_m2m_changed, sender=ModelWithM2m.m2m_field.through)
+        try:
+            form = self.ModelFormMultiple({"m2m_field": [pk2, pk3], "name": "Name1"}, instance=instance)
+            self.assertTrue(form.is_valid())
+            # the instance, one delete and one insert
+            with self.assertNumQueries(2 + insert_queries):
+                form.save()
+            self.assertEqual(set(instance.m2m_field.all()), set([self.obj2, self.obj3]))
+            self.assertEqual(
+                changes,
+                [
+                    ("pre_remove", set([self.obj1.pk])),
+                    ("post_remove", set([self.obj1.pk])),
+                    ("pre_add", set([self.obj3.pk])),
+                    ("post_add", set([self.obj3.pk])),
+                ],
+            )
+
+            # nothing has changed, nothing to save
+            form = self.ModelFormMultiple({"m2m_field": [pk3, pk2], "name": "Name1"}, instance=instance)
+            self.assertTrue(form.is_valid())
+            with self.assertNumQueries(1):
+                form.save()
+        finally:
+            m2m_changed.disconnect(on_m2m_changed, sender=ModelWithM2m.m2m_field.through)
+
+    def test_m2m_saves_changes_updates_loaded_initials(self):
+        """
+        Initials loaded by ``load_m2m_initials`` follow the saved changes.
+        """
+        instance = ModelWithM2m.objects.create(name="name")
+        instance.m2m_field.set([self.obj1, self.obj2])
+        instance = self.ModelFormMultiple.load_m2m_initials(ModelWithM2m.objects.filter(pk=instance.pk))[0]
+        form = self.ModelFormMultiple({"m2m_field": [smart_text(self.obj3.pk)], "name": "name"}, instance=instance)
+        form.save()
+
+        form = self.ModelFormMultiple({"m2m_field": [smart_text(self.obj1.pk)], "name": "name"}, instance=instance)
+        self.assertEqual(form.initial["m2m_field"], [self.obj3.pk])
+        form.save()
+        self.assertEqual(list(instance.m2m_field.all()), [self.obj1])
+
+    def test_m2m_saves_changes_without_ignore_conflicts(self):
+        """
+        Before Django 2.2 the added pks that are already in DB are skipped
+        by hand.
+        """
+        instance = ModelWithM2m.objects.create(name="name")
+        instance.m2m_field.set([self.obj1])
+        with mock.patch.object(forms, "CAN_IGNORE_CONFLICTS", False):
+            # the initial is outdated, obj1 is in DB already
+            forms.save_m2m_changes(
+                instance, ModelWithM2m._meta.get_field("m2m_field"), [], [self.obj1.pk, self.obj2.pk]
+            )
+        self.assertEqual(set(instance.m2m_field.all()), set([self.obj1, self.obj2]))
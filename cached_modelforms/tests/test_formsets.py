@@ -0,0 +1,115 @@
+# -*- coding:utf-8 -*-
+
+try:
+    from django.utils.encoding import smart_unicode as smart_text
+except ImportError:
+    from django.utils.encoding import smart_text
+
+from cached_modelforms import (CachedModelChoiceField, ModelForm,
+                               ObjectSource)
+from cached_modelforms.formsets import (inlineformset_factory,
+                                        modelformset_factory)
+from cached_modelforms.tests.models import (ModelWithForeignKeyAndM2m,
+                                            SimpleModel)
+from cached_modelforms.tests.utils import SettingsTestCase
+
+
+class TestFormsets(SettingsTestCase):
+    def setUp(self):
+        self.settings_manager.set(INSTALLED_APPS=("cached_modelforms.tests",))
+
+        self.obj1 = SimpleModel.objects.create(name="name1")
+        self.obj2 = SimpleModel.objects.create(name="name2")
+        self.obj3 = SimpleModel.objects.create(name="name3")
+        self.pk1, self.pk2, self.pk3 = [smart_text(x.pk) for x in [self.obj1, self.obj2, self.obj3]]
+        self.calls = 0
+
+    def load(self):
+        self.calls += 1
+        return [self.obj1, self.obj2, self.obj3]
+
+    def test_modelformset_shares_snapshots(self):
+        source = ObjectSource(self.load)
+
+        class Form(ModelForm):
+            obj = CachedModelChoiceField(objects=source, required=False)
+
+            class Meta:
+                model = ModelWithForeignKeyAndM2m
+                fields = ["name", "fk_field", "m2m_field"]
+                # bare callables are called for every form otherwise
+                objects = {"fk_field": self.load, "m2m_field": self.load}
+
+        FormSet = modelformset_factory(ModelWithForeignKeyAndM2m, form=Form, extra=3)
+        self.calls = 0
+        formset = FormSet(queryset=ModelWithForeignKeyAndM2m.objects.none())
+        forms = list(formset) + [formset.empty_form]
+        self.assertEqual(self.calls, 2)
+        for name in ["fk_field", "m2m_field", "obj"]:
+            snapshots = set(id(form.fields[name].snapshot) for form in forms)
+            self.assertEqual(len(snapshots), 1)
+
+        data = {
+            "form-TOTAL_FORMS": "2",
+            "form-INITIAL_FORMS": "0",
+            "form-0-name": "row1",
+            "form-0-fk_field": self.pk1,
+            "form-0-m2m_field": [self.pk2, self.pk3],
+            "form-1-name": "row2",
+            "form-1-fk_field": self.pk2,
+            "form-1-m2m_field": [self.pk1],
+        }
+        formset = FormSet(data, queryset=ModelWithForeignKeyAndM2m.objects.none())
+        self.assertTrue(formset.is_valid(), formset.errors)
+        instances = formset.save()
+        self.assertEqual([x.fk_field for x in instances], [self.obj1, self.obj2])
+        self.assertEqual(set(instances[0].m2m_field.all()), set([self.obj2, self.obj3]))
+
+    def test_form_kwargs_objects(self):
+        class Form(ModelForm):
+            class Meta:
+                model = ModelWithForeignKeyAndM2m
+                fields = ["name", "fk_field", "m2m_field"]
+                objects = {"fk_field": self.load, "m2m_field": self.load}
+
+        FormSet = modelformset_factory(ModelWithForeignKeyAndM2m, form=Form, extra=2)
+        formset = FormSet(
+            queryset=ModelWithForeignKeyAndM2m.objects.none(), form_kwargs={"objects": {"fk_field": [self.obj1]}}
+        )
+        for form in formset:
+            self.assertEqual(list(form.fields["fk_field"].objects), [self.pk1])
+            self.assertEqual(len(form.fields["m2m_field"].objects), 3)
+
+    def test_inlineformset(self):
+        class Form(ModelForm):
+            class Meta:
+                model = ModelWithForeignKeyAndM2m
+                fields = ["name", "m2m_field"]
+                objects = {"m2m_field": self.load}
+
+        FormSet = inlineformset_factory(SimpleModel, ModelWithForeignKeyAndM2m, form=Form, fk_name="fk_field", extra=3)
+        self.calls = 0
+        formset = FormSet(instance=self.obj1)
+        forms = list(formset) + [formset.empty_form]
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(len(set(id(form.fields["m2m_field"].snapshot) for form in forms)), 1)
+
+    def test_m2m_initials(self):
+        class Form(ModelForm):
+            class Meta:
+                model = ModelWithForeignKeyAndM2m
+                fields = ["name", "fk_field", "m2m_field"]
+                objects = {"fk_field": self.load, "m2m_field": self.load}
+
+        for i in range(5):
+            instance = ModelWithForeignKeyAndM2m.objects.create(name="row%d" % i, fk_field=self.obj1)
+            instance.m2m_field.set([self.obj2, self.obj3])
+
+        FormSet = modelformset_factory(ModelWithForeignKeyAndM2m, form=Form, extra=0)
+        formset = FormSet()
+        # the queryset and the m2m initials of all of its objects
+        with self.assertNumQueries(2):
+            forms = list(formset)
+        self.assertEqual(len(forms), 5)
+        for form in forms:
+            self.assertEqual(sorted(form.initial["m2m_field"]), sorted([self.obj2.pk, self.obj3.pk]))
@@ -0,0 +1,84 @@
+# -*- coding:utf-8 -*-
+
+from django import forms
+
+try:
+    from django.utils.encoding import smart_unicode as smart_text
+except ImportError:
+    from django.utils.encoding import smart_text
+
+from cached_modelforms import (CachedModelChoiceField,
+                               CachedModelMultipleChoiceField, ModelForm,
+                               ModelSource)
+from cached_modelforms.references import LazyReference
+from cached_modelforms.tests.models import (ModelWithForeignKeyAndM2m,
+                                            SimpleModel)
+from cached_modelforms.tests.utils import SettingsTestCase
+
+
+class TestReferences(SettingsTestCase):
+    def setUp(self):
+        self.settings_manager.set(INSTALLED_APPS=("cached_modelforms.tests",))
+
+        self.obj1 = SimpleModel.objects.create(name="name1")
+        self.obj2 = SimpleModel.objects.create(name="name2")
+        self.obj3 = SimpleModel.objects.create(name="name3")
+        self.pk1, self.pk2, self.pk3 = [smart_text(x.pk) for x in [self.obj1, self.obj2, self.obj3]]
+
+        self.source = ModelSource(SimpleModel, compact=True)
+
+    def test_lazy_fields(self):
+        class Form(forms.Form):
+            single = CachedModelChoiceField(objects=self.source, lazy=True)
+            multiple = CachedModelMultipleChoiceField(objects=self.source, lazy=True)
+
+        form = Form({"single": self.pk1, "multiple": [self.pk2, self.pk3]})
+        with self.assertNumQueries(0):
+            self.assertTrue(form.is_valid())
+        single = form.cleaned_data["single"]
+        self.assertTrue(isinstance(single, LazyReference))
+        with self.assertNumQueries(0):
+            self.assertEqual(single.pk, self.obj1.pk)
+            self.assertEqual(single, self.obj1)
+            self.assertEqual(form.cleaned_data["multiple"], [self.obj2, self.obj3])
+
+        # references of one field are resolved together
+        with self.assertNumQueries(1):
+            self.assertEqual(form.cleaned_data["multiple"][0].name, "name2")
+            self.assertEqual(form.cleaned_data["multiple"][1].name, "name3")
+        with self.assertNumQueries(1):
+            self.assertEqual(str(single), "name1")
+
+        # invalid values are still rejected
+        form = Form({"single": "-1", "multiple": ["-1"]})
+        self.assertFalse(form.is_valid())
+        self.assertEqual(set(form.errors), set(["single", "multiple"]))
+
+    def test_deleted_object(self):
+        field = CachedModelChoiceField(objects=self.source.get_snapshot(), lazy=True)
+        self.obj1.delete()
+        ref = field.clean(self.pk1)
+        with self.assertRaises(SimpleModel.DoesNotExist):
+            ref.name
+
+    def test_modelform_lazy_objects(self):
+        class Form(ModelForm):
+            class Meta:
+                model = ModelWithForeignKeyAndM2m
+                fields = ["name", "fk_field", "m2m_field"]
+                objects = {"fk_field": self.source, "m2m_field": self.source}
+                lazy_objects = True
+
+        form = Form({"name": "Name1", "fk_field": self.pk1, "m2m_field": [self.pk2, self.pk3]})
+        self.assertTrue(form.is_valid())
+        instance = form.save()
+        self.assertEqual(instance.fk_field_id, self.obj1.pk)
+        self.assertEqual(set(instance.m2m_field.all()), set([self.obj2, self.obj3]))
+        # nothing has been fetched
+        self.assertFalse(form.cleaned_data["fk_field"].is_resolved)
+        self.assertFalse(any(x.is_resolved for x in form.cleaned_data["m2m_field"]))
+
+        # all references of the form are resolved in one query
+        with self.assertNumQueries(1):
+            self.assertEqual(form.cleaned_data["fk_field"].name, "name1")
+            self.assertEqual(form.cleaned_data["m2m_field"][0].name, "name2")
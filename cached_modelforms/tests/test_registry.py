@@ -0,0 +1,111 @@
+# -*- coding:utf-8 -*-
+
+import threading
+from io import StringIO
+
+from django.apps import apps
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test.utils import override_settings
+
+from cached_modelforms import ModelForm, ModelSource, ObjectSource
+from cached_modelforms.registry import (AlreadyRegistered, SourceRegistry,
+                                        registry)
+from cached_modelforms.tests.models import ModelWithForeignKey, SimpleModel
+from cached_modelforms.tests.utils import SettingsTestCase
+
+
+class TestRegistry(SettingsTestCase):
+    def setUp(self):
+        self.settings_manager.set(INSTALLED_APPS=("cached_modelforms.tests",))
+
+        self.objects = [SimpleModel(pk=1, name="name1"), SimpleModel(pk=2, name="name2")]
+        self.calls = 0
+
+    def load(self):
+        self.calls += 1
+        return self.objects
+
+    def test_register(self):
+        registry = SourceRegistry()
+        source = registry.register(ObjectSource(self.load, name="objects"))
+        self.assertTrue(registry.get_sources()["objects"] is source)
+
+        @registry.register(name="decorated")
+        def load():
+            return self.objects
+
+        self.assertTrue(isinstance(load, ObjectSource))
+        self.assertEqual(list(registry), ["objects", "decorated"])
+
+        # lambdas have no name
+        with self.assertRaises(ValueError):
+            registry.register(lambda: [])
+
+        # names are unique, the same source may be registered again
+        self.assertTrue(registry.register(source) is source)
+        with self.assertRaises(AlreadyRegistered):
+            registry.register(ObjectSource(self.load, name="objects"))
+        with self.assertRaises(AlreadyRegistered):
+            registry.register(ModelSource(SimpleModel.objects.filter(name="a")))
+            registry.register(ModelSource(SimpleModel.objects.filter(name="b")))
+        self.assertTrue(registry.get_sources()["objects"] is source)
+
+        @registry.register_form
+        class Form(ModelForm):
+            class Meta:
+                model = ModelWithForeignKey
+                fields = ["name", "fk_field"]
+                objects = {"fk_field": source}
+
+        name = "%s.Form.fk_field" % __name__
+        self.assertTrue(registry.get_sources([name])[name] is source)
+
+    def test_warm(self):
+        registry = SourceRegistry()
+        source = registry.register(ObjectSource(self.load, name="objects"))
+
+        @registry.register(name="broken")
+        def broken():
+            raise ValueError("broken")
+
+        results = dict((name, (snapshot, error)) for name, snapshot, error in registry.warm())
+        self.assertTrue(results["objects"][0] is source.get_snapshot())
+        self.assertTrue(isinstance(results["broken"][1], ValueError))
+        self.assertEqual(self.calls, 1)
+
+        # only the given sources
+        source.invalidate()
+        self.assertEqual([name for name, snapshot, error in registry.warm(["objects"])], ["objects"])
+        self.assertEqual(self.calls, 2)
+
+        source.invalidate()
+        registry.warm_in_background(["objects"]).join(5)
+        self.assertEqual(self.calls, 3)
+
+    def test_command(self):
+        source = registry.register(ObjectSource(self.load, name="test_command"))
+        self.addCleanup(registry.unregister, "test_command")
+
+        out = StringIO()
+        call_command("warm_cached_modelforms", "test_command", stdout=out)
+        self.assertTrue("test_command: 2 objects" in out.getvalue())
+        self.assertTrue(source.last_snapshot is not None)
+
+        out = StringIO()
+        call_command("warm_cached_modelforms", list=True, stdout=out)
+        self.assertTrue("test_command" in out.getvalue().split())
+
+        with self.assertRaises(CommandError):
+            call_command("warm_cached_modelforms", "unknown", stdout=StringIO())
+
+    def test_warm_on_ready(self):
+        registry.register(ObjectSource(self.load, name="test_warm_on_ready"))
+        self.addCleanup(registry.unregister, "test_warm_on_ready")
+
+        with override_settings(CACHED_MODELFORMS_WARM_ON_READY=["test_warm_on_ready"]):
+            apps.get_app_config("cached_modelforms").ready()
+        for thread in threading.enumerate():
+            if thread.name == "cached_modelforms-warm":
+                thread.join(5)
+        self.assertEqual(self.calls, 1)
@@ -0,0 +1,79 @@
+# -*- coding:utf-8 -*-
+
+from django import forms
+
+try:
+    from django.utils.encoding import smart_unicode as smart_text
+except ImportError:
+    from django.utils.encoding import smart_text
+
+from cached_modelforms import (CachedModelChoiceField,
+                               CachedModelMultipleChoiceField, ObjectSource)
+from cached_modelforms.rendering import OptionsHTML
+from cached_modelforms.tests.models import SimpleModel
+from cached_modelforms.tests.utils import SettingsTestCase
+from cached_modelforms.widgets import (PrerenderedSelect,
+                                       PrerenderedSelectMultiple)
+
+
+class TestRendering(SettingsTestCase):
+    def setUp(self):
+        self.settings_manager.set(INSTALLED_APPS=("cached_modelforms.tests",))
+
+        self.objects = [SimpleModel.objects.create(name=name) for name in ["one", "<two>", "three & four"]]
+        self.source = ObjectSource(lambda: self.objects)
+
+        class Form(forms.Form):
+            single = CachedModelChoiceField(objects=self.source, widget=PrerenderedSelect(attrs={"class": "x"}))
+            multiple = CachedModelMultipleChoiceField(objects=self.source, widget=PrerenderedSelectMultiple)
+
+        class PlainForm(forms.Form):
+            single = CachedModelChoiceField(objects=self.source, widget=forms.Select(attrs={"class": "x"}))
+            multiple = CachedModelMultipleChoiceField(objects=self.source)
+
+        self.Form = Form
+        self.PlainForm = PlainForm
+
+    def test_options_html(self):
+        options = OptionsHTML([("1", "a"), ("2", "<b>"), ("1", "c")])
+        self.assertEqual(options.render(), options.html)
+        self.assertEqual(options.render(["3"]), options.html)
+        self.assertHTMLEqual(
+            options.render(["2", "1"]),
+            '<option value="1" selected>a</option><option value="2" selected>&lt;b&gt;</option>'
+            '<option value="1">c</option>',
+        )
+
+    def test_same_html_as_select(self):
+        pks = [smart_text(x.pk) for x in self.objects]
+        for initial in [{}, {"single": pks[1], "multiple": [pks[0], pks[2]]}]:
+            form, plain_form = self.Form(initial=initial), self.PlainForm(initial=initial)
+            for name in ["single", "multiple"]:
+                self.assertHTMLEqual(form[name].as_widget(), plain_form[name].as_widget())
+
+    def test_built_once_per_snapshot(self):
+        form1, form2 = self.Form(), self.Form()
+        snapshot = form1.fields["single"].snapshot
+        self.assertTrue(form2.fields["single"].snapshot is snapshot)
+        options = snapshot.get_options_html_for(form1.fields["single"].choices)
+        self.assertTrue(isinstance(options, OptionsHTML))
+        form1["single"].as_widget()
+        form2["single"].as_widget()
+        self.assertTrue(snapshot.get_options_html_for(form2.fields["single"].choices) is options)
+
+    def test_assigned_choices(self):
+        # choices that are not the snapshot's ones are rendered as usual
+        form = self.Form()
+        form.fields["single"].choices = [("1", "only")]
+        html = form["single"].as_widget()
+        self.assertIn("only", html)
+        self.assertNotIn("three", html)
+
+    def test_changed_choices(self):
+        # choices changed in place are copied and rendered as usual
+        form1, form2 = self.Form(), self.Form()
+        form1.fields["single"].choices.sort(key=lambda choice: -len(choice[1]))
+        form1.fields["single"].choices.append(("x", "extra"))
+        self.assertIn("extra", form1["single"].as_widget())
+        self.assertNotIn("extra", form2["single"].as_widget())
+        self.assertHTMLEqual(form2["single"].as_widget(), self.PlainForm()["single"].as_widget())
@@ -0,0 +1,91 @@
+# -*- coding:utf-8 -*-
+
+import json
+from unittest import mock
+
+from django import forms
+from django.test import RequestFactory
+
+try:
+    from django.utils.encoding import smart_unicode as smart_text
+except ImportError:
+    from django.utils.encoding import smart_text
+
+from cached_modelforms import (CachedModelChoiceField,
+                               CachedModelMultipleChoiceField, ObjectSnapshot,
+                               ObjectSource)
+from cached_modelforms.search import SearchIndex
+from cached_modelforms.tests.models import SimpleModel
+from cached_modelforms.tests.utils import SettingsTestCase
+from cached_modelforms.views import AutocompleteView
+from cached_modelforms.widgets import (AutocompleteSelect,
+                                       AutocompleteSelectMultiple)
+
+
+class TestSearch(SettingsTestCase):
+    def setUp(self):
+        self.settings_manager.set(INSTALLED_APPS=("cached_modelforms.tests",))
+
+        self.objects = [SimpleModel.objects.create(name=name) for name in ["red car", "Red bus", "blue car", "green"]]
+        self.source = ObjectSource(lambda: self.objects)
+
+    def test_search_index(self):
+        index = SearchIndex([("1", "red car"), ("2", "Red bus"), ("3", "blue car"), ("4", "green")])
+        self.assertEqual(index.search("re"), (2, [("1", "red car"), ("2", "Red bus")]))
+        self.assertEqual(index.search("RED c"), (1, [("1", "red car")]))
+        self.assertEqual(index.search("car", offset=1, limit=1), (2, [("3", "blue car")]))
+        self.assertEqual(index.search("ar"), (0, []))
+        self.assertEqual(index.search("")[0], 4)
+
+    def test_snapshot_search(self):
+        snapshot = ObjectSnapshot.build(self.objects)
+        self.assertTrue(snapshot.search_index is snapshot.search_index)
+        total, results = snapshot.search("car")
+        self.assertEqual(total, 2)
+        self.assertEqual(results, [(smart_text(x.pk), x.name) for x in self.objects if "car" in x.name])
+
+    def test_autocomplete_view(self):
+        view = AutocompleteView.as_view(source=self.source, paginate_by=1)
+        response = view(RequestFactory().get("/", {"q": "car", "page": "2"}))
+        data = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(data["results"], [{"id": smart_text(self.objects[2].pk), "text": "blue car"}])
+        self.assertEqual(data["pagination"], {"more": False})
+
+        response = view(RequestFactory().get("/", {"q": "car"}))
+        data = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(data["pagination"], {"more": True})
+
+    def test_autocomplete_view_reuses_index(self):
+        class View(AutocompleteView):
+            source = self.objects
+
+        views = [AutocompleteView.as_view(source=self.objects), AutocompleteView.as_view(source=lambda: self.objects)]
+        for view in views + [View.as_view()]:
+            with mock.patch("cached_modelforms.snapshots.SearchIndex", side_effect=SearchIndex) as index_class:
+                for query in ["r", "re", "red"]:
+                    view(RequestFactory().get("/", {"q": query}))
+            self.assertEqual(index_class.call_count, 1)
+
+    def test_autocomplete_widget(self):
+        class Form(forms.Form):
+            single = CachedModelChoiceField(objects=self.source, widget=AutocompleteSelect(url="/search/"))
+            multiple = CachedModelMultipleChoiceField(
+                objects=self.source, widget=AutocompleteSelectMultiple(url="/search/")
+            )
+
+        form = Form(initial={"single": self.objects[1].pk, "multiple": [self.objects[0].pk, self.objects[3].pk]})
+        html = form["single"].as_widget()
+        self.assertIn('data-autocomplete-url="/search/"', html)
+        self.assertIn("Red bus", html)
+        self.assertNotIn("blue car", html)
+        self.assertEqual(html.count("<option"), 2)
+
+        html = form["multiple"].as_widget()
+        self.assertIn("red car", html)
+        self.assertIn("green", html)
+        self.assertEqual(html.count("<option"), 2)
+        self.assertEqual(html.count("selected"), 2)
+
+        # the field still validates against all the objects
+        form = Form({"single": smart_text(self.objects[2].pk), "multiple": [smart_text(self.objects[2].pk)]})
+        self.assertTrue(form.is_valid())
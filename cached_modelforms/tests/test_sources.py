@@ -0,0 +1,703 @@
+# -*- coding:utf-8 -*-
+
+import asyncio
+import copy
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import TimeoutError
+
+from asgiref.sync import async_to_sync
+from django import forms
+from django.core.cache import cache
+from django.db import transaction
+from django.test.utils import override_settings
+
+try:
+    from django.utils.encoding import smart_unicode as smart_text
+except ImportError:
+    from django.utils.encoding import smart_text
+
+from cached_modelforms import (CachedModelChoiceField,
+                               CachedModelMultipleChoiceField,
+                               CompactSnapshot, MappedSnapshot, ModelForm,
+                               ModelSource, ObjectSnapshot, ObjectSource)
+from cached_modelforms.signals import snapshot_built, snapshot_requested
+from cached_modelforms.conf import get_setting
+from cached_modelforms.sources import (CacheSource, CallableSource,
+                                       get_executor, get_snapshots)
+from cached_modelforms.tests.models import (ModelWithForeignKey,
+                                            ModelWithForeignKeyAndM2m,
+                                            ModelWithM2m, SimpleModel)
+from cached_modelforms.tests.utils import SettingsTestCase
+
+
+class TestSources(SettingsTestCase):
+    def setUp(self):
+        self.settings_manager.set(INSTALLED_APPS=("cached_modelforms.tests",))
+
+        self.obj1 = SimpleModel.objects.create(name="name1")
+        self.obj2 = SimpleModel.objects.create(name="name2")
+        self.obj3 = SimpleModel.objects.create(name="name3")
+
+        self.cached_list = [self.obj1, self.obj2, self.obj3]
+        self.calls = 0
+
+    def load(self):
+        self.calls += 1
+        return list(self.cached_list)
+
+    def test_snapshot_is_read_only(self):
+        snapshot = ObjectSnapshot.build(self.cached_list)
+        self.assertEqual(set(snapshot.objects.keys()), set(smart_text(x.pk) for x in self.cached_list))
+        with self.assertRaises(TypeError):
+            snapshot.objects["-1"] = self.obj1
+        choices = snapshot.get_choices("---")
+        self.assertEqual(choices[0], ("", "---"))
+        with self.assertRaises(TypeError):
+            choices.append(("-1", "name"))
+        # copies of shared choices are the same object
+        self.assertTrue(copy.deepcopy(choices) is choices)
+        self.assertTrue(snapshot.get_choices("---") is choices)
+
+    def test_snapshot_pickling(self):
+        snapshot = pickle.loads(pickle.dumps(ObjectSnapshot.build(self.cached_list, version=3)))
+        self.assertEqual(snapshot.version, 3)
+        self.assertEqual(list(snapshot.choices), [(smart_text(x.pk), smart_text(x)) for x in self.cached_list])
+
+    def test_source_builds_snapshot_once_per_version(self):
+        source = ObjectSource(self.load)
+        field1 = CachedModelChoiceField(objects=source)
+        field2 = CachedModelChoiceField(objects=source)
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(field1.snapshot is field2.snapshot)
+        self.assertTrue(field1.choices.shared is field2.choices.shared)
+
+        self.cached_list = self.cached_list[:2]
+        source.invalidate()
+        field3 = CachedModelChoiceField(objects=source)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(len(field3.objects), 2)
+
+    def test_callable_source_reuses_snapshot_for_same_result(self):
+        source = CallableSource(lambda: self.cached_list)
+        snapshot = source.get_snapshot()
+        self.assertTrue(source.get_snapshot() is snapshot)
+
+        self.cached_list = self.cached_list[:2]
+        self.assertFalse(source.get_snapshot() is snapshot)
+
+    def test_signals(self):
+        built = []
+        requested = []
+
+        def on_built(sender, **kwargs):
+            built.append(kwargs)
+
+        def on_requested(sender, **kwargs):
+            requested.append((sender, kwargs["name"], kwargs["hit"]))
+
+        snapshot_built.connect(on_built)
+        snapshot_requested.connect(on_requested)
+        try:
+            source = ObjectSource(self.load, name="signals")
+            snapshot = source.get_snapshot()
+            source.get_snapshot()
+            self.assertEqual(requested, [(ObjectSource, "signals", False), (ObjectSource, "signals", True)])
+            self.assertEqual(len(built), 1)
+            self.assertTrue(built[0]["source"] is source)
+            self.assertTrue(built[0]["snapshot"] is snapshot)
+            self.assertEqual(built[0]["size"], 3)
+            self.assertTrue(built[0]["memory"] > 0)
+            self.assertTrue(built[0]["load_duration"] >= 0)
+            self.assertTrue(built[0]["build_duration"] >= 0)
+
+            cache.clear()
+            del requested[:]
+            source = CacheSource("test_cache_source", self.load, timeout=60)
+            source.get_snapshot()
+            source.get_snapshot()
+            # another process gets it from the cache
+            CacheSource("test_cache_source", self.load, timeout=60).get_snapshot()
+            self.assertEqual([hit for sender, name, hit in requested], [False, True, True])
+            self.assertEqual(len(built), 2)
+        finally:
+            snapshot_built.disconnect(on_built)
+            snapshot_requested.disconnect(on_requested)
+
+    def test_modelform_shares_snapshot(self):
+        source = ObjectSource(self.load)
+
+        class Form(ModelForm):
+            class Meta:
+                model = ModelWithForeignKey
+                fields = ["name", "fk_field"]
+                objects = {"fk_field": source}
+
+        form1 = Form()
+        form2 = Form({"name": "Name1", "fk_field": smart_text(self.obj2.pk)})
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(form1.fields["fk_field"].snapshot is form2.fields["fk_field"].snapshot)
+        self.assertTrue(form2.is_valid())
+        self.assertEqual(form2.cleaned_data["fk_field"], self.obj2)
+
+    def test_cache_source(self):
+        cache.clear()
+        source = CacheSource("test_cache_source", self.load, timeout=60)
+        snapshot = source.get_snapshot()
+        self.assertEqual(len(snapshot), 3)
+        self.assertEqual(len(source.get_snapshot()), 3)
+        self.assertEqual(self.calls, 1)
+
+        # invalidated snapshot gets reloaded
+        self.cached_list = self.cached_list[:2]
+        source.invalidate()
+        self.assertEqual(len(source.get_snapshot()), 2)
+        self.assertEqual(self.calls, 2)
+
+    def test_cache_source_stampede_protection(self):
+        cache.clear()
+        source = CacheSource("test_cache_source", self.load, timeout=60)
+        source.get_snapshot()
+        source.invalidate()
+
+        # another worker is reloading: the stale snapshot is served
+        cache.add(source.lock_key, 1)
+        self.assertEqual(len(source.get_snapshot()), 3)
+        self.assertEqual(self.calls, 1)
+
+        # the lock is released, the snapshot is reloaded
+        cache.delete(source.lock_key)
+        self.cached_list = self.cached_list[:1]
+        self.assertEqual(len(source.get_snapshot()), 1)
+        self.assertEqual(self.calls, 2)
+        self.assertTrue(cache.get(source.lock_key) is None)
+
+    def test_cache_source_cold_wait(self):
+        cache.clear()
+        source = CacheSource("test_cache_source", self.load, timeout=60, lock_timeout=0)
+        cache.add(source.lock_key, 1)
+        # nothing to serve and the lock holder is too slow: load directly
+        self.assertEqual(len(source.get_snapshot()), 3)
+        self.assertEqual(self.calls, 1)
+
+    def test_cache_source_background_refresh(self):
+        cache.clear()
+        event = threading.Event()
+        source = CacheSource("test_cache_source", self.load, timeout=60, background_refresh=True)
+        snapshot = source.get_snapshot()
+
+        def slow_load():
+            event.wait(5)
+            return self.load()
+
+        source.loader = slow_load
+        self.cached_list = self.cached_list[:2]
+        source.invalidate()
+        # the worker that got the lock serves the stale snapshot too
+        started = time.time()
+        self.assertTrue(source.get_snapshot() is snapshot)
+        self.assertTrue(cache.get(source.lock_key) is not None)
+        self.assertTrue(source.get_snapshot() is snapshot)
+        self.assertTrue(time.time() - started < 1)
+        refresh = source._refresh
+        event.set()
+        refresh.result(5)
+        self.assertTrue(cache.get(source.lock_key) is None)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(len(source.get_snapshot()), 2)
+
+    def test_cache_source_background_refresh_max_staleness(self):
+        cache.clear()
+        source = CacheSource("test_cache_source", self.load, timeout=60, background_refresh=True, max_staleness=0)
+        source.get_snapshot()
+        self.cached_list = self.cached_list[:2]
+        source.invalidate()
+        # too stale to be served, the lock holder waits for the new one
+        self.assertEqual(len(source.get_snapshot()), 2)
+        self.assertTrue(cache.get(source.lock_key) is None)
+
+    def test_model_source_invalidation(self):
+        source = ModelSource(SimpleModel.objects.filter(name__startswith="name"))
+
+        class Form(forms.Form):
+            obj = CachedModelChoiceField(objects=source)
+
+        class Form2(ModelForm):
+            class Meta:
+                model = ModelWithForeignKey
+                fields = ["name", "fk_field"]
+                objects = {"fk_field": source}
+
+        self.assertEqual(len(Form().fields["obj"].objects), 3)
+        self.assertEqual(len(Form2().fields["fk_field"].objects), 3)
+        version = source.version
+
+        with self.run_on_commit_callbacks():
+            obj4 = SimpleModel.objects.create(name="name4")
+        self.assertTrue(source.version > version)
+        self.assertTrue(smart_text(obj4.pk) in Form().fields["obj"].objects)
+        self.assertTrue(smart_text(obj4.pk) in Form2().fields["fk_field"].objects)
+
+        with self.run_on_commit_callbacks():
+            obj4.delete()
+        self.assertEqual(len(Form().fields["obj"].objects), 3)
+
+        # saving an object that isn't in the queryset invalidates it as well
+        version = source.version
+        self.obj1.name = "other"
+        with self.run_on_commit_callbacks():
+            self.obj1.save()
+        self.assertTrue(source.version > version)
+        self.assertEqual(len(Form().fields["obj"].objects), 2)
+
+    def test_model_source_invalidation_on_commit(self):
+        """
+        Sources are invalidated when the transaction that changed the
+        objects is committed, not before: a snapshot loaded in between
+        would keep the old objects under the new version.
+        """
+        source = ModelSource(SimpleModel)
+        self.assertEqual(len(source.get_snapshot()), 3)
+        version = source.version
+        with self.run_on_commit_callbacks():
+            with transaction.atomic():
+                SimpleModel.objects.create(name="name4")
+                self.assertEqual(source.version, version)
+            self.assertEqual(source.version, version)
+        self.assertTrue(source.version > version)
+        self.assertEqual(len(source.get_snapshot()), 4)
+
+        # nothing is invalidated when the transaction is rolled back
+        version = source.version
+        with self.run_on_commit_callbacks():
+            try:
+                with transaction.atomic():
+                    SimpleModel.objects.create(name="name5")
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(source.version, version)
+
+    def test_model_source_m2m_invalidation(self):
+        source = ModelSource(ModelWithM2m)
+        instance = ModelWithM2m.objects.create(name="name")
+        version = source.version
+        with self.run_on_commit_callbacks():
+            instance.m2m_field.add(self.obj1)
+        self.assertTrue(source.version > version)
+
+        # the reverse side is tracked too
+        version = source.version
+        with self.run_on_commit_callbacks():
+            self.obj2.modelwithm2m_set.add(instance)
+        self.assertTrue(source.version > version)
+
+        # relations of other models pointing to the model are not, from
+        # either side
+        source = ModelSource(SimpleModel)
+        version = source.version
+        with self.run_on_commit_callbacks():
+            instance.m2m_field.add(self.obj3)
+            self.obj3.modelwithm2m_set.remove(instance)
+        self.assertEqual(source.version, version)
+
+        # unless the other model is a dependency
+        source = ModelSource(SimpleModel, dependencies=[ModelWithM2m])
+        version = source.version
+        with self.run_on_commit_callbacks():
+            instance.m2m_field.add(self.obj3)
+        self.assertTrue(source.version > version)
+        version = source.version
+        with self.run_on_commit_callbacks():
+            self.obj3.modelwithm2m_set.remove(instance)
+        self.assertTrue(source.version > version)
+
+    def test_shared_version(self):
+        """
+        Sources with the same name in different processes share the
+        version counter kept in ``CACHED_MODELFORMS_VERSION_CACHE``.
+        """
+        cache.clear()
+        with override_settings(CACHED_MODELFORMS_VERSION_CACHE="default", CACHED_MODELFORMS_VERSION_CHECK_INTERVAL=0):
+            source1 = ObjectSource(self.load, name="shared")
+            source2 = ObjectSource(self.load, name="shared")
+            self.assertEqual(len(source1.get_snapshot()), 3)
+            self.assertEqual(len(source2.get_snapshot()), 3)
+            self.assertEqual(self.calls, 2)
+
+            self.cached_list = self.cached_list[:2]
+            source1.invalidate()
+            self.assertEqual(len(source2.get_snapshot()), 2)
+            self.assertEqual(self.calls, 3)
+
+            # lambdas have no name, their versions stay per process
+            self.assertTrue(ObjectSource(lambda: []).version_cache is None)
+
+    def test_shared_version_evicted(self):
+        cache.clear()
+        with override_settings(CACHED_MODELFORMS_VERSION_CACHE="default", CACHED_MODELFORMS_VERSION_CHECK_INTERVAL=0):
+            source1 = ObjectSource(self.load, name="shared")
+            source2 = ObjectSource(self.load, name="shared")
+            source1.invalidate()
+            self.assertEqual(len(source2.get_snapshot()), 3)
+            self.assertEqual(self.calls, 1)
+
+            # the counter is evicted and a process that has never seen it
+            # invalidates the source: the version can't be one in use
+            cache.delete(source1.version_key)
+            self.cached_list = self.cached_list[:2]
+            ObjectSource(self.load, name="shared").invalidate()
+            self.assertEqual(len(source2.get_snapshot()), 2)
+            self.assertEqual(self.calls, 2)
+
+    def test_shared_version_check_interval(self):
+        cache.clear()
+        with override_settings(CACHED_MODELFORMS_VERSION_CACHE="default", CACHED_MODELFORMS_VERSION_CHECK_INTERVAL=60):
+            source1 = ObjectSource(self.load, name="shared")
+            source2 = ObjectSource(self.load, name="shared")
+            snapshot = source2.get_snapshot()
+            source1.invalidate()
+            # not checked again yet
+            self.assertTrue(source2.get_snapshot() is snapshot)
+            source2._version_checked = None
+            self.assertFalse(source2.get_snapshot() is snapshot)
+
+    def test_cache_source_keeps_local_snapshot(self):
+        cache.clear()
+        source = CacheSource("test_cache_source", self.load, timeout=60)
+        snapshot = source.get_snapshot()
+        self.assertTrue(source.get_snapshot() is snapshot)
+
+        # another process picks the snapshot up from the cache
+        other = CacheSource("test_cache_source", self.load, timeout=60)
+        self.assertEqual(len(other.get_snapshot()), 3)
+        self.assertEqual(self.calls, 1)
+
+        # and sees invalidation made by this one
+        other._version_checked = source._version_checked = None
+        other.invalidate()
+        self.assertFalse(source.get_snapshot() is snapshot)
+        self.assertEqual(self.calls, 2)
+
+    def test_async_loader(self):
+        async def aload():
+            self.calls += 1
+            return list(self.cached_list)
+
+        source = ObjectSource(aload)
+        snapshot = async_to_sync(source.aget_snapshot)()
+        self.assertEqual(len(snapshot), 3)
+        self.assertTrue(async_to_sync(source.aget_snapshot)() is snapshot)
+        # sync code gets the same snapshot
+        self.assertTrue(source.get_snapshot() is snapshot)
+        self.assertEqual(self.calls, 1)
+
+        source.invalidate()
+        self.assertEqual(len(source.get_snapshot()), 3)
+        self.assertEqual(self.calls, 2)
+
+    def test_async_loader_stampede(self):
+        async def aload():
+            self.calls += 1
+            await asyncio.sleep(0.01)
+            return list(self.cached_list)
+
+        source = ObjectSource(aload)
+
+        async def get_snapshots():
+            return await asyncio.gather(*[source.aget_snapshot() for i in range(5)])
+
+        snapshots = async_to_sync(get_snapshots)()
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(all(x is snapshots[0] for x in snapshots))
+
+        # a new version is loaded once too
+        source.invalidate()
+        snapshots = async_to_sync(get_snapshots)()
+        self.assertEqual(self.calls, 2)
+        self.assertTrue(all(x is source.get_snapshot() for x in snapshots))
+
+    def test_modelform_acreate(self):
+        async def aload():
+            self.calls += 1
+            return list(self.cached_list)
+
+        fk_source = ObjectSource(aload)
+        declared_source = ObjectSource(aload)
+
+        class Form(ModelForm):
+            obj = CachedModelChoiceField(objects=declared_source, required=False)
+
+            class Meta:
+                model = ModelWithForeignKey
+                fields = ["name", "fk_field"]
+                objects = {"fk_field": fk_source}
+
+        self.assertEqual(self.calls, 1)
+        declared_source.invalidate()
+        data = {"name": "Name1", "fk_field": smart_text(self.obj2.pk)}
+        form = async_to_sync(Form.acreate)(data)
+        self.assertEqual(self.calls, 3)
+        self.assertTrue(form.fields["fk_field"].snapshot is fk_source.get_snapshot())
+        self.assertTrue(form.fields["obj"].snapshot is declared_source.get_snapshot())
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data["fk_field"], self.obj2)
+
+    def test_async_loader_field(self):
+        async def aload():
+            self.calls += 1
+            return list(self.cached_list)
+
+        class Form(ModelForm):
+            obj = CachedModelChoiceField(objects=aload, required=False)
+
+            class Meta:
+                model = ModelWithForeignKey
+                fields = ["name"]
+
+        field = Form.base_fields["obj"]
+        self.assertTrue(isinstance(field.source, CallableSource))
+        self.assertEqual(len(field.objects), 3)
+        self.assertEqual(len(async_to_sync(field.source.aget_snapshot)()), 3)
+        form = Form({"name": "Name1", "obj": smart_text(self.obj1.pk)})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data["obj"], self.obj1)
+
+    def test_modelform_acreate_keeps_awaited_snapshots(self):
+        async def aload():
+            self.calls += 1
+            return list(self.cached_list)
+
+        class Form(ModelForm):
+            obj = CachedModelChoiceField(objects=aload, required=False)
+
+            class Meta:
+                model = ModelWithForeignKeyAndM2m
+                fields = ["name", "fk_field", "m2m_field"]
+                objects = {"fk_field": self.cached_list, "m2m_field": self.cached_list}
+
+        instance = ModelWithForeignKeyAndM2m.objects.create(name="name", fk_field=self.obj1)
+        instance.m2m_field.set([self.obj2, self.obj3])
+        data = {
+            "name": "Name1",
+            "fk_field": smart_text(self.obj2.pk),
+            "m2m_field": [smart_text(self.obj1.pk)],
+            "obj": smart_text(self.obj1.pk),
+        }
+        # neither the loader nor m2m initials touch sync code in the loop
+        form = async_to_sync(Form.acreate)(data, instance=instance)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(sorted(form.initial["m2m_field"]), sorted([self.obj2.pk, self.obj3.pk]))
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data["obj"], self.obj1)
+
+    def test_modelform_concurrent_loaders(self):
+        barrier = threading.Barrier(2, timeout=5)
+
+        def load():
+            # both loaders have to run at the same time to get past it
+            barrier.wait()
+            return list(self.cached_list)
+
+        class Form(ModelForm):
+            class Meta:
+                model = ModelWithForeignKeyAndM2m
+                fields = ["name", "fk_field", "m2m_field"]
+                objects = {"fk_field": ObjectSource(load), "m2m_field": ObjectSource(load)}
+                concurrent_loaders = True
+
+        form = Form()
+        self.assertEqual(len(form.fields["fk_field"].objects), 3)
+        self.assertEqual(len(form.fields["m2m_field"].objects), 3)
+
+    def test_modelform_loader_timeout(self):
+        event = threading.Event()
+        slow_source = ObjectSource(self.load)
+        slow_source.get_snapshot()
+        slow_source.invalidate()
+        slow_source.loader = lambda: event.wait(5) and []
+
+        class Form(ModelForm):
+            class Meta:
+                model = ModelWithForeignKeyAndM2m
+                fields = ["name", "fk_field", "m2m_field"]
+                objects = {"fk_field": ObjectSource(self.load), "m2m_field": slow_source}
+                concurrent_loaders = True
+                loader_timeout = 0.05
+
+        started = time.time()
+        form = Form()
+        self.assertTrue(time.time() - started < 1)
+        # the last good snapshot is used
+        self.assertEqual(len(form.fields["m2m_field"].objects), 3)
+        self.assertEqual(len(form.fields["fk_field"].objects), 3)
+        event.set()
+
+    def test_get_snapshots_timeout_counts_from_start(self):
+        release = threading.Event()
+        executor = get_executor()
+        # the pool is busy with other work for a while
+        busy = [executor.submit(release.wait, 5) for i in range(get_setting("LOADER_THREADS"))]
+        source = ObjectSource(self.load)
+        source.get_snapshot()
+        source.invalidate()
+        threading.Timer(0.3, release.set).start()
+        snapshots = get_snapshots({"a": source, "b": ObjectSource(self.load)}, timeout=0.2)
+        # not timed out while queued: the fresh snapshot is returned
+        self.assertTrue(snapshots["a"] is source.get_snapshot())
+        self.assertEqual(len(snapshots["b"]), 3)
+        for future in busy:
+            future.result()
+
+    def test_get_snapshots_max_wait(self):
+        event = threading.Event()
+        source = ObjectSource(lambda: event.wait(5) and [])
+        started = time.time()
+        with self.assertRaises(TimeoutError):
+            get_snapshots({"a": source, "b": ObjectSource(self.load)}, timeout=0.01, max_wait=0.1)
+        self.assertTrue(time.time() - started < 1)
+        event.set()
+
+    def test_compact_snapshot(self):
+        source = ModelSource(SimpleModel, compact=True)
+        snapshot = source.get_snapshot()
+        self.assertTrue(isinstance(snapshot, CompactSnapshot))
+        self.assertEqual(snapshot.choices, ObjectSnapshot.build(self.cached_list).choices)
+        self.assertTrue(smart_text(self.obj1.pk) in snapshot)
+        self.assertFalse("-1" in snapshot)
+
+        snapshot = pickle.loads(pickle.dumps(snapshot))
+        self.assertEqual(snapshot.model, SimpleModel)
+        self.assertEqual(len(snapshot), 3)
+        # no model instances kept
+        self.assertTrue(snapshot.approximate_size() < ObjectSnapshot.build(self.cached_list).approximate_size())
+
+    def test_compact_snapshot_fields(self):
+        source = ModelSource(SimpleModel, compact=True)
+
+        class Form(forms.Form):
+            single = CachedModelChoiceField(objects=source)
+            multiple = CachedModelMultipleChoiceField(objects=source)
+
+        pk1, pk2, pk3 = [smart_text(x.pk) for x in self.cached_list]
+        form = Form({"single": pk1, "multiple": [pk3, pk2]})
+        # one ``in_bulk`` query per field, only for the selected objects
+        with self.assertNumQueries(2):
+            self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data["single"], self.obj1)
+        self.assertEqual(form.cleaned_data["multiple"], [self.obj3, self.obj2])
+
+        # objects of the field are objects, not labels
+        field = form.fields["single"]
+        with self.assertNumQueries(1):
+            self.assertEqual(field.objects, dict((smart_text(x.pk), x) for x in self.cached_list))
+        self.assertEqual(len(field.objects_view), 3)
+        self.assertTrue(pk1 in field.objects_view)
+        with self.assertNumQueries(1):
+            self.assertEqual(field.objects_view[pk2], self.obj2)
+
+        # invalid values don't hit DB
+        form = Form({"single": "-1", "multiple": ["-1"]})
+        with self.assertNumQueries(0):
+            self.assertFalse(form.is_valid())
+
+        # objects deleted after the snapshot was built are invalid
+        snapshot = source.get_snapshot()
+        self.obj3.delete()
+        form = Form({"single": pk3, "multiple": [pk3]})
+        form.fields["single"].objects = form.fields["multiple"].objects = snapshot
+        self.assertFalse(form.is_valid())
+        self.assertEqual(set(form.errors), set(["single", "multiple"]))
+
+    def test_mapped_snapshot(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "snapshot")
+        compact = CompactSnapshot.build(self.cached_list, version=5)
+        MappedSnapshot.write(path, compact)
+        snapshot = MappedSnapshot(path)
+        self.assertEqual(snapshot.model, SimpleModel)
+        self.assertEqual(snapshot.version, 5)
+        self.assertEqual(len(snapshot), 3)
+        self.assertEqual(snapshot.choices, compact.choices)
+        self.assertEqual(dict(snapshot.labels), dict(compact.labels))
+        pk1, pk2, pk3 = [smart_text(x.pk) for x in self.cached_list]
+        self.assertTrue(pk2 in snapshot)
+        self.assertFalse("-1" in snapshot)
+        self.assertEqual(snapshot.labels[pk3], "name3")
+        self.assertEqual(snapshot.get_choices("---")[0], ("", "---"))
+        self.assertTrue(copy.deepcopy(snapshot.get_choices("---")) is snapshot.get_choices("---"))
+        self.assertEqual(snapshot.get_objects([pk1, "-1"]), {pk1: self.obj1})
+        self.assertEqual(snapshot.search("name2"), (1, [(pk2, "name2")]))
+
+        class Form(forms.Form):
+            single = CachedModelChoiceField(objects=snapshot)
+            multiple = CachedModelMultipleChoiceField(objects=snapshot)
+
+        form = Form({"single": pk1, "multiple": [pk3, pk2]})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data["multiple"], [self.obj3, self.obj2])
+        self.assertTrue('<option value="%s" selected>name3</option>' % pk3 in smart_text(form["multiple"]))
+
+        snapshot = pickle.loads(pickle.dumps(snapshot))
+        self.assertEqual(len(snapshot), 3)
+
+    def test_model_source_path(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "snapshot")
+        cache.clear()
+        with override_settings(CACHED_MODELFORMS_VERSION_CACHE="default", CACHED_MODELFORMS_VERSION_CHECK_INTERVAL=0):
+            source = ModelSource(SimpleModel, name="mapped", path=path)
+            snapshot = source.get_snapshot()
+            self.assertTrue(isinstance(snapshot, MappedSnapshot))
+            self.assertEqual(len(snapshot), 3)
+
+            # another process maps the file instead of loading the objects
+            other = ModelSource(SimpleModel, name="mapped", path=path)
+            with self.assertNumQueries(0):
+                self.assertEqual(other.get_snapshot().choices, snapshot.choices)
+
+            # a new version is loaded and written again
+            with self.run_on_commit_callbacks():
+                SimpleModel.objects.create(name="name4")
+            self.assertEqual(len(other.get_snapshot()), 4)
+            self.assertEqual(len(MappedSnapshot(path)), 4)
+            with self.assertNumQueries(0):
+                self.assertEqual(len(source.get_snapshot()), 4)
+
+    def test_background_refresh(self):
+        event = threading.Event()
+        source = ObjectSource(self.load, background_refresh=True)
+        snapshot = source.get_snapshot()
+
+        def slow_load():
+            event.wait(5)
+            return self.load()
+
+        source.loader = slow_load
+        self.cached_list = self.cached_list[:2]
+        source.invalidate()
+        # the outdated snapshot is served while the new one is loading
+        started = time.time()
+        self.assertTrue(source.get_snapshot() is snapshot)
+        self.assertTrue(source.get_snapshot() is snapshot)
+        self.assertTrue(time.time() - started < 1)
+        refresh = source._refresh
+        event.set()
+        refresh.result(5)
+        # one refresh for both requests
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(len(source.get_snapshot()), 2)
+
+    def test_background_refresh_max_staleness(self):
+        source = ObjectSource(self.load, background_refresh=True, max_staleness=0)
+        source.get_snapshot()
+        self.cached_list = self.cached_list[:2]
+        source.invalidate()
+        # too stale to be served, the request waits for the new one
+        self.assertEqual(len(source.get_snapshot()), 2)
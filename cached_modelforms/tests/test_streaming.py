@@ -0,0 +1,85 @@
+# -*- coding:utf-8 -*-
+
+from django import forms
+from django.template.backends.django import DjangoTemplates
+
+try:
+    from django.utils.encoding import smart_unicode as smart_text
+except ImportError:
+    from django.utils.encoding import smart_text
+
+from cached_modelforms import (CachedModelChoiceField,
+                               CachedModelMultipleChoiceField, ObjectSource)
+from cached_modelforms.rendering import iter_options
+from cached_modelforms.streaming import render_to_stream
+from cached_modelforms.tests.models import SimpleModel
+from cached_modelforms.tests.utils import SettingsTestCase
+from cached_modelforms.widgets import (StreamingSelect,
+                                       StreamingSelectMultiple)
+
+
+class TestStreaming(SettingsTestCase):
+    def setUp(self):
+        self.settings_manager.set(INSTALLED_APPS=("cached_modelforms.tests",))
+
+        self.objects = [SimpleModel.objects.create(name="name%d" % i) for i in range(5)]
+        self.objects.append(SimpleModel.objects.create(name="<&>"))
+        self.keys = [smart_text(x.pk) for x in self.objects]
+        source = ObjectSource(lambda: self.objects)
+
+        class Form(forms.Form):
+            single = CachedModelChoiceField(objects=source, widget=StreamingSelect(chunk_size=2))
+            multiple = CachedModelMultipleChoiceField(objects=source, widget=StreamingSelectMultiple)
+
+        class PlainForm(forms.Form):
+            single = CachedModelChoiceField(objects=source)
+            multiple = CachedModelMultipleChoiceField(objects=source)
+
+        self.Form = Form
+        self.PlainForm = PlainForm
+        self.engine = DjangoTemplates(
+            {
+                "NAME": "test",
+                "DIRS": [],
+                "APP_DIRS": False,
+                "OPTIONS": {"libraries": {"cached_modelforms": "cached_modelforms.templatetags.cached_modelforms"}},
+            }
+        )
+
+    def test_iter_options(self):
+        choices = [("1", "a"), ("2", "b"), ("group", [("3", "c"), ("1", "d")])]
+        self.assertEqual(len(list(iter_options(choices, chunk_size=1))), 3)
+        self.assertHTMLEqual(
+            "".join(iter_options(choices, ["1"])),
+            '<option value="1" selected>a</option><option value="2">b</option>'
+            '<optgroup label="group"><option value="3">c</option><option value="1">d</option></optgroup>',
+        )
+        self.assertEqual("".join(iter_options(choices, ["1"], multiple=True)).count("selected"), 2)
+
+    def test_same_html_as_select(self):
+        for data in [None, {"single": self.keys[5], "multiple": self.keys[1:3]}]:
+            form, plain_form = self.Form(data), self.PlainForm(data)
+            for name in ["single", "multiple"]:
+                self.assertHTMLEqual(form[name].as_widget(), plain_form[name].as_widget())
+        # one chunk per two options, plus the tags of select
+        form = self.Form()
+        chunks = list(form.fields["single"].widget.stream("single", None))
+        self.assertEqual(len(chunks), 6)
+
+    def test_render_to_stream(self):
+        template = self.engine.from_string(
+            "{% load cached_modelforms %}<form>{% stream_field form.single %}|{% stream_field form.multiple %}</form>"
+        )
+        form = self.Form({"single": self.keys[0]})
+        chunks = list(render_to_stream(template, {"form": form}))
+        self.assertTrue(len(chunks) > 5)
+        self.assertEqual(chunks[0], "<form>")
+        self.assertEqual(chunks[-1], "</form>")
+        self.assertHTMLEqual(
+            "".join(chunks), "<form>%s|%s</form>" % (form["single"].as_widget(), form["multiple"].as_widget())
+        )
+
+        # rendered as usual without render_to_stream
+        self.assertHTMLEqual(
+            template.render({"form": form}), "<form>%s|%s</form>" % (form["single"], form["multiple"])
+        )
@@ -0,0 +1,91 @@
+# -*- coding:utf-8 -*-
+
+import copy
+
+from django import forms
+
+try:
+    from django.utils.encoding import smart_unicode as smart_text
+except ImportError:
+    from django.utils.encoding import smart_text
+
+from cached_modelforms import (CachedModelChoiceField,
+                               CachedModelMultipleChoiceField, CompactSnapshot,
+                               ObjectSource)
+from cached_modelforms.tests.models import SimpleModel
+from cached_modelforms.tests.utils import SettingsTestCase
+from cached_modelforms.widgets import PrerenderedSelect
+
+
+class TestSubsets(SettingsTestCase):
+    def setUp(self):
+        self.settings_manager.set(INSTALLED_APPS=("cached_modelforms.tests",))
+
+        self.objects = [SimpleModel.objects.create(name=name) for name in ["red", "green", "blue", "red car"]]
+        self.keys = [smart_text(x.pk) for x in self.objects]
+        self.source = ObjectSource(lambda: self.objects)
+
+        class Form(forms.Form):
+            single = CachedModelChoiceField(objects=self.source, required=False, widget=PrerenderedSelect)
+            multiple = CachedModelMultipleChoiceField(objects=self.source, required=False)
+
+        self.Form = Form
+
+    def test_subset(self):
+        snapshot = self.source.get_snapshot()
+        k1, k2, k3, k4 = self.keys
+        subset = snapshot.subset(keys=[self.objects[0].pk, self.objects[2].pk, self.objects[3].pk])
+        self.assertTrue(subset.snapshot is snapshot)
+        self.assertTrue(k1 in subset and k2 not in subset and "-1" not in subset)
+        self.assertEqual(subset.choices, [(k1, "red"), (k3, "blue"), (k4, "red car")])
+        self.assertEqual(subset.get_choices("---")[:2], [("", "---"), (k1, "red")])
+        self.assertEqual(dict(subset.objects), {k1: self.objects[0], k3: self.objects[2], k4: self.objects[3]})
+        self.assertEqual(subset.get_objects([k1, k2]), {k1: self.objects[0]})
+        with self.assertRaises(KeyError):
+            subset.get_object(k2)
+        self.assertEqual(subset.search("red"), (2, [(k1, "red"), (k4, "red car")]))
+        self.assertEqual(subset.search("red", offset=1), (2, [(k4, "red car")]))
+
+        # subsets of subsets, predicates
+        narrower = subset.subset(predicate=lambda key: key != k1)
+        self.assertEqual(narrower.choices, [(k3, "blue"), (k4, "red car")])
+
+        compact = CompactSnapshot.build(self.objects).subset([self.objects[1].pk])
+        self.assertEqual(list(compact.get_objects([k1, k2]).values()), [self.objects[1]])
+
+    def test_restrict(self):
+        k1, k2, k3, k4 = self.keys
+        allowed = set([k1, k2])
+        form = self.Form({"single": k3, "multiple": [k1, k3]})
+        snapshot = form.fields["single"].snapshot
+        for name in ["single", "multiple"]:
+            form.fields[name].restrict(predicate=allowed.__contains__)
+        self.assertFalse(form.is_valid())
+        self.assertEqual(set(form.errors), set(["single", "multiple"]))
+        html = form["single"].as_widget()
+        self.assertIn("green", html)
+        self.assertNotIn("blue", html)
+        self.assertEqual(html.count("<option"), 3)
+
+        form = self.Form({"single": k2, "multiple": [k1, k2]})
+        form.fields["single"].restrict(keys=allowed)
+        form.fields["multiple"].restrict(keys=allowed)
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data["multiple"], self.objects[:2])
+
+        # the shared snapshot and other forms are not affected
+        self.assertTrue(form.fields["single"].snapshot.snapshot is snapshot)
+        self.assertEqual(len(snapshot), 4)
+        self.assertEqual(len(self.Form().fields["single"].choices), 5)
+        field = copy.deepcopy(form.fields["single"])
+        self.assertEqual(len(field.choices), 3)
+
+    def test_restricted_base_field(self):
+        k1, k2, k3, k4 = self.keys
+        self.Form.base_fields["single"].restrict(keys=[k1])
+        self.assertEqual(len(self.Form().fields["single"].choices), 2)
+        # a new version of the source is restricted too
+        self.source.invalidate()
+        form = self.Form()
+        self.assertFalse(form.fields["single"].snapshot.root is self.Form.base_fields["single"].snapshot.root)
+        self.assertEqual(list(form.fields["single"].choices), [("", "---------"), (k1, "red")])
@@ -8,9 +8,12 @@ easily revert them back when you're done.
 Snippet taken from: http://www.djangosnippets.org/snippets/1011/
 """
 
+from contextlib import contextmanager
+
 from django.apps import apps
 from django.conf import settings
 from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections
 from django.test import TestCase
 
 NO_SETTING = ("!", None)
@@ -67,3 +70,17 @@ class SettingsTestCase(TestCase):
 
     def tearDown(self):
         self.settings_manager.revert()
+
+    @contextmanager
+    def run_on_commit_callbacks(self, using=DEFAULT_DB_ALIAS):
+        """
+        Runs ``transaction.on_commit`` callbacks registered in the block at
+        its end, as if the test transaction was committed.
+        """
+        connection = connections[using]
+        start = len(connection.run_on_commit)
+        yield
+        callbacks = connection.run_on_commit[start:]
+        del connection.run_on_commit[start:]
+        for savepoint_ids, func in callbacks:
+            func()
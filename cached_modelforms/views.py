@@ -0,0 +1,77 @@
+# -*- coding:utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.http import JsonResponse
+from django.utils.decorators import classonlymethod
+from django.views.generic import View
+
+from .sources import as_source
+
+
+class SourceViewMixin(object):
+    """
+    Serves the snapshot of ``source``. It is wrapped into a source once in
+    ``as_view()``, not on every request, so a list or a bare callable
+    keeps its snapshot (and the indexes built on it) between requests.
+    """
+
+    source = None
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        source = initkwargs.get("source", cls.source)
+        if source is not None:
+            initkwargs["source"] = as_source(source)
+        return super(SourceViewMixin, cls).as_view(**initkwargs)
+
+    def get_snapshot(self):
+        return as_source(self.source).get_snapshot()
+
+
+class AutocompleteView(SourceViewMixin, View):
+    """
+    Searches the snapshot of ``source`` and returns a page of results as
+    JSON, in the format Select2 understands::
+
+        {"results": [{"id": "1", "text": "label"}, ...], "pagination": {"more": true}}
+
+    Query is taken from ``q`` GET parameter, page number from ``page``::
+
+        path('categories/search/', AutocompleteView.as_view(source=categories), name='category-search')
+    """
+
+    paginate_by = 20
+
+    def get(self, request, *args, **kwargs):
+        try:
+            page = max(int(request.GET.get("page", 1)), 1)
+        except ValueError:
+            page = 1
+        offset = (page - 1) * self.paginate_by
+        total, results = self.get_snapshot().search(request.GET.get("q", ""), offset, self.paginate_by)
+        return JsonResponse(
+            {
+                "results": [{"id": pk, "text": "%s" % label} for pk, label in results],
+                "pagination": {"more": offset + len(results) < total},
+            }
+        )
+
+
+class ChildrenView(SourceViewMixin, View):
+    """
+    Returns the children of a parent as JSON, from the ``ChildrenIndex``
+    of the snapshot of ``source`` by ``parent_attr``, in the same format
+    as ``AutocompleteView`` (without pagination)::
+
+        path('cities/', ChildrenView.as_view(source=cities, parent_attr='country'), name='cities')
+
+    Parent key is taken from ``parent`` GET parameter.
+    """
+
+    parent_attr = None
+
+    def get(self, request, *args, **kwargs):
+        index = self.get_snapshot().get_children_index(self.parent_attr)
+        children = index.get_children(request.GET.get("parent", ""))
+        return JsonResponse({"results": [{"id": pk, "text": "%s" % label} for pk, label in children]})
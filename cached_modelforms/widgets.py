@@ -0,0 +1,137 @@
+# -*- coding:utf-8 -*-
+"""
+Widgets that make use of the snapshot of a cached field.
+"""
+
+from __future__ import unicode_literals
+
+from django.forms.utils import flatatt
+from django.forms.widgets import Select, SelectMultiple
+from django.utils.html import conditional_escape
+from django.utils.safestring import mark_safe
+
+from .rendering import CHUNK_SIZE, iter_options
+
+
+class SnapshotWidgetMixin(object):
+    """
+    Widgets with this mixin get the snapshot of their field in
+    ``snapshot`` attribute (along with ``choices``).
+    """
+
+    snapshot = None
+
+
+class AutocompleteMixin(SnapshotWidgetMixin):
+    """
+    Renders only the selected options, the others are searched for with
+    ``AutocompleteView`` at ``url`` by ``autocomplete.js``.
+    """
+
+    def __init__(self, url, attrs=None, choices=()):
+        super(AutocompleteMixin, self).__init__(attrs, choices)
+        self.url = url
+
+    class Media:
+        js = ("cached_modelforms/autocomplete.js",)
+
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        attrs = super(AutocompleteMixin, self).build_attrs(base_attrs, extra_attrs)
+        attrs["data-autocomplete-url"] = "%s" % self.url
+        attrs["class"] = ("%s cached-autocomplete" % attrs.get("class", "")).strip()
+        return attrs
+
+    def optgroups(self, name, value, attrs=None):
+        if self.snapshot is None:
+            labels = dict(self.choices)
+        else:
+            labels = self.snapshot.labels
+        options = []
+        if self.choices and self.choices[0][0] == "":
+            # empty label
+            options.append(("", self.choices[0][1]))
+        options.extend((x, labels[x]) for x in value if x and x in labels)
+        groups = []
+        for index, (option_value, option_label) in enumerate(options):
+            selected = option_value in value
+            groups.append(
+                (None, [self.create_option(name, option_value, option_label, selected, index, attrs=attrs)], index)
+            )
+        return groups
+
+
+class AutocompleteSelect(AutocompleteMixin, Select):
+    pass
+
+
+class AutocompleteSelectMultiple(AutocompleteMixin, SelectMultiple):
+    pass
+
+
+class PrerenderedMixin(SnapshotWidgetMixin):
+    """
+    Renders the ``<option>`` tags pre-rendered and escaped once per
+    snapshot (see ``OptionsHTML``), only the selected ones are rendered
+    per form. Falls back to the regular rendering when the choices are not
+    the snapshot's ones.
+    """
+
+    def render(self, name, value, attrs=None, renderer=None):
+        options = None if self.snapshot is None else self.snapshot.get_options_html_for(self.choices)
+        if options is None:
+            return super(PrerenderedMixin, self).render(name, value, attrs, renderer)
+        attrs = self.build_attrs(self.attrs, attrs)
+        selected = self.format_value(value)
+        if self.allow_multiple_selected:
+            attrs["multiple"] = True
+        else:
+            selected = selected[:1]
+        return mark_safe(
+            '<select name="%s"%s>%s</select>' % (conditional_escape(name), flatatt(attrs), options.render(selected))
+        )
+
+
+class PrerenderedSelect(PrerenderedMixin, Select):
+    pass
+
+
+class PrerenderedSelectMultiple(PrerenderedMixin, SelectMultiple):
+    pass
+
+
+class StreamingMixin(object):
+    """
+    ``stream()`` yields the markup of the widget in chunks of
+    ``chunk_size`` options, in the order of ``choices``, so it can be sent
+    with ``StreamingHttpResponse`` (see ``render_to_stream``) without
+    building it as one string. ``render()`` joins the chunks.
+    """
+
+    chunk_size = CHUNK_SIZE
+
+    def __init__(self, attrs=None, choices=(), chunk_size=None):
+        super(StreamingMixin, self).__init__(attrs, choices)
+        if chunk_size is not None:
+            self.chunk_size = chunk_size
+
+    def stream(self, name, value, attrs=None):
+        attrs = self.build_attrs(self.attrs, attrs)
+        if self.allow_multiple_selected:
+            attrs["multiple"] = True
+        yield '<select name="%s"%s>' % (conditional_escape(name), flatatt(attrs))
+        for chunk in iter_options(
+            self.choices, self.format_value(value), self.allow_multiple_selected, self.chunk_size
+        ):
+            yield chunk
+        yield "</select>"
+
+    def render(self, name, value, attrs=None, renderer=None):
+        return mark_safe("".join(self.stream(name, value, attrs)))
+
+
+class StreamingSelect(StreamingMixin, Select):
+    pass
+
+
+class StreamingSelectMultiple(StreamingMixin, SelectMultiple):
+    pass
@@ -13,5 +13,20 @@ def runtests():
     return execute_from_command_line(argv)
 
 
+def runbenchmarks(args):
+    import django
+
+    django.setup()
+
+    from django.core.management import call_command
+
+    from cached_modelforms.tests.benchmarks import main
+
+    call_command("migrate", run_syncdb=True, verbosity=0)
+    return main(args)
+
+
 if __name__ == "__main__":
+    if "--benchmark" in sys.argv[1:]:
+        sys.exit(runbenchmarks([x for x in sys.argv[1:] if x != "--benchmark"]))
     sys.exit(runtests())
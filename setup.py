@@ -24,7 +24,9 @@ setup(
     name="django-cached-modelforms",
     version=find_version("cached_modelforms", "__init__.py"),
     license="BSD License",
+    python_requires=">=3.5",
     install_requires=[
+        "asgiref",
         "six",
     ],
     requires=[
@@ -50,10 +52,11 @@ setup(
         "Natural Language :: English",
         "Operating System :: OS Independent",
         "Programming Language :: Python",
-        "Programming Language :: Python :: 2",
-        "Programming Language :: Python :: 2.7",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.4",
+        "Programming Language :: Python :: 3.5",
+        "Programming Language :: Python :: 3.6",
+        "Programming Language :: Python :: 3.7",
+        "Programming Language :: Python :: 3.8",
         "Topic :: Internet :: WWW/HTTP",
         "Topic :: Internet :: WWW/HTTP :: Dynamic Content",
         "Topic :: Software Development :: Libraries :: Python Modules",